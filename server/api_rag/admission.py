@@ -0,0 +1,223 @@
+"""
+Control de admisión para las llamadas a OpenAI (embeddings y chat).
+Cada AdmissionController limita las llamadas en vuelo y la cola de espera: si la cola
+está llena o la espera supera el máximo, la petición se rechaza al instante con
+Overloaded (503 + Retry-After en la API) en lugar de acumularse y disparar 429 en OpenAI.
+Los 429 y errores transitorios que igual lleguen se reintentan con backoff exponencial
+y jitter, respetando el Retry-After de OpenAI; durante la espera entre intentos el turno
+queda libre para otras peticiones.
+"""
+import asyncio
+import math
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager, nullcontext
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple, Type
+
+import numpy as np
+
+import telemetry
+
+# Esperas recientes usadas para los percentiles de get_stats
+WAIT_WINDOW = 1024
+
+
+class Overloaded(Exception):
+    """Capacidad agotada (cola llena, espera máxima o 429 persistente de OpenAI)"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, max_wait_s: float):
+        """
+        Args:
+            name: Etiqueta en estadísticas y métricas (embedding, chat)
+            max_concurrency: Llamadas en vuelo a la vez
+            max_queue: Peticiones esperando turno; la siguiente se rechaza sin esperar
+            max_wait_s: Espera máxima en la cola antes de rechazar
+        """
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait_s = max_wait_s
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._waits = deque(maxlen=WAIT_WINDOW)
+        # Duración media de una llamada (EWMA) para estimar Retry-After
+        self._hold_s = 0.0
+
+    def retry_after(self) -> int:
+        """Segundos sugeridos al cliente: tiempo estimado para vaciar la cola actual"""
+        estimate = self._hold_s * (self.queued + 1) / self.max_concurrency
+        return max(1, min(math.ceil(estimate), math.ceil(self.max_wait_s) or 1))
+
+    def check(self):
+        """Rechazo anticipado (p. ej. antes de abrir un stream) si la cola ya está llena"""
+        if self._semaphore.locked() and self.queued >= self.max_queue:
+            self._reject("queue_full")
+
+    def _reject(self, reason: str):
+        self.rejected += 1
+        telemetry.ADMISSION_REJECTED.inc(controller=self.name, reason=reason)
+        detail = "cola llena" if reason == "queue_full" else f"espera mayor a {self.max_wait_s:g}s"
+        raise Overloaded(f"Servicio saturado ({self.name}: {detail})", self.retry_after())
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Espera turno (acotado) y lo libera al salir del bloque"""
+        start = time.perf_counter()
+        if self._semaphore.locked():
+            if self.queued >= self.max_queue:
+                self._reject("queue_full")
+            self.queued += 1
+            telemetry.ADMISSION_QUEUE.set(self.queued, controller=self.name)
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.max_wait_s)
+            except asyncio.TimeoutError:
+                self.timed_out += 1
+                self._reject("max_wait")
+            finally:
+                self.queued -= 1
+                telemetry.ADMISSION_QUEUE.set(self.queued, controller=self.name)
+        else:
+            await self._semaphore.acquire()
+
+        acquired = time.perf_counter()
+        waited = acquired - start
+        self._waits.append(waited)
+        telemetry.ADMISSION_WAIT.observe(waited, controller=self.name)
+        self.admitted += 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+            held = time.perf_counter() - acquired
+            self._hold_s = held if not self._hold_s else 0.9 * self._hold_s + 0.1 * held
+
+    def get_stats(self) -> Dict[str, Any]:
+        waits_ms = np.asarray(self._waits) * 1000
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "max_wait_s": self.max_wait_s,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "wait_ms_p50": round(float(np.percentile(waits_ms, 50)), 3) if len(waits_ms) else None,
+            "wait_ms_p99": round(float(np.percentile(waits_ms, 99)), 3) if len(waits_ms) else None,
+            "avg_call_ms": round(self._hold_s * 1000, 3)
+        }
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Retry-After (segundos) de una respuesta de error de OpenAI, si lo trae"""
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _backoff_delay(
+    error: Exception,
+    attempt: int,
+    operation: str,
+    max_retries: int,
+    rate_limited: Type[Exception],
+    base_delay_s: float,
+    max_delay_s: float
+) -> float:
+    """
+    Espera antes del siguiente intento (jitter completo, respetando Retry-After)
+
+    Raises:
+        Overloaded: si se agotaron los reintentos por 429
+        El error original: si se agotaron los reintentos por otro error transitorio
+    """
+    retry_after = retry_after_seconds(error)
+    if attempt == max_retries:
+        if isinstance(error, rate_limited):
+            raise Overloaded(
+                f"OpenAI limitó la tasa de {operation} (429) tras {max_retries} reintentos",
+                math.ceil(retry_after or max_delay_s)
+            ) from error
+        raise error
+    delay = random.uniform(0, min(max_delay_s, base_delay_s * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, max_delay_s))
+    telemetry.OPENAI_RETRIES.inc(operation=operation, error=type(error).__name__)
+    return delay
+
+
+@asynccontextmanager
+async def admitted_call(
+    call: Callable[[], Awaitable[Any]],
+    operation: str,
+    admission: Optional[AdmissionController],
+    max_retries: int,
+    retryable: Tuple[Type[Exception], ...],
+    rate_limited: Type[Exception],
+    base_delay_s: float = 0.5,
+    max_delay_s: float = 8.0
+) -> AsyncIterator[Any]:
+    """
+    Ejecuta call() bajo admisión, con reintentos, y entrega la respuesta dentro del bloque
+
+    Cada intento toma su propio turno y lo suelta antes de esperar el backoff: una
+    llamada que espera reintentar no ocupa capacidad que otras peticiones podrían
+    usar. El turno del intento exitoso se mantiene mientras dura el bloque (un
+    stream se consume sin soltarlo). Los tipos de error se reciben como parámetro
+    para no importar el SDK de OpenAI en este módulo (main.py lo importa al arrancar).
+
+    Raises:
+        Overloaded: cola llena, espera máxima o 429 persistente tras los reintentos
+    """
+    slot = admission.slot if admission is not None else nullcontext
+    for attempt in range(max_retries + 1):
+        async with slot():
+            try:
+                response = await call()
+            except retryable as e:
+                error = e
+            else:
+                yield response
+                return
+        await asyncio.sleep(_backoff_delay(
+            error, attempt, operation, max_retries, rate_limited, base_delay_s, max_delay_s
+        ))
+
+
+async def call_with_retries(
+    call: Callable[[], Awaitable[Any]],
+    operation: str,
+    max_retries: int,
+    retryable: Tuple[Type[Exception], ...],
+    rate_limited: Type[Exception],
+    base_delay_s: float = 0.5,
+    max_delay_s: float = 8.0,
+    admission: Optional[AdmissionController] = None
+) -> Any:
+    """
+    Ejecuta call() reintentando errores transitorios con backoff exponencial y jitter completo
+
+    Con `admission`, cada intento corre bajo un turno del controlador (ver admitted_call).
+    Un error `rate_limited` (429) que persiste tras los reintentos se convierte en
+    Overloaded (503 para el cliente) en lugar de un error genérico.
+    """
+    async with admitted_call(
+        call, operation, admission, max_retries, retryable, rate_limited, base_delay_s, max_delay_s
+    ) as response:
+        return response
@@ -0,0 +1,161 @@
+"""
+Caché semántica de respuestas para ask_with_gpt.
+Una pregunta reutiliza la respuesta de otra ya contestada si sus embeddings tienen similitud
+coseno ≥ umbral y la recuperación devolvió exactamente el mismo conjunto de cliente_id
+(así la respuesta cacheada corresponde al mismo contexto). LRU + TTL, en memoria, y se vacía
+cuando cambia la versión del índice.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        ttl_seconds: float = 3600,
+        threshold: float = 0.95,
+        index_version: Any = None
+    ):
+        """
+        Args:
+            max_entries: Máximo de respuestas guardadas (0 = caché desactivada)
+            ttl_seconds: Vida de una respuesta (0 = sin expiración)
+            threshold: Similitud coseno mínima entre preguntas para reutilizar la respuesta
+            index_version: Versión del índice vectorial a la que corresponden las respuestas
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+
+        # Entradas agrupadas por conjunto de cliente_id: solo se compara dentro del grupo
+        self._entries: "OrderedDict[int, Tuple[FrozenSet[str], np.ndarray, float, Any]]" = OrderedDict()
+        self._by_context: Dict[FrozenSet[str], List[int]] = {}
+        self._next_id = 0
+        self.index_version = index_version
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def _unit(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - created_at > self.ttl_seconds
+
+    def _drop(self, entry_id: int):
+        context = self._entries.pop(entry_id)[0]
+        ids = self._by_context[context]
+        ids.remove(entry_id)
+        if not ids:
+            del self._by_context[context]
+
+    def invalidate(self, index_version: Any):
+        """Vacía la caché: el índice cambió y las respuestas guardadas pueden citar otro contexto"""
+        with self._lock:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._by_context.clear()
+            self.index_version = index_version
+
+    def get(
+        self,
+        embedding: List[float],
+        cliente_ids: Iterable[str],
+        index_version: Any
+    ) -> Optional[Any]:
+        """
+        Busca una respuesta para una pregunta semánticamente equivalente
+
+        Args:
+            embedding: Embedding de la pregunta
+            cliente_ids: cliente_id recuperados para la pregunta
+            index_version: Versión actual del índice vectorial
+
+        Returns:
+            La respuesta guardada o None
+        """
+        if not self.enabled:
+            return None
+        context = frozenset(cliente_ids)
+        query = self._unit(embedding)
+        now = time.time()
+
+        with self._lock:
+            if index_version != self.index_version:
+                self.misses += 1
+                return None
+
+            best_id, best_score = None, self.threshold
+            for entry_id in list(self._by_context.get(context, ())):
+                _, vector, created_at, _ = self._entries[entry_id]
+                if self._expired(created_at, now):
+                    self._drop(entry_id)
+                    continue
+                score = float(vector @ query)
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+
+            if best_id is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id][3]
+
+    def put(
+        self,
+        embedding: List[float],
+        cliente_ids: Iterable[str],
+        index_version: Any,
+        value: Any
+    ):
+        """Guarda la respuesta generada para el contexto recuperado"""
+        if not self.enabled:
+            return
+        context = frozenset(cliente_ids)
+        vector = self._unit(embedding)
+
+        with self._lock:
+            # Respuesta generada con un índice que ya cambió: no se guarda
+            if index_version != self.index_version:
+                return
+
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (context, vector, time.time(), value)
+            self._by_context.setdefault(context, []).append(entry_id)
+
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "threshold": self.threshold,
+                "index_version": self.index_version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
@@ -0,0 +1,549 @@
+#!/usr/bin/env python3
+"""
+Benchmarks de la API RAG contra el servidor fake de OpenAI (fake_openai.py)
+
+Casos:
+    indexing    Indexación completa de row_cards.jsonl y de un dataset sintético
+    cold_start  Import de main, construcción de RAGService con índice existente y primera /ask
+    ask         /ask p50/p95/p99 con distintos niveles de concurrencia
+    metrics     Throughput de /metrics/*
+    overload    Ráfaga de /ask por encima de la capacidad (admisión + 503) con /metrics en paralelo
+    quantization  Memoria del barrido, latencia y recall@k de int8 + re-puntuado vs búsqueda exacta
+
+Uso:
+    python benchmark.py --output bench.json
+    python benchmark.py --cases ask,metrics --concurrency 1,8,32 --chat-latency-ms 400
+    python benchmark.py --output bench_nueva.json --compare bench.json   # exit 1 si hay regresiones
+
+Todo se escribe en un directorio temporal; no toca rag_cartera/, rag_numpy/ ni rag_cache/.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+
+from fake_openai import FakeOpenAIServer
+
+CASES = ("indexing", "cold_start", "ask", "metrics", "overload", "quantization")
+
+ASK_QUESTIONS = [
+    "clientes con alto ingreso del sector público",
+    "mujeres mayores de 50 años con antigüedad laboral alta",
+    "jóvenes profesionales del sector privado",
+    "hombres de 30 a 40 años con ingreso medio",
+    "clientes con poca antigüedad laboral",
+    "perfil de clientes del sector público con ingreso bajo",
+]
+
+METRICS_ENDPOINTS = [
+    "/metrics/saldo?tipo=neto",
+    "/metrics/saldo?tipo=captaciones&group_by=SEGMENTACION_ESTRATEGICA",
+    "/metrics/aggregate?metric=TC_SALDO&group_by=PROVINCIA_DEFAULT",
+    "/metrics/saldo_por_producto",
+    "/metrics/summary",
+    "/metrics/dimensions",
+]
+
+ROW_CARDS = Path(__file__).parent / "data" / "row_cards.jsonl"
+
+
+def _latency_stats(latencies_s: List[float], elapsed_s: float, errors: int) -> Dict[str, Any]:
+    """Percentiles en ms y throughput de una serie de peticiones"""
+    ms = np.asarray(latencies_s) * 1000
+    return {
+        "requests": len(latencies_s),
+        "errors": errors,
+        "elapsed_s": round(elapsed_s, 3),
+        "rps": round(len(latencies_s) / elapsed_s, 2) if elapsed_s else None,
+        "mean_ms": round(float(ms.mean()), 3) if len(ms) else None,
+        "p50_ms": round(float(np.percentile(ms, 50)), 3) if len(ms) else None,
+        "p95_ms": round(float(np.percentile(ms, 95)), 3) if len(ms) else None,
+        "p99_ms": round(float(np.percentile(ms, 99)), 3) if len(ms) else None,
+    }
+
+
+async def _run_load(client, urls: List[str], concurrency: int, statuses: Dict[int, int] = None) -> Dict[str, Any]:
+    """Lanza las URLs con `concurrency` peticiones en vuelo y mide cada una (solo las 200 en latencia)"""
+    pending = iter(urls)
+    latencies: List[float] = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        for url in pending:
+            start = time.perf_counter()
+            response = await client.get(url)
+            if statuses is not None:
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if response.status_code != 200:
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return _latency_stats(latencies, time.perf_counter() - start, errors)
+
+
+def _asgi_client(app):
+    import httpx
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+
+
+# ===== DATASETS =====
+
+def _format_usd(value: float) -> str:
+    return f"{int(value):,}".replace(",", ".")
+
+
+def write_synthetic_cards(path: Path, n_cards: int, seed: int = 42) -> Path:
+    """
+    Dataset sintético con el formato de row_cards.jsonl: perfiles reales perturbados
+    (edad, ingreso, antigüedad) con cliente_id y resumen nuevos
+    """
+    base = [json.loads(line) for line in ROW_CARDS.open(encoding="utf-8") if line.strip()]
+    rng = random.Random(seed)
+    with path.open("w", encoding="utf-8") as f:
+        for i in range(n_cards):
+            perfil = dict(rng.choice(base)["perfil"])
+            perfil["edad"] = float(min(90, max(18, perfil.get("edad", 40) + rng.randint(-5, 5))))
+            perfil["ingreso"] = round(perfil.get("ingreso", 1000) * rng.uniform(0.7, 1.3), 4)
+            perfil["antiguedad_laboral"] = float(max(0, perfil.get("antiguedad_laboral", 12) + rng.randint(-12, 12)))
+            sector = "sector público" if perfil.get("sector_publico_flag") else "sector privado"
+            card = {
+                "cliente_id": f"syn_{i:06d}",
+                "perfil": perfil,
+                "resumen": (
+                    f"sexo {perfil.get('sexo', 'UNKNOWN')}, {int(perfil['edad'])} años, "
+                    f"ingreso ≈ {_format_usd(perfil['ingreso'])} USD/mes, "
+                    f"{int(perfil['antiguedad_laboral'])} meses de antigüedad, {sector}"
+                ),
+                "fuente": "sintetico",
+                "data_quality": []
+            }
+            f.write(json.dumps(card, ensure_ascii=False) + "\n")
+    return path
+
+
+def _new_service(work_dir: Path, base_url: str, backend: str, data_dir: Path = None):
+    """RAGService aislado en work_dir (índice, caché y datos propios)"""
+    from rag_service import RAGService
+    return RAGService(
+        data_dir=str(data_dir or ROW_CARDS.parent),
+        chroma_dir=str(work_dir / "chroma"),
+        cache_dir=str(work_dir / "cache"),
+        numpy_dir=str(work_dir / "numpy"),
+        openai_api_key="fake",
+        openai_base_url=base_url,
+        vector_backend=backend
+    )
+
+
+def _close(rag):
+    asyncio.run(rag.aclose())
+
+
+# ===== CASOS =====
+
+def bench_indexing(args, fake: FakeOpenAIServer, root: Path) -> Dict[str, Any]:
+    """Indexación completa (índice y caché de embeddings vacíos) + resincronización sin cambios"""
+    datasets = {"row_cards": ROW_CARDS}
+    if args.synthetic_cards:
+        datasets[f"synthetic_{args.synthetic_cards}"] = write_synthetic_cards(
+            root / "synthetic.jsonl", args.synthetic_cards
+        )
+
+    results = {}
+    for name, jsonl_path in datasets.items():
+        work_dir = root / f"indexing_{name}"
+        data_dir = work_dir / "data"
+        data_dir.mkdir(parents=True)
+        # JSONL vacío: el constructor no indexa nada y la sincronización de abajo se mide sola
+        (data_dir / "row_cards.jsonl").touch()
+        rag = _new_service(work_dir, fake.base_url, args.backend, data_dir)
+
+        calls_before = fake.calls["embeddings"]
+        start = time.perf_counter()
+        report = rag.sync_index(jsonl_path)
+        elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        rag.sync_index(jsonl_path)
+        resync = time.perf_counter() - start
+
+        results[name] = {
+            "documents": report["added"],
+            "elapsed_s": round(elapsed, 3),
+            "docs_per_s": round(report["added"] / elapsed, 2) if elapsed else None,
+            "embedding_calls": fake.calls["embeddings"] - calls_before,
+            "resync_unchanged_s": round(resync, 3),
+            "pipeline": report["throughput"]
+        }
+        _close(rag)
+        print(f"✓ indexing/{name}: {report['added']} docs en {elapsed:.2f} s")
+    return results
+
+
+def bench_cold_start(args, fake: FakeOpenAIServer, root: Path) -> Dict[str, Any]:
+    """Proceso nuevo: import de main + RAGService sobre un índice ya construido + primera /ask"""
+    work_dir = root / "cold_start"
+    if not (work_dir / "cache").exists():
+        _close(_new_service(work_dir, fake.base_url, args.backend))
+
+    env = dict(os.environ, RAG_OPENAI_BASE_URL=fake.base_url, AI_INTEGRATIONS_OPENAI_API_KEY="fake")
+    output = subprocess.run(
+        [sys.executable, __file__, "--cold-start-child", str(work_dir), "--backend", args.backend],
+        cwd=Path(__file__).parent,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    print(f"✓ cold_start: {result['total_s']:.2f} s hasta la primera respuesta")
+    return result
+
+
+def _cold_start_child(work_dir: Path, backend: str):
+    """Se ejecuta en el proceso hijo de bench_cold_start; imprime una línea JSON"""
+    start = time.perf_counter()
+    import main
+    imported = time.perf_counter()
+
+    main.rag_service = _new_service(work_dir, os.environ["RAG_OPENAI_BASE_URL"], backend)
+    initialized = time.perf_counter()
+
+    async def first_ask():
+        async with _asgi_client(main.app) as client:
+            response = await client.get("/ask", params={"q": ASK_QUESTIONS[0], "router": "false"})
+            response.raise_for_status()
+
+    asyncio.run(first_ask())
+    done = time.perf_counter()
+    print(json.dumps({
+        "import_s": round(imported - start, 3),
+        "service_init_s": round(initialized - imported, 3),
+        "first_ask_s": round(done - initialized, 3),
+        "total_s": round(done - start, 3)
+    }))
+
+
+def bench_ask(args, fake: FakeOpenAIServer, root: Path) -> Dict[str, Any]:
+    """/ask en proceso (ASGI) con preguntas distintas: sin caché de respuestas ni coalescing"""
+    import main
+    main.rag_service = _new_service(root / "ask", fake.base_url, args.backend)
+
+    async def run() -> Dict[str, Any]:
+        results = {}
+        async with _asgi_client(main.app) as client:
+            for concurrency in args.concurrency:
+                n = max(args.ask_requests, concurrency)
+                urls = [
+                    f"/ask?router=false&q={ASK_QUESTIONS[i % len(ASK_QUESTIONS)]} {concurrency}-{i}"
+                    for i in range(n)
+                ]
+                # Calentamiento (conexiones del pool, páginas del índice)
+                await _run_load(client, urls[:concurrency], concurrency)
+                results[f"c{concurrency}"] = await _run_load(client, urls, concurrency)
+                stats = results[f"c{concurrency}"]
+                print(f"✓ ask c={concurrency}: p50 {stats['p50_ms']} ms, p99 {stats['p99_ms']} ms, {stats['rps']} req/s")
+        await main.rag_service.aclose()
+        return results
+
+    try:
+        return asyncio.run(run())
+    finally:
+        main.rag_service = None
+
+
+def bench_metrics(args, fake: FakeOpenAIServer, root: Path) -> Dict[str, Any]:
+    """Throughput de /metrics/* en proceso (ASGI)"""
+    import main
+    main.get_metrics_service()
+
+    async def run() -> Dict[str, Any]:
+        results = {}
+        async with _asgi_client(main.app) as client:
+            for endpoint in METRICS_ENDPOINTS:
+                await _run_load(client, [endpoint] * args.metrics_concurrency, args.metrics_concurrency)
+                stats = await _run_load(client, [endpoint] * args.metrics_requests, args.metrics_concurrency)
+                results[endpoint] = stats
+                print(f"✓ {endpoint}: {stats['rps']} req/s, p99 {stats['p99_ms']} ms")
+        return results
+
+    return asyncio.run(run())
+
+
+def bench_overload(args, fake: FakeOpenAIServer, root: Path) -> Dict[str, Any]:
+    """
+    /ask con más concurrencia que RAG_CHAT_CONCURRENCY + RAG_ADMISSION_QUEUE, mientras
+    /metrics/summary se consulta en paralelo: las /ask admitidas mantienen su latencia,
+    el exceso recibe 503 al instante y /metrics no se entera de la ráfaga
+    """
+    import main
+    limits = {"RAG_CHAT_CONCURRENCY": "8", "RAG_ADMISSION_QUEUE": "16", "RAG_ADMISSION_MAX_WAIT_S": "5"}
+    previous = {name: os.environ.get(name) for name in limits}
+    os.environ.update(limits)
+    try:
+        main.rag_service = _new_service(root / "overload", fake.base_url, args.backend)
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    main.get_metrics_service()
+
+    async def run() -> Dict[str, Any]:
+        async with _asgi_client(main.app) as client:
+            metrics_alone = await _run_load(client, ["/metrics/summary"] * args.metrics_requests, args.metrics_concurrency)
+            statuses: Dict[int, int] = {}
+            urls = [f"/ask?router=false&q={ASK_QUESTIONS[i % len(ASK_QUESTIONS)]} burst-{i}" for i in range(args.ask_requests)]
+            ask, metrics_burst = await asyncio.gather(
+                _run_load(client, urls, args.overload_concurrency, statuses),
+                _run_load(client, ["/metrics/summary"] * args.metrics_requests, args.metrics_concurrency)
+            )
+            admission = main.rag_service.admission_stats()["chat"]
+        await main.rag_service.aclose()
+        return {
+            "ask_admitted": ask,
+            "ask_statuses": {str(code): n for code, n in sorted(statuses.items())},
+            "admission": admission,
+            "metrics_alone": metrics_alone,
+            "metrics_during_burst": metrics_burst
+        }
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        main.rag_service = None
+    print(
+        f"✓ overload c={args.overload_concurrency}: {results['ask_statuses']}, p99 admitidas "
+        f"{results['ask_admitted']['p99_ms']} ms; /metrics p99 {results['metrics_alone']['p99_ms']} → "
+        f"{results['metrics_during_burst']['p99_ms']} ms"
+    )
+    return results
+
+
+def clustered_vectors(n: int, dim: int, rng: np.random.Generator, n_clusters: int = 256) -> np.ndarray:
+    """Vectores unitarios agrupados alrededor de centros (vecinos cercanos no triviales)"""
+    centers = rng.standard_normal((n_clusters, dim), dtype=np.float32)
+    matrix = centers[rng.integers(0, n_clusters, n)]
+    matrix += rng.standard_normal((n, dim), dtype=np.float32) * 0.8
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix
+
+
+def bench_quantization(args, fake: FakeOpenAIServer, root: Path) -> Dict[str, Any]:
+    """
+    NumpyVectorStore con barrido float32 exacto vs int8 + re-puntuado, sobre el mismo índice
+
+    Vectores sintéticos de 1536 dimensiones (no hace falta OpenAI). recall es la fracción
+    de los top_k exactos que también devuelve el modo cuantizado.
+    """
+    from vector_store import NumpyVectorStore
+
+    rng = np.random.default_rng(42)
+    n, dim, k = args.quant_vectors, 1536, 10
+    matrix = clustered_vectors(n, dim, rng)
+    queries = matrix[rng.choice(n, args.quant_queries, replace=False)]
+    queries = queries + rng.standard_normal(queries.shape, dtype=np.float32) * 0.02
+
+    store_dir = root / "quantization"
+    builder = NumpyVectorStore(store_dir)
+    builder.upsert([f"v{i:07d}" for i in range(n)], [""] * n, matrix, [{}] * n)
+    builder.flush()
+    del builder, matrix
+
+    results, exact_ids = {}, None
+    for quantization in ("none", "int8"):
+        start = time.perf_counter()
+        store = NumpyVectorStore(store_dir, quantization=quantization, rescore_factor=args.rescore_factor)
+        load_s = time.perf_counter() - start
+
+        store.query(queries[:1].tolist(), k)
+        latencies, ids = [], []
+        bench_start = time.perf_counter()
+        for query in queries:
+            start = time.perf_counter()
+            matches = store.query([query.tolist()], k)[0]
+            latencies.append(time.perf_counter() - start)
+            ids.append({m["cliente_id"] for m in matches})
+        stats = _latency_stats(latencies, time.perf_counter() - bench_start, 0)
+
+        start = time.perf_counter()
+        store.query(queries.tolist(), k)
+        batch_s = time.perf_counter() - start
+
+        if exact_ids is None:
+            exact_ids = ids
+        bytes_per_vector = store.scan_bytes() / n
+        results[quantization] = {
+            **stats,
+            "load_s": round(load_s, 3),
+            "batch_ms": round(batch_s * 1000, 3),
+            "bytes_per_vector": round(bytes_per_vector, 1),
+            "memory_mb_per_million": round(bytes_per_vector * 1_000_000 / 2**20, 1),
+            "recall": round(float(np.mean([len(a & b) / k for a, b in zip(ids, exact_ids)])), 4),
+        }
+        print(
+            f"✓ {quantization}: {results[quantization]['memory_mb_per_million']} MB/M vectores, "
+            f"p50 {stats['p50_ms']} ms, recall@{k} {results[quantization]['recall']}"
+        )
+
+    results["meta"] = {"vectors": n, "dimensions": dim, "top_k": k, "queries": args.quant_queries,
+                       "rescore_factor": args.rescore_factor}
+    results["memory_reduction"] = round(results["none"]["bytes_per_vector"] / results["int8"]["bytes_per_vector"], 2)
+    results["speedup_p50"] = round(results["none"]["p50_ms"] / results["int8"]["p50_ms"], 2)
+    return results
+
+
+# ===== COMPARACIÓN =====
+
+# Métricas que se comparan entre corridas y si mayor es mejor
+_COMPARED = {
+    "p50_ms": False, "p95_ms": False, "p99_ms": False,
+    "elapsed_s": False, "total_s": False,
+    "rps": True, "docs_per_s": True, "recall": True,
+}
+
+
+def _flatten(tree: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in tree.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(_flatten(value, path))
+        elif key in _COMPARED and isinstance(value, (int, float)):
+            flat[path] = value
+    return flat
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Métricas que empeoraron más de `tolerance` (fracción) respecto de baseline"""
+    regressions = []
+    now, before = _flatten(current["results"]), _flatten(baseline["results"])
+    for path, value in now.items():
+        old = before.get(path)
+        if not old:
+            continue
+        higher_is_better = _COMPARED[path.rsplit(".", 1)[-1]]
+        change = (value - old) / old
+        if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+            regressions.append(f"{path}: {old} → {value} ({change:+.0%})")
+    return regressions
+
+
+# ===== CLI =====
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).parent, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de la API RAG (OpenAI fake)")
+    parser.add_argument("--cases", default=",".join(CASES), help=f"Casos separados por coma ({', '.join(CASES)})")
+    parser.add_argument("--output", default="benchmark_results.json", help="Archivo JSON de resultados")
+    parser.add_argument("--compare", default=None, help="JSON de una corrida anterior: reporta regresiones")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Empeoramiento tolerado al comparar (0.2 = 20%%)")
+    parser.add_argument("--backend", default=os.getenv("RAG_VECTOR_BACKEND", "chroma"), help="chroma o numpy")
+    parser.add_argument("--synthetic-cards", type=int, default=100_000, help="Tamaño del dataset sintético (0 = omitir)")
+    parser.add_argument("--concurrency", default="1,8,32", help="Niveles de concurrencia para /ask")
+    parser.add_argument("--ask-requests", type=int, default=200, help="Peticiones /ask por nivel")
+    parser.add_argument("--metrics-requests", type=int, default=2000, help="Peticiones por endpoint de métricas")
+    parser.add_argument("--metrics-concurrency", type=int, default=16)
+    parser.add_argument("--embedding-latency-ms", type=float, default=20.0, help="Latencia fake de embeddings")
+    parser.add_argument("--chat-latency-ms", type=float, default=300.0, help="Latencia fake de GPT-4 (hasta el primer token)")
+    parser.add_argument("--token-latency-ms", type=float, default=0.0, help="Latencia fake entre tokens")
+    parser.add_argument("--overload-concurrency", type=int, default=64, help="/ask en vuelo en el caso overload")
+    parser.add_argument("--quant-vectors", type=int, default=100_000, help="Vectores del caso quantization")
+    parser.add_argument("--quant-queries", type=int, default=100, help="Consultas del caso quantization")
+    parser.add_argument("--rescore-factor", type=int, default=int(os.getenv("RAG_RESCORE_FACTOR", "4")),
+                        help="Candidatos re-puntuados = top_k · factor")
+    parser.add_argument("--cold-start-child", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cold_start_child:
+        _cold_start_child(Path(args.cold_start_child), args.backend)
+        return
+
+    cases = [c.strip() for c in args.cases.split(",") if c.strip()]
+    unknown = set(cases) - set(CASES)
+    if unknown:
+        parser.error(f"Casos desconocidos: {', '.join(sorted(unknown))}")
+    args.concurrency = [int(c) for c in args.concurrency.split(",")]
+
+    # Sin caché de respuestas: cada /ask mide recuperación + GPT-4
+    os.environ["RAG_ANSWER_CACHE_SIZE"] = "0"
+    os.environ.setdefault("DATA_RELOAD_INTERVAL", "0")
+
+    latency = {
+        "embedding_latency_ms": args.embedding_latency_ms,
+        "chat_latency_ms": args.chat_latency_ms,
+        "token_latency_ms": args.token_latency_ms
+    }
+    runners = {
+        "indexing": bench_indexing,
+        "cold_start": bench_cold_start,
+        "ask": bench_ask,
+        "metrics": bench_metrics,
+        "overload": bench_overload,
+        "quantization": bench_quantization,
+    }
+
+    root = Path(tempfile.mkdtemp(prefix="rag_bench_"))
+    results: Dict[str, Any] = {}
+    try:
+        with FakeOpenAIServer(**latency) as fake:
+            for case in cases:
+                print(f"→ Benchmark {case}...")
+                results[case] = runners[case](args, fake, root)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    output = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "backend": args.backend,
+            "fake_openai": latency,
+            "cases": cases
+        },
+        "results": results
+    }
+    Path(args.output).write_text(json.dumps(output, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"✓ Resultados en {args.output}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        regressions = compare(output, baseline, args.tolerance)
+        for line in regressions:
+            print(f"⚠ Regresión: {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"✓ Sin regresiones respecto de {args.compare} (tolerancia {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Comandos de administración para la API RAG de Gemelo 1.1 Premium
+
+Uso:
+    python cli.py reindex                        # Reindexación incremental de row_cards.jsonl
+    python cli.py reindex --jsonl extracto.jsonl --concurrency 8 --rpm 3000
+    python cli.py history-ingest Data_2025-09.csv --period 2025-09   # Backfill del histórico mensual
+"""
+import argparse
+import json
+
+
+def cmd_reindex(args):
+    """Sincroniza ChromaDB con el JSONL y muestra el reporte (incluye throughput)"""
+    from rag_service import RAGService
+
+    # sync_index se ejecuta explícitamente abajo; se evita el sync del constructor
+    rag = RAGService(sync_on_startup=False)
+    report = rag.sync_index(
+        jsonl_path=args.jsonl,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        requests_per_minute=args.rpm,
+        max_retries=args.max_retries,
+        checkpoint_every=args.checkpoint_every
+    )
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+def cmd_history_ingest(args):
+    """Ingiere extractos anteriores; los ya ingeridos (mismo contenido) se omiten"""
+    from metrics_service import MetricsService
+
+    if args.period and len(args.csv) > 1:
+        raise SystemExit("--period solo se admite con un extracto")
+    metrics = MetricsService()
+    for csv_path in args.csv:
+        entry = metrics.ingest_history(csv_path, period=args.period)
+        if entry is None:
+            print(f"→ {csv_path}: ya estaba en el histórico")
+    print(json.dumps(metrics.history.get_stats(), indent=2, ensure_ascii=False))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Administración de la API RAG")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    reindex = subparsers.add_parser("reindex", help="Reindexación incremental por hash de contenido")
+    reindex.add_argument("--jsonl", default=None, help="JSONL a indexar (default: data/row_cards.jsonl)")
+    reindex.add_argument("--batch-size", type=int, default=None, help="Documentos por llamada de embeddings")
+    reindex.add_argument("--concurrency", type=int, default=None, help="Lotes embebiéndose en paralelo")
+    reindex.add_argument("--rpm", type=int, default=None, help="Límite de llamadas de embeddings por minuto (0 = sin límite)")
+    reindex.add_argument("--max-retries", type=int, default=None, help="Reintentos por lote ante errores transitorios")
+    reindex.add_argument("--checkpoint-every", type=int, default=None, help="Lotes entre checkpoints")
+    reindex.set_defaults(func=cmd_reindex)
+
+    history = subparsers.add_parser("history-ingest", help="Agrega extractos de Data.csv al histórico mensual (una vez cada uno)")
+    history.add_argument("csv", nargs="+", help="Extractos a ingerir (en orden cronológico)")
+    history.add_argument("--period", default=None, help="Periodo YYYY-MM (solo con un extracto; default: según el nombre o la fecha del archivo)")
+    history.set_defaults(func=cmd_history_ingest)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+Almacén en memoria de los row_cards para consultas estructuradas sin embeddings.
+Los campos de `perfil` viven en columnas tipadas de NumPy y el cliente_id en un índice
+hash (id → fila): /clients/{id} es O(1) y /clients filtra con máscaras booleanas
+vectorizadas y pagina con cursores sobre órdenes precalculados. No depende de OpenAI.
+"""
+import base64
+import binascii
+import json
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from data_snapshots import content_version
+from vector_store import metadata_mask
+
+# Columnas de perfil (metadata_mask usa edad, ingreso, sector_publico y sexo)
+CLIENT_DTYPE = np.dtype([
+    ("edad", "f4"),
+    ("ingreso", "f8"),
+    ("antiguedad_laboral", "f4"),
+    ("sector_publico", "f4"),
+    ("sexo", "U10"),
+])
+
+# Campos por los que se puede ordenar (prefijo "-" = descendente; empates por cliente_id)
+SORT_FIELDS = ("cliente_id", "edad", "ingreso", "antiguedad_laboral")
+
+MAX_PAGE_SIZE = 500
+
+
+def _number(value: Any) -> float:
+    """Valor numérico de perfil (NaN si falta o es nulo)"""
+    return float(value) if value is not None else float("nan")
+
+
+def encode_cursor(sort: str, value: Optional[float], cliente_id: str) -> str:
+    """Cursor opaco (base64 urlsafe) con la última fila de la página"""
+    payload = json.dumps({"s": sort, "v": value, "id": cliente_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> Dict[str, Any]:
+    """
+    Raises:
+        ValueError: si el cursor está mal formado o pertenece a otro orden
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(payload["id"], str):
+            raise TypeError
+    except (binascii.Error, UnicodeError, json.JSONDecodeError, KeyError, TypeError):
+        raise ValueError("Cursor inválido")
+    if payload.get("s") != sort:
+        raise ValueError(f"El cursor corresponde a sort={payload.get('s')}, no a sort={sort}")
+    return payload
+
+
+class SortOrder:
+    """Permutación de filas para un orden + claves ordenadas para ubicar cursores con searchsorted"""
+
+    def __init__(self, order: np.ndarray, keys: np.ndarray, ids: np.ndarray):
+        self.order = order
+        self.keys = keys
+        self.ids = ids
+
+
+class ClientTable:
+    """Versión inmutable de row_cards.jsonl (se reemplaza completa al recargar)"""
+
+    def __init__(self, jsonl_path: Path, version: Optional[str] = None):
+        self.version = version
+        with open(jsonl_path, "rb") as f:
+            lines = [line for line in f if line.strip()]
+
+        n = len(lines)
+        ids: List[str] = []
+        self.columns = np.zeros(n, dtype=CLIENT_DTYPE)
+        for i, line in enumerate(lines):
+            card = json.loads(line)
+            perfil = card.get("perfil", {})
+            ids.append(card["cliente_id"])
+            self.columns[i] = (
+                _number(perfil.get("edad")),
+                _number(perfil.get("ingreso")),
+                _number(perfil.get("antiguedad_laboral")),
+                _number(perfil.get("sector_publico_flag")),
+                perfil.get("sexo") or "UNKNOWN"
+            )
+
+        self.ids = np.array(ids, dtype=str)
+        self.id_index: Dict[str, int] = {cliente_id: i for i, cliente_id in enumerate(ids)}
+        # Tarjetas originales en un solo buffer (offsets por fila): se decodifican solo las devueltas
+        self._raw = b"".join(lines)
+        self._offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum([len(line) for line in lines], out=self._offsets[1:])
+        # Rango de cada fila en orden de cliente_id (desempate y orden por id)
+        self._id_order = np.argsort(self.ids, kind="stable")
+        self._id_rank = np.empty(n, dtype=np.float64)
+        self._id_rank[self._id_order] = np.arange(n)
+        self._sorted_ids = self.ids[self._id_order]
+        self._orders: Dict[str, SortOrder] = {}
+        self._orders_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def card(self, row: int) -> Dict[str, Any]:
+        return json.loads(self._raw[self._offsets[row]:self._offsets[row + 1]])
+
+    def sort_order(self, sort: str) -> SortOrder:
+        """Orden precalculado (se construye en el primer uso y se reutiliza)"""
+        sort_order = self._orders.get(sort)
+        if sort_order is None:
+            with self._orders_lock:
+                sort_order = self._orders.get(sort)
+                if sort_order is None:
+                    field = sort.lstrip("-")
+                    keys = self._id_rank if field == "cliente_id" else self.columns[field].astype(np.float64)
+                    if sort.startswith("-"):
+                        keys = -keys
+                    # lexsort: última clave = principal; NaN queda al final en ambos sentidos
+                    order = np.lexsort((self._id_rank, keys))
+                    sort_order = SortOrder(order, keys[order], self.ids[order])
+                    self._orders[sort] = sort_order
+        return sort_order
+
+    def sort_value(self, sort: str, row: int) -> Optional[float]:
+        field = sort.lstrip("-")
+        return None if field == "cliente_id" else float(self.columns[field][row])
+
+    def cursor_key(self, sort: str, cursor: Dict[str, Any]) -> float:
+        """Clave de orden del cursor (si su cliente_id ya no existe, se ubica entre vecinos)"""
+        if sort.lstrip("-") == "cliente_id":
+            position = int(np.searchsorted(self._sorted_ids, cursor["id"], side="left"))
+            exists = position < len(self) and self._sorted_ids[position] == cursor["id"]
+            key = float(position) if exists else position - 0.5
+        else:
+            if cursor.get("v") is not None and not isinstance(cursor["v"], (int, float)):
+                raise ValueError("Cursor inválido")
+            key = _number(cursor.get("v"))
+        return -key if sort.startswith("-") else key
+
+    def start_after(self, sort_order: SortOrder, key: float, cliente_id: str) -> int:
+        """Posición en el orden de la primera fila posterior al cursor (keyset, O(log n))"""
+        lo = int(np.searchsorted(sort_order.keys, key, side="left"))
+        hi = int(np.searchsorted(sort_order.keys, key, side="right"))
+        return lo + int(np.searchsorted(sort_order.ids[lo:hi], cliente_id, side="right"))
+
+
+class ClientStore:
+    def __init__(self, data_dir: str = "data"):
+        self.data_dir = Path(__file__).parent / data_dir
+        self._table = ClientTable(self.jsonl_path, version=content_version(self.data_paths()))
+
+    @property
+    def jsonl_path(self) -> Path:
+        return self.data_dir / "row_cards.jsonl"
+
+    @property
+    def table(self) -> ClientTable:
+        """Tabla activa (referencia atómica)"""
+        return self._table
+
+    def data_paths(self) -> List[Path]:
+        return [self.jsonl_path]
+
+    def reload(self, version: str = None):
+        """Carga la tabla nueva en paralelo y la activa; los órdenes ya usados se reconstruyen antes del intercambio"""
+        table = ClientTable(self.jsonl_path, version=version)
+        for sort in list(self._table._orders):
+            table.sort_order(sort)
+        self._table = table
+
+    def get(self, cliente_id: str) -> Optional[Dict[str, Any]]:
+        """Row_card completo por cliente_id (None si no existe)"""
+        table = self._table
+        row = table.id_index.get(cliente_id)
+        return table.card(row) if row is not None else None
+
+    def query(
+        self,
+        filters: Optional[Dict[str, Any]] = None,
+        sort: str = "cliente_id",
+        limit: int = 50,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Lista paginada de clientes que cumplen los filtros
+
+        Args:
+            filters: Filtros normalizados (build_filters)
+            sort: Campo de SORT_FIELDS, con "-" para descendente
+            limit: Tamaño de página (1..MAX_PAGE_SIZE)
+            cursor: next_cursor de la página anterior (mismo sort)
+
+        Returns:
+            Dict con clients, count, total (filas que cumplen los filtros), next_cursor, sort y filters
+
+        Raises:
+            ValueError: si sort, limit o el cursor son inválidos
+        """
+        if sort.lstrip("-") not in SORT_FIELDS:
+            raise ValueError(f"sort inválido: {sort}. Opciones: {', '.join(SORT_FIELDS)} (prefijo '-' = descendente)")
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError(f"limit debe estar entre 1 y {MAX_PAGE_SIZE}")
+
+        table = self._table
+        sort_order = table.sort_order(sort)
+        start = 0
+        if cursor:
+            position = decode_cursor(cursor, sort)
+            start = table.start_after(sort_order, table.cursor_key(sort, position), position["id"])
+
+        mask = metadata_mask(table.columns, filters)
+        rows = sort_order.order[start:]
+        if mask is not None:
+            rows = rows[mask[rows]]
+        page = rows[:limit]
+
+        next_cursor = None
+        if len(rows) > limit:
+            last = int(page[-1])
+            next_cursor = encode_cursor(sort, table.sort_value(sort, last), str(table.ids[last]))
+
+        return {
+            "clients": [table.card(int(row)) for row in page],
+            "count": len(page),
+            "total": int(mask.sum()) if mask is not None else len(table),
+            "next_cursor": next_cursor,
+            "sort": sort,
+            "filters": filters or {}
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        table = self._table
+        return {
+            "clients": len(table),
+            "version": table.version,
+            "sorts_cached": sorted(table._orders),
+            "memory_bytes": int(
+                table.columns.nbytes + table.ids.nbytes + len(table._raw) + table._offsets.nbytes
+            )
+        }
@@ -0,0 +1,205 @@
+"""
+Construcción del contexto que se envía a GPT-4.
+1. Deduplicación: tarjetas con el mismo texto se agrupan en una sola entrada (con todos sus
+   cliente_id) y un cliente_id repetido se ignora. Los resúmenes salen de una plantilla, así
+   que clientes distintos tienen cosenos altísimos: descartar por similitud es opcional
+   (RAG_DEDUP_THRESHOLD) y cada tarjeta descartada se reporta.
+2. MMR (maximal marginal relevance): reordena por relevancia a la pregunta penalizando la
+   redundancia con lo ya elegido.
+3. Empaquetado hasta un presupuesto de tokens medido con el tokenizer local (tiktoken).
+"""
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Tokenizer de gpt-4o; el import es perezoso y opcional (ver count_tokens)
+TOKENIZER_ENCODING = "o200k_base"
+
+# Tokens que agrega el formato de chat por mensaje y por respuesta (aprox. de OpenAI)
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+
+_encoder = None
+_encoder_loaded = False
+
+
+def _get_encoder():
+    global _encoder, _encoder_loaded
+    if not _encoder_loaded:
+        _encoder_loaded = True
+        try:
+            import tiktoken
+            _encoder = tiktoken.get_encoding(TOKENIZER_ENCODING)
+        except Exception as e:
+            print(f"⚠ tiktoken no disponible ({e}); los tokens se estiman por longitud")
+    return _encoder
+
+
+def count_tokens(text: str) -> int:
+    """Tokens de gpt-4o (sin tiktoken: ~4 caracteres por token)"""
+    encoder = _get_encoder()
+    if encoder is None:
+        return (len(text) + 3) // 4
+    return len(encoder.encode(text))
+
+
+def count_message_tokens(messages: List[Dict[str, str]]) -> int:
+    """Tokens de prompt de una lista de mensajes de chat"""
+    return sum(TOKENS_PER_MESSAGE + count_tokens(m["content"]) for m in messages) + TOKENS_PER_REPLY
+
+
+def format_card(match: Dict[str, Any]) -> str:
+    """Una entrada del contexto; las tarjetas agrupadas listan todos sus cliente_id"""
+    ids = [match["cliente_id"]] + match.get("duplicados", [])
+    label = f"Cliente {ids[0]}" if len(ids) == 1 else "Clientes " + ", ".join(ids)
+    return f"{label}: {match['resumen']}"
+
+
+class ContextBuilder:
+    def __init__(
+        self,
+        token_budget: int = None,
+        mmr_lambda: float = None,
+        dedup_threshold: float = None
+    ):
+        """
+        Args:
+            token_budget: Máximo de tokens del prompt completo (sistema + contexto + pregunta)
+            mmr_lambda: Peso de la relevancia frente a la diversidad (1 = solo relevancia)
+            dedup_threshold: Coseno a partir del cual una tarjeta se descarta por casi idéntica
+                a otra ya elegida (0 = desactivado: solo se agrupa texto idéntico)
+        """
+        self.token_budget = token_budget or int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "1200"))
+        self.mmr_lambda = mmr_lambda if mmr_lambda is not None else float(os.getenv("RAG_MMR_LAMBDA", "0.7"))
+        if dedup_threshold is None:
+            dedup_threshold = float(os.getenv("RAG_DEDUP_THRESHOLD", "0"))
+        self.dedup_threshold = dedup_threshold
+
+    def _deduplicate(
+        self,
+        matches: List[Dict[str, Any]],
+        embeddings: Dict[str, np.ndarray]
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Agrupa textos idénticos, ignora cliente_id repetidos y, con dedup_threshold,
+        descarta casi idénticos
+
+        Returns:
+            (tarjetas, descartadas [{cliente_id, similar_to, cosine}])
+        """
+        kept: List[Dict[str, Any]] = []
+        by_text: Dict[str, Dict[str, Any]] = {}
+        seen_ids = set()
+        kept_ids: List[str] = []
+        kept_vectors: List[np.ndarray] = []
+        dropped: List[Dict[str, Any]] = []
+
+        for match in matches:
+            cliente_id = match["cliente_id"]
+            if cliente_id in seen_ids:
+                continue
+            seen_ids.add(cliente_id)
+
+            text = " ".join(match["resumen"].split()).casefold()
+            if text in by_text:
+                by_text[text].setdefault("duplicados", []).append(cliente_id)
+                continue
+
+            vector = embeddings.get(cliente_id)
+            if self.dedup_threshold and vector is not None and kept_vectors:
+                similarities = np.stack(kept_vectors) @ vector
+                best = int(np.argmax(similarities))
+                if float(similarities[best]) >= self.dedup_threshold:
+                    dropped.append({
+                        "cliente_id": cliente_id,
+                        "similar_to": kept_ids[best],
+                        "cosine": round(float(similarities[best]), 4)
+                    })
+                    continue
+
+            entry = dict(match)
+            by_text[text] = entry
+            kept.append(entry)
+            if vector is not None:
+                kept_ids.append(cliente_id)
+                kept_vectors.append(vector)
+
+        return kept, dropped
+
+    def _mmr(
+        self,
+        matches: List[Dict[str, Any]],
+        embeddings: Dict[str, np.ndarray],
+        query_embedding: Optional[List[float]]
+    ) -> List[Dict[str, Any]]:
+        """Orden MMR; sin embeddings se conserva el orden de recuperación"""
+        if query_embedding is None or len(matches) < 3:
+            return matches
+        if any(m["cliente_id"] not in embeddings for m in matches):
+            return matches
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        vectors = np.stack([embeddings[m["cliente_id"]] for m in matches])
+        relevance = vectors @ query
+        similarity = vectors @ vectors.T
+
+        selected: List[int] = []
+        remaining = list(range(len(matches)))
+        while remaining:
+            if selected:
+                redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+            else:
+                redundancy = np.zeros(len(remaining))
+            scores = self.mmr_lambda * relevance[remaining] - (1 - self.mmr_lambda) * redundancy
+            best = remaining[int(np.argmax(scores))]
+            selected.append(best)
+            remaining.remove(best)
+
+        return [matches[i] for i in selected]
+
+    def build(
+        self,
+        matches: List[Dict[str, Any]],
+        embeddings: Dict[str, np.ndarray],
+        query_embedding: Optional[List[float]],
+        fixed_tokens: int
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+        """
+        Selecciona y ordena las tarjetas del contexto
+
+        Args:
+            matches: Tarjetas recuperadas (en orden de recuperación)
+            embeddings: {cliente_id: vector} guardados en el índice (puede estar incompleto o vacío)
+            query_embedding: Embedding de la pregunta (None en recuperación léxica)
+            fixed_tokens: Tokens del prompt sin contexto (sistema + pregunta + formato)
+
+        Returns:
+            (tarjetas elegidas, estadísticas: candidates, merged_duplicates,
+            near_duplicates_dropped, near_duplicates (detalle de las descartadas), dropped_by_budget)
+        """
+        embeddings = {
+            doc_id: vector / (np.linalg.norm(vector) or 1.0)
+            for doc_id, vector in embeddings.items()
+        }
+        unique, dropped = self._deduplicate(matches, embeddings)
+        ordered = self._mmr(unique, embeddings, query_embedding)
+
+        packed: List[Dict[str, Any]] = []
+        used = fixed_tokens
+        for match in ordered:
+            # "\n\n" entre tarjetas ≈ 1 token
+            cost = count_tokens(format_card(match)) + 1
+            if packed and used + cost > self.token_budget:
+                break
+            packed.append(match)
+            used += cost
+
+        return packed, {
+            "candidates": len(matches),
+            "merged_duplicates": sum(len(m.get("duplicados", [])) for m in unique),
+            "near_duplicates_dropped": len(dropped),
+            "near_duplicates": dropped,
+            "dropped_by_budget": len(ordered) - len(packed)
+        }
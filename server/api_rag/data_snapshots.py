@@ -0,0 +1,102 @@
+"""
+Detección de cambios en los archivos de datos para recarga en caliente.
+Un FileWatcher compara (tamaño, mtime) en cada chequeo y solo si cambian calcula el hash de
+contenido; si la versión es nueva, invoca el callback de recarga (que construye el snapshot
+nuevo en segundo plano y lo intercambia de forma atómica).
+"""
+import hashlib
+import time
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+
+def file_fingerprint(paths: List[Path]) -> Tuple:
+    """Huella barata (ruta, tamaño, mtime) para detectar cambios sin leer los archivos"""
+    fingerprint = []
+    for path in paths:
+        try:
+            stat = path.stat()
+            fingerprint.append((str(path), stat.st_size, stat.st_mtime_ns))
+        except FileNotFoundError:
+            fingerprint.append((str(path), None, None))
+    return tuple(fingerprint)
+
+
+def content_version(paths: List[Path]) -> str:
+    """Versión = hash del contenido de todos los archivos (12 caracteres hex)"""
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(str(path.name).encode("utf-8"))
+        try:
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(chunk)
+        except FileNotFoundError:
+            digest.update(b"<missing>")
+    return digest.hexdigest()[:12]
+
+
+class FileWatcher:
+    def __init__(
+        self,
+        name: str,
+        paths_fn: Callable[[], List[Path]],
+        reload_fn: Callable[[str], None],
+        version: Optional[str] = None
+    ):
+        """
+        Args:
+            name: Nombre del conjunto de datos (para logs y /health)
+            paths_fn: Retorna los archivos a vigilar (se reevalúa en cada chequeo,
+                así un Data_*.csv nuevo se detecta)
+            reload_fn: Construye e instala el snapshot nuevo; recibe la versión
+            version: Versión ya cargada (evita una recarga innecesaria al iniciar)
+        """
+        self.name = name
+        self.paths_fn = paths_fn
+        self.reload_fn = reload_fn
+        self.version = version
+        self.loaded_at: Optional[float] = time.time() if version else None
+        self.last_error: Optional[str] = None
+        self._fingerprint = file_fingerprint(paths_fn()) if version else None
+
+    def check(self, force: bool = False) -> bool:
+        """
+        Recarga si el contenido cambió (bloqueante: correr fuera del event loop)
+
+        Returns:
+            True si se instaló una versión nueva
+        """
+        paths = self.paths_fn()
+        fingerprint = file_fingerprint(paths)
+        if fingerprint == self._fingerprint and not force:
+            return False
+
+        version = content_version(paths)
+        self._fingerprint = fingerprint
+        if version == self.version and not force:
+            # Solo cambió el mtime (p. ej. archivo re-copiado idéntico)
+            return False
+
+        print(f"→ Nueva versión de datos '{self.name}': {self.version} → {version}")
+        try:
+            self.reload_fn(version)
+        except Exception as e:
+            # Se mantiene el snapshot anterior; se reintenta en el próximo chequeo
+            self._fingerprint = None
+            self.last_error = str(e)
+            print(f"✗ Error recargando '{self.name}': {e}")
+            return False
+
+        self.version = version
+        self.loaded_at = time.time()
+        self.last_error = None
+        print(f"✓ Datos '{self.name}' recargados (versión {version})")
+        return True
+
+    def status(self) -> dict:
+        return {
+            "version": self.version,
+            "loaded_at": self.loaded_at,
+            "last_error": self.last_error
+        }
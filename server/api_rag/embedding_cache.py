@@ -0,0 +1,162 @@
+"""
+Caché de embeddings en dos niveles para RAGService.
+Nivel 1: LRU en memoria. Nivel 2: SQLite persistente en disco (sobrevive reinicios y reindexaciones).
+La clave es (modelo, sha256 del texto normalizado).
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+def normalize_text(text: str) -> str:
+    """Normaliza el texto para que variaciones triviales compartan entrada en caché"""
+    text = unicodedata.normalize("NFC", text)
+    return " ".join(text.split()).casefold()
+
+
+def text_hash(text: str) -> str:
+    """Hash estable del texto normalizado"""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(
+        self,
+        cache_dir: Path,
+        max_entries: int = 10000,
+        ttl_seconds: float = 7 * 24 * 3600
+    ):
+        """
+        Args:
+            cache_dir: Directorio donde vive el archivo SQLite del nivel 2
+            max_entries: Máximo de embeddings en el LRU en memoria
+            ttl_seconds: Vida de una entrada en ambos niveles (0 = sin expiración)
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._memory: "OrderedDict[Tuple[str, str], Tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.evictions = 0
+
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = cache_dir / "embeddings.sqlite3"
+        self._db = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )"""
+        )
+        self._db.commit()
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - created_at > self.ttl_seconds
+
+    def _remember(self, key: Tuple[str, str], created_at: float, vector: List[float]):
+        """Inserta en el LRU en memoria, expulsando la entrada más antigua si hace falta"""
+        self._memory[key] = (created_at, vector)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        Busca cada texto en memoria y luego en disco
+
+        Returns:
+            Lista alineada con texts; None donde no hay embedding en caché
+        """
+        now = time.time()
+        results: List[Optional[List[float]]] = []
+
+        with self._lock:
+            for text in texts:
+                key = (model, text_hash(text))
+
+                entry = self._memory.get(key)
+                if entry is not None and not self._expired(entry[0], now):
+                    self._memory.move_to_end(key)
+                    self.hits_memory += 1
+                    results.append(entry[1])
+                    continue
+                if entry is not None:
+                    del self._memory[key]
+
+                row = self._db.execute(
+                    "SELECT created_at, vector FROM embeddings WHERE model = ? AND text_hash = ?",
+                    key
+                ).fetchone()
+                if row is not None and not self._expired(row[0], now):
+                    vector = array("f", row[1]).tolist()
+                    self._remember(key, row[0], vector)
+                    self.hits_disk += 1
+                    results.append(vector)
+                    continue
+
+                self.misses += 1
+                results.append(None)
+
+        return results
+
+    def put_many(self, model: str, texts: List[str], vectors: List[List[float]]):
+        """Guarda embeddings nuevos en ambos niveles"""
+        now = time.time()
+        rows = []
+
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = (model, text_hash(text))
+                self._remember(key, now, vector)
+                rows.append((model, key[1], now, array("f", vector).tobytes()))
+
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, created_at, vector) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._db.commit()
+
+    def purge_expired(self) -> int:
+        """Elimina del disco las entradas vencidas. Retorna cuántas se borraron"""
+        if self.ttl_seconds <= 0:
+            return 0
+        with self._lock:
+            cursor = self._db.execute(
+                "DELETE FROM embeddings WHERE created_at < ?",
+                (time.time() - self.ttl_seconds,)
+            )
+            self._db.commit()
+            return cursor.rowcount
+
+    def get_stats(self) -> Dict[str, float]:
+        """Contadores de aciertos/fallos y tamaño de cada nivel"""
+        with self._lock:
+            disk_entries = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            lookups = self.hits_memory + self.hits_disk + self.misses
+            return {
+                "memory_entries": len(self._memory),
+                "disk_entries": disk_entries,
+                "hits_memory": self.hits_memory,
+                "hits_disk": self.hits_disk,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round((self.hits_memory + self.hits_disk) / lookups, 4) if lookups else 0.0
+            }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
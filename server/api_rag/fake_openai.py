@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Servidor local que imita la API de OpenAI (embeddings y chat completions).
+Sirve para benchmarks y desarrollo sin AI_INTEGRATIONS_OPENAI_API_KEY: los embeddings son
+deterministas (hashing de tokens, así textos parecidos dan vectores parecidos) y las
+respuestas de chat son fijas, con latencia artificial configurable.
+
+Uso:
+    python fake_openai.py --port 8900 --embedding-latency-ms 30 --chat-latency-ms 400
+    RAG_OPENAI_BASE_URL=http://127.0.0.1:8900/v1 AI_INTEGRATIONS_OPENAI_API_KEY=fake python run_api.py
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from context_builder import count_tokens
+from lexical_index import tokenize
+
+# Dimensión de text-embedding-3-small
+DEFAULT_DIMENSIONS = 1536
+
+_CLIENTE_ID = re.compile(r"\bcli\w*_\d+\b")
+
+
+def fake_embedding(text: str, dimensions: int = DEFAULT_DIMENSIONS) -> np.ndarray:
+    """Vector unitario determinista: cada token suma ±1 en una posición derivada de su hash"""
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for token in tokenize(text) or [text]:
+        digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        vector[value % dimensions] += 1.0 if (value >> 63) else -1.0
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        vector[0] = 1.0
+        return vector
+    return vector / norm
+
+
+def fake_answer(messages: List[Dict[str, str]]) -> str:
+    """Respuesta fija que cita los cliente_id del contexto (como pide el prompt de sistema)"""
+    prompt = "\n".join(m.get("content", "") for m in messages)
+    ids = list(dict.fromkeys(_CLIENTE_ID.findall(prompt)))
+    if not ids:
+        return "No disponible en los datos proporcionados."
+    return f"Respuesta de prueba basada en {len(ids)} clientes: " + ", ".join(ids[:5]) + "."
+
+
+def create_app(
+    embedding_latency_ms: float = 0.0,
+    chat_latency_ms: float = 0.0,
+    token_latency_ms: float = 0.0,
+    rate_limit_fraction: float = 0.0
+) -> FastAPI:
+    """
+    Args:
+        embedding_latency_ms: Espera por llamada de embeddings
+        chat_latency_ms: Espera antes del primer token de chat
+        token_latency_ms: Espera entre tokens en streaming
+        rate_limit_fraction: Fracción de llamadas que responden 429 (prueba de reintentos)
+    """
+    app = FastAPI(title="Fake OpenAI")
+    app.state.calls = {"embeddings": 0, "chat": 0, "rate_limited": 0}
+
+    def rate_limited() -> Optional[JSONResponse]:
+        if rate_limit_fraction and random.random() < rate_limit_fraction:
+            app.state.calls["rate_limited"] += 1
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                status_code=429,
+                headers={"retry-after": "0.05"}
+            )
+        return None
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        app.state.calls["embeddings"] += 1
+        if (limited := rate_limited()) is not None:
+            return limited
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        dimensions = body.get("dimensions") or DEFAULT_DIMENSIONS
+        if embedding_latency_ms:
+            await asyncio.sleep(embedding_latency_ms / 1000)
+
+        data = []
+        for i, text in enumerate(texts):
+            vector = fake_embedding(text, dimensions)
+            if body.get("encoding_format") == "base64":
+                embedding: Any = base64.b64encode(vector.astype("<f4").tobytes()).decode("ascii")
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+
+        tokens = sum(count_tokens(text) for text in texts)
+        return {
+            "object": "list",
+            "model": body["model"],
+            "data": data,
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.calls["chat"] += 1
+        if (limited := rate_limited()) is not None:
+            return limited
+        answer = fake_answer(body["messages"])
+        usage = {
+            "prompt_tokens": sum(count_tokens(m.get("content", "")) + 3 for m in body["messages"]) + 3,
+            "completion_tokens": count_tokens(answer)
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        base = {"id": "chatcmpl-fake", "created": int(time.time()), "model": body["model"]}
+        if chat_latency_ms:
+            await asyncio.sleep(chat_latency_ms / 1000)
+
+        if not body.get("stream"):
+            return JSONResponse({
+                **base,
+                "object": "chat.completion",
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": answer},
+                    "finish_reason": "stop"
+                }],
+                "usage": usage
+            })
+
+        async def chunks():
+            for i, word in enumerate(re.findall(r"\S+\s*", answer)):
+                if i and token_latency_ms:
+                    await asyncio.sleep(token_latency_ms / 1000)
+                chunk = {
+                    **base,
+                    "object": "chat.completion.chunk",
+                    "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}]
+                }
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield f"data: {json.dumps({**base, 'object': 'chat.completion.chunk', 'choices': [], 'usage': usage})}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    return app
+
+
+class FakeOpenAIServer:
+    """
+    Servidor fake en un hilo de fondo (puerto libre por defecto)
+
+        with FakeOpenAIServer(chat_latency_ms=300) as fake:
+            rag = RAGService(openai_api_key="fake", openai_base_url=fake.base_url)
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, **latency):
+        self.app = create_app(**latency)
+        self._server = uvicorn.Server(uvicorn.Config(self.app, host=host, port=port, log_level="warning"))
+        self._thread: Optional[threading.Thread] = None
+        self.host = host
+        self.port = port
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    @property
+    def calls(self) -> Dict[str, int]:
+        return dict(self.app.state.calls)
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self._server.run, name="fake-openai", daemon=True)
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if time.monotonic() > deadline or not self._thread.is_alive():
+                raise RuntimeError("No se pudo iniciar el servidor fake de OpenAI")
+            time.sleep(0.01)
+        self.port = self._server.servers[0].sockets[0].getsockname()[1]
+        return self
+
+    def stop(self):
+        self._server.should_exit = True
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local compatible con la API de OpenAI")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--embedding-latency-ms", type=float, default=0.0, help="Espera por llamada de embeddings")
+    parser.add_argument("--chat-latency-ms", type=float, default=0.0, help="Espera antes del primer token de chat")
+    parser.add_argument("--token-latency-ms", type=float, default=0.0, help="Espera entre tokens en streaming")
+    parser.add_argument("--rate-limit-fraction", type=float, default=0.0, help="Fracción de llamadas que responden 429")
+    args = parser.parse_args()
+
+    print(f"✓ Fake OpenAI en http://{args.host}:{args.port}/v1")
+    uvicorn.run(
+        create_app(args.embedding_latency_ms, args.chat_latency_ms, args.token_latency_ms, args.rate_limit_fraction),
+        host=args.host,
+        port=args.port,
+        log_level="warning"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Filtros estructurados sobre la metadata de ChromaDB (edad, sexo, ingreso, sector_publico).
+Incluye un extractor por reglas que traduce restricciones comunes en español
+("mujeres mayores de 50 años", "sector público", "ingreso mayor a 2.000") a un filtro `where`.
+"""
+import os
+import re
+import unicodedata
+from typing import Any, Dict, List, Optional
+
+# Umbral para expresiones vagas como "alto ingreso" (USD/mes, ~p75 de la cartera)
+ALTO_INGRESO_USD = float(os.getenv("RAG_ALTO_INGRESO_USD", "5000"))
+
+# Edades para expresiones vagas
+EDAD_JOVEN_MAX = 35
+EDAD_ADULTO_MAYOR_MIN = 65
+
+SEXOS_VALIDOS = {"MASCULINO", "FEMENINO"}
+
+
+class FilterError(ValueError):
+    """Filtros inválidos en la petición (la API responde 400)"""
+
+
+def build_filters(
+    edad_min: Optional[float] = None,
+    edad_max: Optional[float] = None,
+    sexo: Optional[str] = None,
+    sector_publico: Optional[bool] = None,
+    ingreso_min: Optional[float] = None,
+    ingreso_max: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    Normaliza los filtros explícitos a un dict (solo las claves con valor)
+
+    Raises:
+        FilterError: si sexo no es MASCULINO/FEMENINO o algún rango es inválido
+    """
+    filters: Dict[str, Any] = {}
+
+    if sexo is not None:
+        sexo = sexo.upper()
+        if sexo not in SEXOS_VALIDOS:
+            raise FilterError(f"Sexo inválido: {sexo}. Debe ser 'MASCULINO' o 'FEMENINO'")
+        filters["sexo"] = sexo
+    if edad_min is not None:
+        filters["edad_min"] = float(edad_min)
+    if edad_max is not None:
+        filters["edad_max"] = float(edad_max)
+    if sector_publico is not None:
+        filters["sector_publico"] = bool(sector_publico)
+    if ingreso_min is not None:
+        filters["ingreso_min"] = float(ingreso_min)
+    if ingreso_max is not None:
+        filters["ingreso_max"] = float(ingreso_max)
+
+    if filters.get("edad_min", float("-inf")) > filters.get("edad_max", float("inf")):
+        raise FilterError("edad_min no puede ser mayor que edad_max")
+    if filters.get("ingreso_min", float("-inf")) > filters.get("ingreso_max", float("inf")):
+        raise FilterError("ingreso_min no puede ser mayor que ingreso_max")
+
+    return filters
+
+
+def to_where(filters: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Traduce filtros normalizados a la sintaxis `where` de ChromaDB"""
+    if not filters:
+        return None
+
+    conditions: List[Dict[str, Any]] = []
+    if "sexo" in filters:
+        conditions.append({"sexo": {"$eq": filters["sexo"]}})
+    if "edad_min" in filters:
+        conditions.append({"edad": {"$gte": filters["edad_min"]}})
+    if "edad_max" in filters:
+        conditions.append({"edad": {"$lte": filters["edad_max"]}})
+    if "sector_publico" in filters:
+        conditions.append({"sector_publico": {"$eq": 1.0 if filters["sector_publico"] else 0.0}})
+    if "ingreso_min" in filters:
+        conditions.append({"ingreso": {"$gte": filters["ingreso_min"]}})
+    if "ingreso_max" in filters:
+        conditions.append({"ingreso": {"$lte": filters["ingreso_max"]}})
+
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"$and": conditions}
+
+
+# ===== EXTRACTOR POR REGLAS =====
+
+_NUM = r"(\d+(?:[.,]\d+)*)\s*(k|mil)?"
+
+
+def _strip_accents(text: str) -> str:
+    return "".join(
+        c for c in unicodedata.normalize("NFD", text)
+        if unicodedata.category(c) != "Mn"
+    )
+
+
+def _parse_number(digits: str, suffix: Optional[str]) -> float:
+    """'2.000' / '2,000' / '2000' / '2 mil' / '2k' → 2000.0"""
+    if re.fullmatch(r"\d{1,3}([.,]\d{3})+", digits):
+        value = float(re.sub(r"[.,]", "", digits))
+    else:
+        value = float(digits.replace(",", "."))
+    if suffix:
+        value *= 1000
+    return value
+
+
+_FEMENINO = re.compile(r"\b(mujer(es)?|femenin[oa]s?|senoras?|damas?)\b")
+_MASCULINO = re.compile(r"\b(hombres?|masculin[oa]s?|varon(es)?|senor(es)?|caballeros?)\b")
+
+# Cantidades que no son edades: "de 2 a 5 años de antigüedad", "más de 24 meses", "hasta 3 productos"
+_NO_EDAD = (
+    r"(?!\s*(?:anos\s*)?(?:o\s+mas\s+)?(?:de\s+|en\s+(?:el|la)\s+|como\s+)?"
+    r"(?:antiguedad|servicio|experiencia|trabajo|empresa|banco|relacion|laborando|trabajando|cliente|"
+    r"meses|dias|semanas|productos?|creditos?|prestamos?|tarjetas?|cuentas?|hijos?)\b)"
+)
+_EDAD_ENTRE = re.compile(r"\b(?:entre|de)\s+(\d{1,3})\s+(?:y|a)\s+(\d{1,3})\s+anos\b" + _NO_EDAD)
+_EDAD_MIN = re.compile(r"\b(?:mayores?\s+de|mas\s+de|arriba\s+de|desde)\s+(\d{1,3})\b" + _NO_EDAD)
+_EDAD_MIN_SUFIJO = re.compile(r"\b(\d{1,3})\s+anos\s+o\s+mas\b" + _NO_EDAD)
+_EDAD_MAX = re.compile(r"\b(?:menores?\s+de|menos\s+de|hasta)\s+(\d{1,3})\b" + _NO_EDAD)
+_JOVENES = re.compile(r"\bjovenes?\b")
+_ADULTOS_MAYORES = re.compile(r"\b(adultos?\s+mayores?|tercera\s+edad|jubilad[oa]s?|pensionad[oa]s?)\b")
+
+_SECTOR_PUBLICO = re.compile(r"\b(sector\s+publico|emplead[oa]s?\s+public[oa]s?|funcionari[oa]s?|gobierno)\b")
+_SECTOR_PRIVADO = re.compile(r"\b(sector\s+privado|emplead[oa]s?\s+privad[oa]s?)\b")
+
+_INGRESO = r"\b(?:ingresos?|salario|sueldo|ganan?)\b[^.;,\d]{0,20}?"
+_INGRESO_MIN = re.compile(_INGRESO + r"(?:mayor(?:es)?\s+(?:a|de|que)|superior(?:es)?\s+a|mas\s+de|sobre|por\s+encima\s+de|de\s+al\s+menos|minimo)\s+\$?\s*" + _NUM)
+_INGRESO_MAX = re.compile(_INGRESO + r"(?:menor(?:es)?\s+(?:a|de|que)|inferior(?:es)?\s+a|menos\s+de|bajo|por\s+debajo\s+de|maximo)\s+\$?\s*" + _NUM)
+_ALTO_INGRESO = re.compile(r"\b(alto|altos|elevado|elevados)\s+ingresos?\b|\bingresos?\s+(alto|altos|elevado|elevados)\b")
+
+
+def extract_filters(query: str) -> Dict[str, Any]:
+    """
+    Extrae filtros estructurados de una pregunta en español
+
+    Solo reconoce patrones inequívocos; si hay señales contradictorias
+    (p. ej. "hombres y mujeres") esa dimensión no se filtra.
+
+    Returns:
+        Filtros normalizados (mismas claves que build_filters)
+    """
+    text = _strip_accents(query.lower())
+    found: Dict[str, Any] = {}
+
+    # Sexo
+    es_femenino = bool(_FEMENINO.search(text))
+    es_masculino = bool(_MASCULINO.search(text))
+    if es_femenino != es_masculino:
+        found["sexo"] = "FEMENINO" if es_femenino else "MASCULINO"
+
+    # Ingreso (antes que edad: "mas de 2000" después de "ingreso" no es una edad)
+    ingreso_spans = []
+    match = _INGRESO_MIN.search(text)
+    if match:
+        found["ingreso_min"] = _parse_number(match.group(1), match.group(2))
+        ingreso_spans.append(match.span())
+    match = _INGRESO_MAX.search(text)
+    if match:
+        found["ingreso_max"] = _parse_number(match.group(1), match.group(2))
+        ingreso_spans.append(match.span())
+    if "ingreso_min" not in found and _ALTO_INGRESO.search(text):
+        found["ingreso_min"] = ALTO_INGRESO_USD
+
+    def outside_ingreso(m) -> bool:
+        return not any(start <= m.start() < end for start, end in ingreso_spans)
+
+    # Edad
+    match = _EDAD_ENTRE.search(text)
+    if match:
+        low, high = sorted((float(match.group(1)), float(match.group(2))))
+        found["edad_min"], found["edad_max"] = low, high
+    else:
+        for pattern in (_EDAD_MIN, _EDAD_MIN_SUFIJO):
+            match = next((m for m in pattern.finditer(text) if outside_ingreso(m)), None)
+            if match:
+                found["edad_min"] = float(match.group(1))
+                break
+        match = next((m for m in _EDAD_MAX.finditer(text) if outside_ingreso(m)), None)
+        if match:
+            found["edad_max"] = float(match.group(1))
+        if "edad_max" not in found and "edad_min" not in found:
+            if _JOVENES.search(text):
+                found["edad_max"] = float(EDAD_JOVEN_MAX)
+            elif _ADULTOS_MAYORES.search(text):
+                found["edad_min"] = float(EDAD_ADULTO_MAYOR_MIN)
+
+    # Sector
+    es_publico = bool(_SECTOR_PUBLICO.search(text))
+    es_privado = bool(_SECTOR_PRIVADO.search(text))
+    if es_publico != es_privado:
+        found["sector_publico"] = es_publico
+
+    # Rangos contradictorios: mejor no filtrar esa dimensión
+    for low, high in (("edad_min", "edad_max"), ("ingreso_min", "ingreso_max")):
+        if low in found and high in found and found[low] > found[high]:
+            del found[low], found[high]
+
+    return build_filters(**found)
+
+
+def merge_filters(explicit: Dict[str, Any], extracted: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Combina filtros: los explícitos del request tienen prioridad sobre los extraídos
+
+    Raises:
+        FilterError: si la combinación deja un rango imposible (p. ej. edad_min=60
+            explícito con "jóvenes" en la pregunta), que de otro modo no devolvería nada
+    """
+    merged = dict(extracted)
+    merged.update(explicit)
+    try:
+        return build_filters(**merged)
+    except FilterError as e:
+        raise FilterError(f"Los filtros explícitos contradicen los extraídos de la pregunta: {e}")
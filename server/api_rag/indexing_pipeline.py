@@ -0,0 +1,358 @@
+"""
+Pipeline de indexación masiva para RAGService.
+Lee el JSONL en streaming, embebe varios lotes en paralelo (con límite de concurrencia,
+rate limit y reintentos) y escribe en el backend vectorial desde una etapa separada, guardando un
+checkpoint para que una ejecución interrumpida continúe donde se quedó.
+"""
+import json
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import openai
+
+# Errores transitorios de OpenAI que justifican reintentar un lote
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+def iter_jsonl(path: Path, start_offset: int = 0) -> Iterator[Tuple[int, Dict]]:
+    """
+    Recorre un JSONL en streaming sin cargarlo completo en memoria
+
+    Yields:
+        (offset en bytes al final de la línea, registro)
+    """
+    with open(path, 'rb') as f:
+        f.seek(start_offset)
+        offset = start_offset
+        for line in iter(f.readline, b''):
+            offset += len(line)
+            if line.strip():
+                yield offset, json.loads(line)
+
+
+class RateLimiter:
+    """Limita las peticiones por minuto compartidas entre hilos (0 = sin límite)"""
+
+    def __init__(self, requests_per_minute: int = 0):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class IndexingPipeline:
+    def __init__(
+        self,
+        rag,
+        batch_size: int = None,
+        concurrency: int = None,
+        requests_per_minute: int = None,
+        max_retries: int = None,
+        checkpoint_every: int = None,
+        checkpoint_path: Optional[Path] = None,
+        vector_store=None
+    ):
+        """
+        Args:
+            rag: RAGService que provee embeddings, hash y metadata de cada row_card
+            batch_size: Documentos por llamada de embeddings
+            concurrency: Lotes embebiéndose en paralelo
+            requests_per_minute: Límite de llamadas de embeddings por minuto (0 = sin límite)
+            max_retries: Reintentos por lote ante errores transitorios
+            checkpoint_every: Cada cuántos lotes se hace flush del backend y se guarda checkpoint
+            checkpoint_path: Archivo donde se guarda el progreso confirmado
+            vector_store: Backend a sincronizar (default: el índice global de rag)
+        """
+        self.rag = rag
+        self.store = vector_store or rag.vector_store
+        self.batch_size = batch_size or int(os.getenv("RAG_INDEX_BATCH_SIZE", "100"))
+        self.concurrency = concurrency or int(os.getenv("RAG_INDEX_CONCURRENCY", "4"))
+        if requests_per_minute is None:
+            requests_per_minute = int(os.getenv("RAG_INDEX_RPM", "0"))
+        self.rate_limiter = RateLimiter(requests_per_minute)
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("RAG_INDEX_MAX_RETRIES", "5"))
+        self.checkpoint_every = checkpoint_every or int(os.getenv("RAG_INDEX_CHECKPOINT_EVERY", "10"))
+        self.checkpoint_path = checkpoint_path or (rag.cache_dir / "index_checkpoint.json")
+
+    # ===== CHECKPOINT =====
+
+    @staticmethod
+    def _fingerprint(jsonl_path: Path) -> Dict[str, Any]:
+        stat = jsonl_path.stat()
+        return {"path": str(jsonl_path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    @property
+    def _ids_path(self) -> Path:
+        """cliente_id del prefijo confirmado, uno por línea (append-only)"""
+        return self.checkpoint_path.with_suffix(".ids")
+
+    def _load_checkpoint(self, fingerprint: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Progreso confirmado si el checkpoint corresponde al mismo archivo
+
+        Returns:
+            {"offset", "counts" (added/updated/unchanged del prefijo), "ids_bytes"} (todo en 0 si no hay)
+        """
+        empty = {"offset": 0, "counts": {"added": 0, "updated": 0, "unchanged": 0}, "ids_bytes": 0}
+        try:
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return empty
+        if checkpoint.get("source") != fingerprint or "counts" not in checkpoint:
+            return empty
+        return {key: checkpoint[key] for key in empty}
+
+    def _load_prefix_ids(self, ids_bytes: int) -> Set[str]:
+        """Ids del prefijo ya confirmado (solo lo registrado en el checkpoint)"""
+        if not ids_bytes:
+            return set()
+        with open(self._ids_path, 'rb') as f:
+            return set(f.read(ids_bytes).decode("utf-8").splitlines())
+
+    def _save_checkpoint(self, fingerprint: Dict[str, Any], progress: Dict[str, Any], new_ids: List[str]):
+        """
+        Agrega los ids confirmados al .ids y guarda el checkpoint (tmp + rename)
+
+        El checkpoint registra cuántos bytes del .ids son válidos: lo escrito
+        por un checkpoint que no llegó a guardarse se descarta al truncar.
+        """
+        self.checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+        data = "".join(f"{cliente_id}\n" for cliente_id in new_ids).encode("utf-8")
+        with open(self._ids_path, 'ab') as f:
+            f.truncate(progress["ids_bytes"])
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        progress["ids_bytes"] += len(data)
+
+        tmp_path = self.checkpoint_path.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"source": fingerprint, **progress}, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _clear_checkpoint(self):
+        for path in (self.checkpoint_path, self._ids_path):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    # ===== ETAPAS =====
+
+    def _iter_changed_batches(
+        self,
+        jsonl_path: Path,
+        start_offset: int,
+        indexed: Dict[str, str],
+        seen: Set[str],
+        counts: Dict[str, int]
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Etapa 1: lee el JSONL desde start_offset y agrupa en lotes solo los clientes nuevos o modificados
+
+        Cada lote lleva lo necesario para su checkpoint: los ids leídos desde el
+        lote anterior (incluidos los sin cambios) y los conteos acumulados hasta
+        su end_offset.
+        """
+        def new_batch(end_offset: int) -> Dict[str, Any]:
+            return {"ids": [], "documents": [], "metadatas": [], "scanned": [], "end_offset": end_offset}
+
+        batch = new_batch(start_offset)
+        last_offset = start_offset
+        for offset, card in iter_jsonl(jsonl_path, start_offset):
+            last_offset = offset
+            cliente_id = card['cliente_id']
+            seen.add(cliente_id)
+            batch["scanned"].append(cliente_id)
+            content_hash = self.rag._card_hash(card)
+
+            previous = indexed.get(cliente_id)
+            if previous == content_hash:
+                counts["unchanged"] += 1
+                continue
+            counts["added" if previous is None else "updated"] += 1
+
+            batch["ids"].append(cliente_id)
+            batch["documents"].append(card['resumen'])
+            batch["metadatas"].append(self.rag._card_metadata(card, content_hash))
+            batch["end_offset"] = offset
+
+            if len(batch["ids"]) >= self.batch_size:
+                batch["counts"] = dict(counts)
+                yield batch
+                batch = new_batch(offset)
+
+        if batch["ids"]:
+            # El último lote cubre hasta el final del archivo (sin cambios incluidos)
+            batch["end_offset"] = last_offset
+            batch["counts"] = dict(counts)
+            yield batch
+
+    def _embed_batch(self, batch: Dict[str, Any], stats: Dict[str, int]) -> Dict[str, Any]:
+        """Etapa 2: embebe un lote con rate limit y reintentos con backoff exponencial"""
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            try:
+                embeddings, tokens = self.rag._embed_with_usage(batch["documents"])
+                batch["embeddings"] = embeddings
+                batch["tokens"] = tokens
+                return batch
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = min(30.0, 2 ** attempt) * (0.5 + random.random() / 2)
+                stats["retries"] += 1
+                print(f"  ⚠ Reintento {attempt + 1}/{self.max_retries} en {delay:.1f}s: {e}")
+                time.sleep(delay)
+
+    def _writer(
+        self,
+        results: "queue.Queue",
+        fingerprint: Dict[str, Any],
+        progress: Dict[str, Any],
+        in_flight: threading.BoundedSemaphore,
+        stats: Dict[str, Any]
+    ):
+        """
+        Etapa 3: escribe en el backend vectorial los lotes embebidos
+
+        Consume los lotes en el orden del archivo, así el checkpoint siempre
+        es un prefijo contiguo ya escrito. Cada checkpoint_every lotes hace
+        flush del backend (NumPy acumula en memoria) antes de guardarlo.
+        Tras el primer error deja de escribir (los lotes posteriores se
+        reprocesan al reanudar).
+        """
+        pending_ids: List[str] = []
+        while True:
+            item = results.get()
+            if item is None:
+                return
+            try:
+                if stats["error"] is not None:
+                    continue
+                batch = item.result()
+                self.store.upsert(
+                    ids=batch["ids"],
+                    documents=batch["documents"],
+                    embeddings=batch["embeddings"],
+                    metadatas=batch["metadatas"]
+                )
+                pending_ids.extend(batch["scanned"])
+                if (stats["batches"] + 1) % self.checkpoint_every == 0:
+                    self.store.flush()
+                    progress.update(offset=batch["end_offset"], counts=batch["counts"])
+                    self._save_checkpoint(fingerprint, progress, pending_ids)
+                    pending_ids = []
+            except Exception as e:
+                stats["error"] = e
+                continue
+            finally:
+                in_flight.release()
+
+            stats["docs"] += len(batch["ids"])
+            stats["tokens"] += batch["tokens"]
+            stats["batches"] += 1
+            print(f"  Lote {stats['batches']} escrito ({len(batch['ids'])} docs, {stats['docs']} acumulados)")
+
+    # ===== EJECUCIÓN =====
+
+    def run(self, jsonl_path: Path) -> Dict[str, Any]:
+        """
+        Sincroniza la colección con el JSONL
+
+        Returns:
+            Reporte con added, updated, deleted, unchanged y el throughput
+            (docs/s, tokens/s) de la etapa de embeddings
+        """
+        start = time.perf_counter()
+        fingerprint = self._fingerprint(jsonl_path)
+        progress = self._load_checkpoint(fingerprint)
+        start_offset = progress["offset"]
+        # El prefijo confirmado no se vuelve a leer: sus ids (para detectar
+        # eliminados) y sus conteos salen del checkpoint
+        seen = self._load_prefix_ids(progress["ids_bytes"])
+        counts = dict(progress["counts"])
+        if start_offset:
+            print(f"→ Reanudando indexación desde el byte {start_offset} ({len(seen)} clientes ya confirmados)")
+
+        indexed = self.store.get_hashes()
+        stats: Dict[str, Any] = {"docs": 0, "tokens": 0, "batches": 0, "retries": 0, "error": None}
+
+        # Cola acotada: como máximo 2x concurrency lotes en memoria a la vez
+        in_flight = threading.BoundedSemaphore(self.concurrency * 2)
+        results: "queue.Queue" = queue.Queue()
+        writer = threading.Thread(
+            target=self._writer,
+            args=(results, fingerprint, progress, in_flight, stats),
+            name="index-writer",
+            daemon=True
+        )
+        writer.start()
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="embed") as executor:
+                batches = self._iter_changed_batches(jsonl_path, start_offset, indexed, seen, counts)
+                for batch in batches:
+                    in_flight.acquire()
+                    if stats["error"] is not None:
+                        in_flight.release()
+                        break
+                    results.put(executor.submit(self._embed_batch, batch, stats))
+        finally:
+            results.put(None)
+            writer.join()
+
+        if stats["error"] is not None:
+            # Lo ya escrito es válido; al reanudar, el diff por hash lo salta
+            self.store.flush()
+            print("✗ Indexación interrumpida; se reanudará desde el último checkpoint")
+            raise stats["error"]
+
+        # Eliminar clientes que ya no existen en el JSONL
+        removed = [doc_id for doc_id in indexed if doc_id not in seen]
+        for i in range(0, len(removed), self.batch_size):
+            self.store.delete(removed[i:i+self.batch_size])
+        self.store.flush()
+
+        self._clear_checkpoint()
+
+        elapsed = time.perf_counter() - start
+        return {
+            "added": counts["added"],
+            "updated": counts["updated"],
+            "deleted": len(removed),
+            "unchanged": counts["unchanged"],
+            "total": len(seen),
+            "resumed_from_offset": start_offset,
+            "elapsed_s": round(elapsed, 3),
+            "throughput": {
+                "docs_embedded": stats["docs"],
+                "tokens": stats["tokens"],
+                "batches": stats["batches"],
+                "retries": stats["retries"],
+                "concurrency": self.concurrency,
+                "docs_per_s": round(stats["docs"] / elapsed, 2) if elapsed else 0.0,
+                "tokens_per_s": round(stats["tokens"] / elapsed, 2) if elapsed else 0.0
+            }
+        }
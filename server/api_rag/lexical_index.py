@@ -0,0 +1,295 @@
+"""
+Índice léxico BM25 local sobre los row_cards (resumen + campos de perfil).
+Las postings se guardan en formato compacto (CSR): offsets int64, doc_ids int32 y tf uint16,
+en un único .npz que se escribe en cada sincronización. Sirve para la búsqueda híbrida
+(fusión por rango recíproco con los resultados vectoriales) y para el modo solo-léxico,
+que no necesita red.
+"""
+import json
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from filters import extract_filters
+from vector_store import metadata_columns, metadata_mask
+
+# Constante k de Reciprocal Rank Fusion (valor estándar de Cormack et al.)
+RRF_K = 60
+
+_STOPWORDS = {
+    "a", "al", "con", "cual", "cuales", "de", "del", "el", "en", "es", "la", "las", "lo",
+    "los", "mes", "o", "para", "por", "que", "se", "su", "sus", "un", "una", "usd", "y",
+}
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Minúsculas sin tildes, alfanumérico, sin stopwords"""
+    text = "".join(
+        c for c in unicodedata.normalize("NFD", text.lower())
+        if unicodedata.category(c) != "Mn"
+    )
+    return [t for t in _TOKEN.findall(text) if t not in _STOPWORDS]
+
+
+def _edad_token(edad: float) -> str:
+    return f"edad_{int(edad) // 10 * 10}s"
+
+
+def perfil_tokens(perfil: Dict[str, Any]) -> List[str]:
+    """Tokens de campo derivados del perfil (sexo, década de edad, sector)"""
+    tokens = []
+    if perfil.get("sexo"):
+        tokens.append(f"sexo_{perfil['sexo'].lower()}")
+    if perfil.get("edad"):
+        tokens.append(_edad_token(perfil["edad"]))
+    if perfil.get("sector_publico_flag") is not None:
+        tokens.append("sector_publico" if perfil["sector_publico_flag"] else "sector_privado")
+    return tokens
+
+
+def query_tokens(query: str) -> List[str]:
+    """Tokens de la pregunta + tokens de campo de las restricciones reconocibles"""
+    tokens = tokenize(query)
+    found = extract_filters(query)
+    if "sexo" in found:
+        tokens.append(f"sexo_{found['sexo'].lower()}")
+    if "sector_publico" in found:
+        tokens.append("sector_publico" if found["sector_publico"] else "sector_privado")
+    if "edad_min" in found or "edad_max" in found:
+        low = int(found.get("edad_min", 18)) // 10 * 10
+        high = int(found.get("edad_max", 99)) // 10 * 10
+        tokens.extend(_edad_token(d) for d in range(low, min(high, low + 90) + 1, 10))
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings: List[List[Dict[str, Any]]], top_k: int, k: int = RRF_K) -> List[Dict[str, Any]]:
+    """
+    Combina varios rankings de matches por cliente_id: score = Σ 1 / (k + rango)
+
+    Conserva el primer dict visto por cliente (el vectorial, si se pasa primero,
+    trae distance) y agrega rrf_score.
+    """
+    scores: Dict[str, float] = {}
+    first: Dict[str, Dict[str, Any]] = {}
+    for ranking in rankings:
+        for rank, match in enumerate(ranking, start=1):
+            cliente_id = match["cliente_id"]
+            scores[cliente_id] = scores.get(cliente_id, 0.0) + 1.0 / (k + rank)
+            first.setdefault(cliente_id, match)
+
+    fused = sorted(scores, key=scores.get, reverse=True)[:top_k]
+    return [dict(first[cliente_id], rrf_score=round(scores[cliente_id], 6)) for cliente_id in fused]
+
+
+class BM25Snapshot:
+    """
+    Versión inmutable del índice BM25 (postings CSR, longitudes, registros y columnas de filtrado)
+
+    Se construye completa y se publica con una sola asignación: una búsqueda en
+    curso nunca mezcla offsets de una versión con doc_ids o ids de otra.
+    """
+
+    __slots__ = (
+        "mtime_ns", "vocabulary", "offsets", "doc_ids", "tfs", "doc_len",
+        "ids", "documents", "metadatas", "columns"
+    )
+
+    def __init__(
+        self,
+        mtime_ns: Optional[int],
+        vocabulary: Dict[str, int],
+        offsets: np.ndarray,
+        doc_ids: np.ndarray,
+        tfs: np.ndarray,
+        doc_len: np.ndarray,
+        ids: List[str],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]]
+    ):
+        self.mtime_ns = mtime_ns
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_len = doc_len
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+        self.columns = metadata_columns(metadatas)
+
+    @classmethod
+    def empty(cls) -> "BM25Snapshot":
+        return cls(
+            None, {}, np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32),
+            np.zeros(0, dtype=np.uint16), np.zeros(0, dtype=np.int32), [], [], []
+        )
+
+
+class BM25Index:
+    def __init__(self, path: Path, k1: float = 1.2, b: float = 0.75):
+        """
+        Args:
+            path: Archivo .npz del índice
+            k1, b: Parámetros de BM25
+        """
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._snapshot = BM25Snapshot.empty()
+        self._load()
+
+    # ===== CONSTRUCCIÓN =====
+
+    def build(self, cards: Iterable[Tuple[Dict[str, Any], Dict[str, Any]]]):
+        """
+        Reconstruye el índice y lo publica de forma atómica (tmp + rename)
+
+        Args:
+            cards: Pares (row_card, metadata a devolver en los matches)
+        """
+        vocabulary: Dict[str, int] = {}
+        postings: List[List[Tuple[int, int]]] = []
+        ids, documents, records, doc_len = [], [], [], []
+
+        for doc, (card, metadata) in enumerate(cards):
+            terms = Counter(tokenize(card["resumen"]) + perfil_tokens(card.get("perfil", {})))
+            for term, tf in terms.items():
+                term_id = vocabulary.setdefault(term, len(vocabulary))
+                if term_id == len(postings):
+                    postings.append([])
+                postings[term_id].append((doc, min(tf, 65535)))
+            ids.append(card["cliente_id"])
+            documents.append(card["resumen"])
+            records.append(json.dumps(metadata, ensure_ascii=False))
+            doc_len.append(sum(terms.values()))
+
+        offsets = np.zeros(len(postings) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(p) for p in postings])
+        flat = [entry for plist in postings for entry in plist]
+        doc_ids = np.fromiter((d for d, _ in flat), dtype=np.int32, count=len(flat))
+        tfs = np.fromiter((tf for _, tf in flat), dtype=np.uint16, count=len(flat))
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.stem + ".tmp.npz")
+        np.savez(
+            tmp_path,
+            vocabulary=np.array(list(vocabulary), dtype=str),
+            offsets=offsets,
+            doc_ids=doc_ids,
+            tfs=tfs,
+            doc_len=np.asarray(doc_len, dtype=np.int32),
+            ids=np.array(ids, dtype=str),
+            documents=np.array(documents, dtype=str),
+            metadatas=np.array(records, dtype=str),
+        )
+        os.replace(tmp_path, self.path)
+        with self._lock:
+            self._load()
+
+    # ===== CARGA =====
+
+    def _load(self):
+        """Lee el .npz en un BM25Snapshot nuevo y lo activa con una sola asignación"""
+        try:
+            mtime_ns = self.path.stat().st_mtime_ns
+            data = np.load(self.path)
+        except FileNotFoundError:
+            self._snapshot = BM25Snapshot.empty()
+            return
+
+        snapshot = BM25Snapshot(
+            mtime_ns,
+            {term: i for i, term in enumerate(data["vocabulary"].tolist())},
+            data["offsets"],
+            data["doc_ids"],
+            data["tfs"],
+            data["doc_len"],
+            data["ids"].tolist(),
+            data["documents"].tolist(),
+            [json.loads(m) for m in data["metadatas"].tolist()]
+        )
+        self._snapshot = snapshot
+        print(f"✓ Índice léxico BM25 cargado ({len(snapshot.ids)} documentos, {len(snapshot.vocabulary)} términos)")
+
+    def _current(self) -> BM25Snapshot:
+        """
+        Snapshot activo; recarga si otro proceso reconstruyó el índice
+
+        Los lectores llaman esto una vez y usan solo el snapshot devuelto.
+        """
+        snapshot = self._snapshot
+        try:
+            mtime_ns = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return snapshot
+        if mtime_ns != snapshot.mtime_ns:
+            with self._lock:
+                if mtime_ns != self._snapshot.mtime_ns:
+                    self._load()
+                snapshot = self._snapshot
+        return snapshot
+
+    # ===== CONSULTA =====
+
+    def count(self) -> int:
+        return len(self._snapshot.ids)
+
+    def search(self, query: str, top_k: int, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Top-k por BM25 entre los documentos que cumplen los filtros
+
+        Returns:
+            Matches con cliente_id, resumen, metadata, distance (None) y bm25_score
+        """
+        snapshot = self._current()
+        n_docs = len(snapshot.ids)
+        if n_docs == 0:
+            return []
+
+        avg_len = float(snapshot.doc_len.mean()) or 1.0
+        norm = self.k1 * (1 - self.b + self.b * snapshot.doc_len / avg_len)
+        scores = np.zeros(n_docs, dtype=np.float64)
+
+        for term in set(query_tokens(query)):
+            term_id = snapshot.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = snapshot.offsets[term_id], snapshot.offsets[term_id + 1]
+            docs = snapshot.doc_ids[start:end]
+            tf = snapshot.tfs[start:end].astype(np.float64)
+            df = end - start
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            # Cada doc aparece una sola vez por término: la suma indexada es segura
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm[docs])
+
+        mask = metadata_mask(snapshot.columns, filters)
+        if mask is not None:
+            scores[~mask] = 0.0
+
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) == 0:
+            return []
+        k = min(top_k, len(candidates))
+        top = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        order = top[np.argsort(-scores[top], kind="stable")]
+
+        return [
+            {
+                "cliente_id": snapshot.ids[i],
+                "resumen": snapshot.documents[i],
+                "metadata": snapshot.metadatas[i],
+                "distance": None,
+                "bm25_score": round(float(scores[i]), 4)
+            }
+            for i in order
+        ]
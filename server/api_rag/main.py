@@ -2,14 +2,30 @@
 API RAG para Asistente Bancario - Gemelo 1.1 Premium
 API minimal viable con RAG sobre clientes y métricas de cartera
 """
+import asyncio
+import json
 import os
-from typing import Optional
-from fastapi import FastAPI, HTTPException, Query
+import threading
+import time
+from typing import TYPE_CHECKING, List, Optional
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
 
-from rag_service import RAGService
-from metrics_service import MetricsService
+from admission import Overloaded
+from client_store import MAX_PAGE_SIZE, ClientStore
+from context_builder import count_tokens
+from data_snapshots import FileWatcher, content_version
+from filters import FilterError, build_filters
+from metrics_service import MetricsService, PrecomputedResponse
+from query_router import CLIENT_SEARCH, QueryRouter
+import telemetry
+
+if TYPE_CHECKING:
+    # openai (y chromadb con ese backend) se importan recién al crear RAGService:
+    # los workers que solo sirven /metrics/* no pagan ese costo de arranque
+    from rag_service import RAGService
 
 # Inicializar FastAPI
 app = FastAPI(
@@ -27,28 +43,176 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Histograma de latencia y contador de errores por endpoint (ver telemetry.py)"""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Plantilla de la ruta (/ask, /metrics/saldo...) para no crear una serie por URL
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        telemetry.observe_request(request.method, path, status, time.perf_counter() - start)
+
 # Inicializar servicios (lazy loading)
-rag_service: Optional[RAGService] = None
+rag_service: Optional["RAGService"] = None
 metrics_service: Optional[MetricsService] = None
+client_store: Optional[ClientStore] = None
+query_router: Optional[QueryRouter] = None
+_rag_init_lock = asyncio.Lock()
+# Los getters síncronos se llaman desde el event loop y desde hilos (_warm_up):
+# doble chequeo bajo lock para construir una sola instancia y un solo FileWatcher
+_metrics_init_lock = threading.Lock()
+_clients_init_lock = threading.Lock()
+_router_init_lock = threading.Lock()
+
+# Recarga en caliente: segundos entre chequeos de los archivos de datos (0 = desactivado)
+DATA_RELOAD_INTERVAL = float(os.getenv("DATA_RELOAD_INTERVAL", "30"))
+data_watchers: dict = {}
+_watch_task: Optional[asyncio.Task] = None
+
+# Modo eager: RAGService se construye y se calienta al arrancar (no en la primera /ask)
+RAG_EAGER_INIT = os.getenv("RAG_EAGER_INIT", "0") == "1"
+RAG_WARMUP_QUERY = os.getenv("RAG_WARMUP_QUERY", "clientes del sector público con ingreso alto")
+warmup_state: dict = {"status": "pending", "eager_rag": RAG_EAGER_INIT, "elapsed_s": None, "error": None}
+_warmup_task: Optional[asyncio.Task] = None
+
+# Segundos que el cliente puede reutilizar /metrics sin revalidar (0 = revalidar siempre con ETag)
+METRICS_CACHE_MAX_AGE = int(os.getenv("METRICS_CACHE_MAX_AGE", "0"))
 
-def get_rag_service() -> RAGService:
-    """Obtiene instancia singleton del servicio RAG"""
+def _build_rag_service() -> "RAGService":
+    """Import + construcción de RAGService (bloqueante: se llama en un hilo)"""
+    from rag_service import RAGService
+    return RAGService()
+
+async def get_rag_service() -> "RAGService":
+    """
+    Obtiene instancia singleton del servicio RAG
+
+    La construcción (apertura de ChromaDB e indexación) es bloqueante, por lo
+    que se ejecuta en un hilo; el lock evita inicializaciones duplicadas
+    cuando llegan varias peticiones a la vez.
+    """
     global rag_service
     if rag_service is None:
-        print("→ Inicializando RAG Service...")
-        rag_service = RAGService()
-        print("✓ RAG Service listo")
+        async with _rag_init_lock:
+            if rag_service is None:
+                print("→ Inicializando RAG Service...")
+                rag = await asyncio.to_thread(_build_rag_service)
+                # Cambios en row_cards.jsonl (o en Data.csv si hay particiones)
+                # → reindexación incremental en segundo plano
+                data_watchers["row_cards"] = FileWatcher(
+                    "row_cards",
+                    rag.index_source_paths,
+                    lambda version: rag.sync_index(),
+                    version=await asyncio.to_thread(content_version, rag.index_source_paths())
+                )
+                rag_service = rag
+                print("✓ RAG Service listo")
     return rag_service
 
 def get_metrics_service() -> MetricsService:
     """Obtiene instancia singleton del servicio de métricas"""
     global metrics_service
     if metrics_service is None:
-        print("→ Inicializando Metrics Service...")
-        metrics_service = MetricsService()
-        print("✓ Metrics Service listo")
+        with _metrics_init_lock:
+            if metrics_service is None:
+                print("→ Inicializando Metrics Service...")
+                metrics = MetricsService()
+                data_watchers["metrics"] = FileWatcher(
+                    "metrics",
+                    metrics.data_paths,
+                    metrics.reload,
+                    version=metrics.snapshot.version
+                )
+                metrics_service = metrics
+                print("✓ Metrics Service listo")
     return metrics_service
 
+def get_client_store() -> ClientStore:
+    """Obtiene instancia singleton del almacén de clientes (row_cards en columnas, sin OpenAI)"""
+    global client_store
+    if client_store is None:
+        with _clients_init_lock:
+            if client_store is None:
+                print("→ Inicializando Client Store...")
+                store = ClientStore()
+                data_watchers["clients"] = FileWatcher(
+                    "clients",
+                    store.data_paths,
+                    store.reload,
+                    version=store.table.version
+                )
+                client_store = store
+                print(f"✓ Client Store listo ({len(store.table)} clientes)")
+    return client_store
+
+def get_query_router() -> QueryRouter:
+    """Enrutador de /ask (usa el snapshot activo de MetricsService)"""
+    global query_router
+    if query_router is None:
+        with _router_init_lock:
+            if query_router is None:
+                query_router = QueryRouter(get_metrics_service())
+    return query_router
+
+async def check_data_files() -> dict:
+    """Revisa cada conjunto de datos y recarga los que cambiaron (fuera del event loop)"""
+    reloaded = {}
+    for name, watcher in list(data_watchers.items()):
+        reloaded[name] = await asyncio.to_thread(watcher.check)
+    return reloaded
+
+async def _warm_up():
+    """
+    Calentamiento al arrancar; /ready responde 503 hasta que termina
+    
+    Siempre: MetricsService con su motor columnar (y el extracto en el histórico
+    si es nuevo), el enrutador de /ask y el
+    almacén de /clients con su orden por defecto. Con
+    RAG_EAGER_INIT=1 además: RAGService (apertura del índice y sincronización),
+    una búsqueda de prueba (embedding → caché, pool HTTP, índice vectorial y BM25)
+    y el tokenizer del contexto.
+    """
+    warmup_state["status"] = "warming_up"
+    start = time.perf_counter()
+    try:
+        metrics = await asyncio.to_thread(get_metrics_service)
+        if metrics.snapshot.csv_path:
+            await asyncio.to_thread(metrics.get_aggregate, "neto", "GERENCIA")
+            # Extracto nuevo → snapshot en el histórico (con el motor ya cargado)
+            await asyncio.to_thread(metrics.ingest_history)
+        await asyncio.to_thread(get_query_router().route, RAG_WARMUP_QUERY)
+        clients = await asyncio.to_thread(get_client_store)
+        await asyncio.to_thread(clients.query)
+        
+        if RAG_EAGER_INIT:
+            rag = await get_rag_service()
+            await rag.asearch(RAG_WARMUP_QUERY)
+            await asyncio.to_thread(count_tokens, RAG_WARMUP_QUERY)
+    except Exception as e:
+        warmup_state.update(status="failed", error=str(e))
+        print(f"✗ Calentamiento fallido: {e}")
+        return
+    finally:
+        warmup_state["elapsed_s"] = round(time.perf_counter() - start, 3)
+    
+    warmup_state["status"] = "ready"
+    print(f"✓ Calentamiento completo en {warmup_state['elapsed_s']} s")
+
+async def _watch_data_files():
+    """Tarea de fondo: detecta versiones nuevas de los datos y las intercambia"""
+    while True:
+        await asyncio.sleep(DATA_RELOAD_INTERVAL)
+        try:
+            await check_data_files()
+        except Exception as e:
+            print(f"✗ Error revisando archivos de datos: {e}")
+
 # ===== MODELOS PYDANTIC =====
 
 class HealthResponse(BaseModel):
@@ -60,6 +224,39 @@ class AskResponse(BaseModel):
     answer: str
     matches: list
     context_used: int
+    filters: dict = {}
+    cached: bool = False
+    retrieval_mode: Optional[str] = None
+    prompt_tokens: Optional[int] = None
+    context: Optional[dict] = None
+    route: str = CLIENT_SEARCH
+    data: Optional[dict] = None
+    debug: Optional[dict] = None
+
+class BatchRequest(BaseModel):
+    queries: List[str] = Field(..., min_length=1, max_length=1000, description="Preguntas del lote")
+    top_k: int = Field(5, ge=1, le=20, description="Número de clientes a recuperar por pregunta")
+    auto_filter: bool = Field(False, description="Extraer filtros de cada pregunta")
+    concurrency: Optional[int] = Field(None, ge=1, le=64, description="Completions de GPT-4 en paralelo (solo /ask/batch)")
+    mode: Optional[str] = Field(None, pattern="^(vector|hybrid|lexical)$", description="Modo de recuperación")
+    scope: Optional[str] = Field(None, description="Partición de RAG_PARTITION_BY a consultar")
+    edad_min: Optional[float] = None
+    edad_max: Optional[float] = None
+    sexo: Optional[str] = None
+    sector_publico: Optional[bool] = None
+    ingreso_min: Optional[float] = None
+    ingreso_max: Optional[float] = None
+
+    def filters(self) -> dict:
+        """Filtros comunes a todo el lote (FilterError si son inválidos)"""
+        return build_filters(
+            edad_min=self.edad_min,
+            edad_max=self.edad_max,
+            sexo=self.sexo,
+            sector_publico=self.sector_publico,
+            ingreso_min=self.ingreso_min,
+            ingreso_max=self.ingreso_max
+        )
 
 class SaldoResponse(BaseModel):
     tipo: str
@@ -76,9 +273,23 @@ async def root():
         "version": "0.1.0",
         "endpoints": {
             "health": "/health",
+            "ready": "/ready",
             "ask": "/ask?q=tu_pregunta",
+            "ask_stream": "/ask/stream?q=tu_pregunta",
+            "search_batch": "POST /search/batch",
+            "clients": "/clients?sexo=FEMENINO&edad_min=50&sort=-ingreso",
+            "client": "/clients/{cliente_id}",
+            "ask_batch": "POST /ask/batch",
             "metrics_saldo": "/metrics/saldo?tipo=neto|captaciones|colocaciones",
-            "metrics_productos": "/metrics/saldo_por_producto"
+            "metrics_productos": "/metrics/saldo_por_producto",
+            "metrics_aggregate": "/metrics/aggregate?metric=neto&group_by=GERENCIA",
+            "metrics_dimensions": "/metrics/dimensions",
+            "metrics_history": "/metrics/history",
+            "metrics_history_series": "/metrics/history/series?metric=captaciones",
+            "metrics_history_delta": "/metrics/history/delta?metric=captaciones&group_by=GERENCIA",
+            "admin_reindex": "POST /admin/reindex",
+            "admin_reload": "POST /admin/reload",
+            "internal_metrics": "/internal/metrics"
         },
         "docs": "/docs"
     }
@@ -100,11 +311,13 @@ async def health():
         # Verificar si RAG ya está inicializado
         rag_status = "not_initialized"
         vector_docs = 0
+        admission = None
         
         if rag_service is not None:
             stats = rag_service.get_stats()
             rag_status = stats['status']
             vector_docs = stats['total_documents']
+            admission = stats['admission']
         elif has_valid_key:
             rag_status = "ready_to_init"
         else:
@@ -115,17 +328,86 @@ async def health():
             "vector_docs": vector_docs,
             "services": {
                 "metrics": "ready",
+                "clients": "ready" if client_store is not None else "not_initialized",
                 "rag": rag_status,
                 "openai_configured": has_valid_key
+            },
+            "admission": admission,
+            "data_versions": {
+                name: watcher.status()
+                for name, watcher in data_watchers.items()
             }
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en health check: {str(e)}")
 
+@app.get("/ready")
+async def ready():
+    """
+    Readiness (para el balanceador): 200 solo cuando terminó el calentamiento
+    
+    /health es liveness (el proceso responde); /ready indica que el worker ya
+    no es "frío". Con RAG_EAGER_INIT=1 incluye RAGService y la búsqueda de prueba.
+    """
+    body = {"ready": warmup_state["status"] == "ready", **warmup_state}
+    return JSONResponse(body, status_code=200 if body["ready"] else 503)
+
+def filter_params(
+    edad_min: Optional[float] = Query(None, ge=0, description="Edad mínima"),
+    edad_max: Optional[float] = Query(None, ge=0, description="Edad máxima"),
+    sexo: Optional[str] = Query(None, description="MASCULINO o FEMENINO"),
+    sector_publico: Optional[bool] = Query(None, description="true = sector público, false = privado"),
+    ingreso_min: Optional[float] = Query(None, ge=0, description="Ingreso mínimo (USD/mes)"),
+    ingreso_max: Optional[float] = Query(None, ge=0, description="Ingreso máximo (USD/mes)")
+) -> dict:
+    """Filtros de metadata comunes a /ask, /ask/stream y /clients"""
+    try:
+        return build_filters(
+            edad_min=edad_min,
+            edad_max=edad_max,
+            sexo=sexo,
+            sector_publico=sector_publico,
+            ingreso_min=ingreso_min,
+            ingreso_max=ingreso_max
+        )
+    except FilterError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def overloaded_error(e: Overloaded) -> HTTPException:
+    """503 con Retry-After: el cliente debe reintentar más tarde (no es un fallo del servidor)"""
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+def _route_question(q: str, filters: dict, enabled: bool) -> Optional[dict]:
+    """
+    Respuesta sin LLM si el enrutador clasifica la pregunta como metric o schema
+    
+    Con filtros de perfil explícitos la pregunta es sobre clientes: va directo a RAG.
+    """
+    if not enabled or filters:
+        return None
+    with telemetry.span("route"):
+        routed = get_query_router().route(q)
+    if routed["route"] == CLIENT_SEARCH:
+        return None
+    return {
+        "answer": routed["answer"],
+        "matches": [],
+        "context_used": 0,
+        "filters": {},
+        "route": routed["route"],
+        "data": routed["data"]
+    }
+
 @app.get("/ask", response_model=AskResponse)
 async def ask(
     q: str = Query(..., description="Pregunta sobre clientes o segmentos"),
-    top_k: int = Query(5, ge=1, le=20, description="Número de clientes a recuperar")
+    top_k: int = Query(5, ge=1, le=20, description="Número de clientes a recuperar"),
+    filters: dict = Depends(filter_params),
+    auto_filter: bool = Query(False, description="Extraer filtros (edad, sexo, sector, ingreso) de la pregunta"),
+    mode: Optional[str] = Query(None, pattern="^(vector|hybrid|lexical)$", description="Recuperación: vector, hybrid (BM25 + vector) o lexical (sin red)"),
+    router: bool = Query(True, description="Responder preguntas de métricas y de esquema sin LLM"),
+    scope: Optional[str] = Query(None, description="Valor de RAG_PARTITION_BY (p. ej. un COD_PROMOTOR): busca solo en esa partición"),
+    debug: bool = Query(False, description="Incluir tiempos por etapa y tokens de OpenAI en la respuesta")
 ):
     """
     Endpoint RAG para preguntas sobre clientes/segmentos
@@ -137,20 +419,269 @@ async def ask(
     - /ask?q=clientes con alto ingreso del sector público
     - /ask?q=mujeres mayores de 50 años con antigüedad laboral alta
     - /ask?q=clientes jóvenes profesionales
+    
+    Filtros de metadata (se aplican antes de la búsqueda vectorial):
+    - /ask?q=perfil de riesgo&sexo=FEMENINO&edad_min=50
+    - /ask?q=mujeres mayores de 50 años&auto_filter=true
+    
+    Preguntas de métricas ("¿cuál es el saldo neto de la cartera?") o de esquema
+    ("¿qué significa TC_SALDO?") se responden directo desde MetricsService /
+    schema_card.json; `route` indica el camino tomado (metric, schema, client_search).
+    
+    Con scope (requiere RAG_PARTITION_BY) la búsqueda recorre solo la partición
+    indicada y la pregunta no pasa por el enrutador:
+    - /ask?q=clientes con tarjeta de crédito&scope=SEFE
+    
+    `matches` trae los top_k clientes recuperados; RAG_CONTEXT_TOKEN_BUDGET solo
+    limita las tarjetas enviadas a GPT-4 (`context_used`, `context.cliente_ids`).
+
+    Con debug=true la respuesta trae `debug` con los tiempos por etapa (route,
+    embedding, vector_query, lexical_query, context_embeddings, context, llm) y los
+    tokens de OpenAI. Si la pregunta se coalesció con otra idéntica en curso, las
+    etapas compartidas se reportan solo en la petición que las ejecutó.
+    
+    Si la cola de llamadas a GPT-4 está llena (o la espera supera
+    RAG_ADMISSION_MAX_WAIT_S) responde 503 con Retry-After.
     """
     try:
-        rag = get_rag_service()
+        start = time.perf_counter()
+        trace = telemetry.start_trace() if debug else None
         
-        # Ejecutar RAG + GPT-4
-        result = rag.ask_with_gpt(q, top_k=top_k)
+        result = _route_question(q, filters, router and scope is None)
+        if result is None:
+            rag = await get_rag_service()
+            
+            # Ejecutar RAG + GPT-4 sin bloquear el event loop
+            result = await rag.aask_with_gpt(
+                q, top_k=top_k, filters=filters, auto_filter=auto_filter, mode=mode, scope=scope
+            )
+            result = {**result, "route": CLIENT_SEARCH}
         
+        if trace is not None:
+            trace["timings_ms"]["total"] = round((time.perf_counter() - start) * 1000, 3)
+            result = {**result, "debug": trace}
         return result
+    except Overloaded as e:
+        raise overloaded_error(e)
+    except FilterError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en RAG query: {str(e)}")
 
+def _sse(event: str, data: dict) -> str:
+    """Serializa un evento en formato Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.get("/ask/stream")
+async def ask_stream(
+    q: str = Query(..., description="Pregunta sobre clientes o segmentos"),
+    top_k: int = Query(5, ge=1, le=20, description="Número de clientes a recuperar"),
+    filters: dict = Depends(filter_params),
+    auto_filter: bool = Query(False, description="Extraer filtros (edad, sexo, sector, ingreso) de la pregunta"),
+    mode: Optional[str] = Query(None, pattern="^(vector|hybrid|lexical)$", description="Recuperación: vector, hybrid (BM25 + vector) o lexical (sin red)"),
+    router: bool = Query(True, description="Responder preguntas de métricas y de esquema sin LLM"),
+    scope: Optional[str] = Query(None, description="Valor de RAG_PARTITION_BY (p. ej. un COD_PROMOTOR): busca solo en esa partición")
+):
+    """
+    Variante en streaming de /ask (Server-Sent Events)
+    
+    Eventos emitidos:
+    - matches: clientes recuperados (se envía apenas termina la búsqueda)
+    - token: fragmentos de la respuesta de GPT-4 a medida que se generan
+    - done: uso de tokens y tiempos (retrieval, first_token, total)
+    - error: detalle si algo falla a mitad del stream
+    
+    Las preguntas enrutadas a metric/schema emiten los mismos eventos, con la
+    respuesta completa en un único token; `route` viaja en matches y done.
+    """
+    try:
+        routed = _route_question(q, filters, router and scope is None)
+        rag = await get_rag_service() if routed is None else None
+        if rag is not None:
+            await rag.acheck_scope(scope)
+            rag.check_admission()
+    except Overloaded as e:
+        raise overloaded_error(e)
+    except FilterError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error en RAG query: {str(e)}")
+    
+    async def routed_events():
+        yield {"event": "matches", "data": {"matches": [], "context_used": 0, "filters": {}, "route": routed["route"]}}
+        yield {"event": "token", "data": {"content": routed["answer"]}}
+        yield {"event": "done", "data": {"usage": None, "cached": False, "route": routed["route"], "data": routed["data"]}}
+    
+    async def rag_events():
+        async for event in rag.astream_ask_with_gpt(
+            q, top_k=top_k, filters=filters, auto_filter=auto_filter, mode=mode, scope=scope
+        ):
+            if event["event"] in ("matches", "done"):
+                event["data"]["route"] = CLIENT_SEARCH
+            yield event
+    
+    async def event_stream():
+        try:
+            async for event in (routed_events() if routed is not None else rag_events()):
+                yield _sse(event["event"], event["data"])
+        except Overloaded as e:
+            yield _sse("error", {"detail": str(e), "retry_after": e.retry_after})
+        except Exception as e:
+            yield _sse("error", {"detail": f"Error en RAG query: {str(e)}"})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/search/batch")
+async def search_batch(request: BatchRequest):
+    """
+    Búsqueda semántica para un lote de preguntas
+    
+    Un solo llamado de embeddings para todas las preguntas y una sola
+    consulta multi-embedding al backend vectorial.
+    
+    Body: {"queries": ["...", "..."], "top_k": 5, "sexo": "FEMENINO", ...}
+    """
+    try:
+        filters = request.filters()
+    except FilterError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        rag = await get_rag_service()
+        results = await rag.asearch_batch(
+            request.queries,
+            top_k=request.top_k,
+            filters=filters,
+            auto_filter=request.auto_filter,
+            mode=request.mode,
+            scope=request.scope
+        )
+        return {"results": results, "count": len(results)}
+    except FilterError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error en búsqueda por lotes: {str(e)}")
+
+@app.post("/ask/batch")
+async def ask_batch(request: BatchRequest):
+    """
+    Respuestas RAG para un lote de preguntas (NDJSON en streaming)
+    
+    La recuperación se hace en bloque y las llamadas a GPT-4 corren en paralelo
+    (límite `concurrency`). Cada línea es el resultado de una pregunta apenas
+    termina, con su `index` en el lote; una pregunta fallida trae `error`
+    sin interrumpir las demás.
+    """
+    try:
+        filters = request.filters()
+    except FilterError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        rag = await get_rag_service()
+        await rag.acheck_scope(request.scope)
+        rag.check_admission()
+    except Overloaded as e:
+        raise overloaded_error(e)
+    except FilterError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error en RAG query: {str(e)}")
+    
+    async def result_stream():
+        try:
+            async for result in rag.aask_batch(
+                request.queries,
+                top_k=request.top_k,
+                filters=filters,
+                auto_filter=request.auto_filter,
+                concurrency=request.concurrency,
+                mode=request.mode,
+                scope=request.scope
+            ):
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": f"Error en RAG query: {str(e)}"}, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(
+        result_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/clients")
+async def list_clients(
+    sort: str = Query("cliente_id", description="cliente_id, edad, ingreso o antiguedad_laboral ('-' = descendente)"),
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE, description="Clientes por página"),
+    cursor: Optional[str] = Query(None, description="next_cursor de la página anterior"),
+    filters: dict = Depends(filter_params)
+):
+    """
+    Clientes que cumplen filtros estructurados, sin embeddings ni OpenAI
+    
+    Filtrado con máscaras booleanas sobre columnas tipadas y paginación por
+    cursor (keyset): las páginas siguientes no se recorren desde el inicio.
+    """
+    try:
+        return get_client_store().query(filters, sort=sort, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error listando clientes: {str(e)}")
+
+@app.get("/clients/{cliente_id}")
+async def get_client(cliente_id: str):
+    """Row_card completo de un cliente (búsqueda O(1) por cliente_id)"""
+    try:
+        card = get_client_store().get(cliente_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error obteniendo cliente: {str(e)}")
+    if card is None:
+        raise HTTPException(status_code=404, detail=f"Cliente no encontrado: {cliente_id}")
+    return card
+
+def dimension_filters(
+    gerencia: Optional[str] = Query(None, description="Filtrar por GERENCIA"),
+    cod_promotor: Optional[str] = Query(None, description="Filtrar por COD_PROMOTOR (ejecutivo)"),
+    segmentacion_estrategica: Optional[str] = Query(None, description="Filtrar por SEGMENTACION_ESTRATEGICA"),
+    provincia_default: Optional[str] = Query(None, description="Filtrar por PROVINCIA_DEFAULT")
+) -> dict:
+    """Filtros por dimensión de Data.csv comunes a los endpoints de métricas"""
+    values = {
+        "GERENCIA": gerencia,
+        "COD_PROMOTOR": cod_promotor,
+        "SEGMENTACION_ESTRATEGICA": segmentacion_estrategica,
+        "PROVINCIA_DEFAULT": provincia_default
+    }
+    return {name: value for name, value in values.items() if value is not None}
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Comparación débil de If-None-Match (RFC 9110): W/"x" coincide con "x"; * con todo"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag == "*" or tag.removeprefix("W/") == etag for tag in tags)
+
+def precomputed_response(request: Request, precomputed: PrecomputedResponse) -> Response:
+    """Bytes precalculados con ETag; 304 sin cuerpo si el cliente ya tiene esa versión"""
+    headers = {
+        "ETag": precomputed.etag,
+        "Cache-Control": f"max-age={METRICS_CACHE_MAX_AGE}, must-revalidate" if METRICS_CACHE_MAX_AGE else "no-cache"
+    }
+    if _etag_matches(request.headers.get("if-none-match"), precomputed.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(precomputed.body, media_type="application/json", headers=headers)
+
 @app.get("/metrics/saldo")
 async def get_saldo(
-    tipo: str = Query(..., description="Tipo de saldo: neto, captaciones, o colocaciones")
+    request: Request,
+    tipo: str = Query(..., description="Tipo de saldo: neto, captaciones, o colocaciones"),
+    group_by: Optional[str] = Query(None, description="Dimensión de desglose: GERENCIA, COD_PROMOTOR, SEGMENTACION_ESTRATEGICA, PROVINCIA_DEFAULT"),
+    filters: dict = Depends(dimension_filters)
 ):
     """
     Endpoint de métricas de cartera
@@ -166,11 +697,23 @@ async def get_saldo(
     - /metrics/saldo?tipo=neto
     - /metrics/saldo?tipo=captaciones
     - /metrics/saldo?tipo=colocaciones
+    
+    Desgloses y slices (calculados en vivo desde Data.csv):
+    - /metrics/saldo?tipo=neto&group_by=SEGMENTACION_ESTRATEGICA
+    - /metrics/saldo?tipo=captaciones&cod_promotor=SEFE&group_by=PROVINCIA_DEFAULT
+    
+    Sin desglose ni filtros la respuesta sale precalculada, con ETag
+    (If-None-Match → 304) y Cache-Control.
     """
     try:
         metrics = get_metrics_service()
         
-        result = metrics.get_saldo(tipo)
+        if group_by is None and not filters:
+            precomputed = metrics.get_precomputed(f"saldo/{tipo.lower()}")
+            if precomputed is not None:
+                return precomputed_response(request, precomputed)
+        
+        result = metrics.get_saldo(tipo, group_by=group_by, filters=filters)
         
         return result
     except ValueError as e:
@@ -178,39 +721,177 @@ async def get_saldo(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error calculando saldo: {str(e)}")
 
+@app.get("/metrics/aggregate")
+async def get_aggregate(
+    metric: str = Query(..., description="captaciones, colocaciones, neto o una columna _SALDO (p. ej. TC_SALDO)"),
+    group_by: Optional[str] = Query(None, description="Dimensión de desglose"),
+    filters: dict = Depends(dimension_filters)
+):
+    """
+    Agregado en vivo desde Data.csv (motor columnar, resultados memoizados)
+    
+    Ejemplos:
+    - /metrics/aggregate?metric=TC_SALDO&group_by=SEGMENTACION_ESTRATEGICA
+    - /metrics/aggregate?metric=neto&cod_promotor=SEFE
+    """
+    try:
+        metrics = get_metrics_service()
+        
+        result = metrics.get_aggregate(metric, group_by=group_by, filters=filters)
+        
+        return result
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error calculando agregado: {str(e)}")
+
+@app.get("/metrics/dimensions")
+async def get_dimensions():
+    """Dimensiones disponibles para group_by/filtros, con sus valores"""
+    try:
+        metrics = get_metrics_service()
+        
+        result = metrics.get_dimensions()
+        
+        return result
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error obteniendo dimensiones: {str(e)}")
+
 @app.get("/metrics/saldo_por_producto")
-async def get_saldo_por_producto():
+async def get_saldo_por_producto(request: Request):
     """
     Endpoint de desglose por producto
     
     Retorna información detallada de columnas/productos
-    detectados en captaciones y colocaciones
+    detectados en captaciones y colocaciones (precalculada, con ETag)
     """
     try:
         metrics = get_metrics_service()
         
-        result = metrics.get_saldo_por_producto()
-        
-        return result
+        return precomputed_response(request, metrics.get_precomputed("saldo_por_producto"))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error obteniendo productos: {str(e)}")
 
 @app.get("/metrics/summary")
-async def get_metrics_summary():
+async def get_metrics_summary(request: Request):
     """
     Endpoint de resumen completo de métricas
     
-    Retorna todos los totales y definiciones
+    Retorna todos los totales y definiciones (precalculados, con ETag)
     """
     try:
         metrics = get_metrics_service()
         
-        result = metrics.get_totals_summary()
-        
-        return result
+        return precomputed_response(request, metrics.get_precomputed("summary"))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error obteniendo resumen: {str(e)}")
 
+@app.get("/metrics/history")
+async def get_metrics_history():
+    """Periodos del histórico mensual (un snapshot por extracto) con sus totales"""
+    try:
+        return get_metrics_service().get_history()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error obteniendo histórico: {str(e)}")
+
+@app.get("/metrics/history/series")
+async def get_metrics_history_series(
+    metric: str = Query(..., description="captaciones, colocaciones, neto o una columna _SALDO"),
+    filters: dict = Depends(dimension_filters)
+):
+    """
+    Serie de tiempo de una métrica con su variación mes a mes
+    
+    Sale de los agregados guardados al ingerir cada extracto (no relee CSV).
+    Acepta un filtro de dimensión para la serie de un segmento o ejecutivo.
+    
+    Ejemplos:
+    - /metrics/history/series?metric=captaciones
+    - /metrics/history/series?metric=neto&cod_promotor=SEFE
+    """
+    try:
+        return get_metrics_service().get_history_series(metric, filters=filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error obteniendo serie histórica: {str(e)}")
+
+@app.get("/metrics/history/delta")
+async def get_metrics_history_delta(
+    metric: str = Query(..., description="captaciones, colocaciones, neto o una columna _SALDO"),
+    period: Optional[str] = Query(None, description="Periodo YYYY-MM (default: el más reciente)"),
+    group_by: Optional[str] = Query(None, description="Dimensión de desglose de la variación"),
+    filters: dict = Depends(dimension_filters)
+):
+    """
+    Variación de un periodo contra el snapshot anterior
+    
+    Ejemplos:
+    - /metrics/history/delta?metric=captaciones
+    - /metrics/history/delta?metric=neto&period=2025-10&group_by=GERENCIA
+    """
+    try:
+        return get_metrics_service().get_history_delta(metric, period=period, group_by=group_by, filters=filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error calculando variación: {str(e)}")
+
+# ===== ADMIN =====
+
+@app.get("/internal/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def internal_metrics():
+    """
+    Contadores e histogramas en formato de texto de Prometheus
+    
+    Latencia por endpoint y por etapa (embedding, vector_query, llm...), aciertos
+    de caché, errores y tokens de OpenAI. Para scraping interno: no exponer públicamente.
+    """
+    return PlainTextResponse(
+        telemetry.REGISTRY.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+@app.post("/admin/reindex")
+async def admin_reindex():
+    """
+    Reindexación incremental de row_cards.jsonl
+    
+    Solo re-embebe clientes nuevos o modificados (por hash de contenido)
+    y elimina los que ya no existen. Retorna el reporte de cambios.
+    """
+    try:
+        rag = await get_rag_service()
+        
+        report = await asyncio.to_thread(rag.sync_index)
+        
+        return report
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error reindexando: {str(e)}")
+
+@app.post("/admin/reload")
+async def admin_reload():
+    """
+    Fuerza la revisión de los archivos de datos
+    
+    Las versiones nuevas se cargan y se intercambian de forma atómica; las
+    peticiones en curso terminan con la versión anterior.
+    """
+    try:
+        get_metrics_service()
+        
+        reloaded = await check_data_files()
+        
+        return {
+            "reloaded": reloaded,
+            "data_versions": {
+                name: watcher.status()
+                for name, watcher in data_watchers.items()
+            }
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error recargando datos: {str(e)}")
+
 # ===== STARTUP / SHUTDOWN =====
 
 @app.on_event("startup")
@@ -220,12 +901,24 @@ async def startup_event():
     print("Iniciando API RAG - ARIA by ProIngenius")
     print("=" * 60)
     print(f"OpenAI API Key: {'Configurada' if os.getenv('AI_INTEGRATIONS_OPENAI_API_KEY') else 'NO ENCONTRADA'}")
+    print(f"Recarga de datos: {'cada ' + str(DATA_RELOAD_INTERVAL) + 's' if DATA_RELOAD_INTERVAL > 0 else 'desactivada'}")
+    print(f"RAG Service: {'eager (se inicializa al arrancar)' if RAG_EAGER_INIT else 'lazy (primera /ask)'}")
     print("=" * 60)
+    
+    global _watch_task, _warmup_task
+    if DATA_RELOAD_INTERVAL > 0:
+        _watch_task = asyncio.create_task(_watch_data_files())
+    _warmup_task = asyncio.create_task(_warm_up())
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Evento de cierre de la aplicación"""
     print("Cerrando API RAG...")
+    for task in (_watch_task, _warmup_task):
+        if task is not None:
+            task.cancel()
+    if rag_service is not None:
+        await rag_service.aclose()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,228 @@
+"""
+Motor columnar de métricas sobre Data.csv.
+Carga una sola vez las columnas _SALDO y las dimensiones en arrays tipados (dtypes de
+schema_card.json) y calcula captaciones, colocaciones y neto con sumas vectorizadas,
+con group-by por dimensión y resultados memoizados por (métrica, group-by, filtros).
+"""
+import csv
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Dimensiones por las que se puede agrupar/filtrar (sobrescribible con "dimensions" en metrics_config.json)
+DEFAULT_DIMENSIONS = [
+    "GERENCIA",
+    "COD_PROMOTOR",
+    "SEGMENTACION_ESTRATEGICA",
+    "PROVINCIA_DEFAULT",
+]
+
+MAX_MEMO_ENTRIES = 4096
+
+# Tipos de schema_card.json → dtype numpy
+NUMERIC_DTYPES = {
+    "real": np.float64,
+    "float": np.float64,
+    "int": np.int64,
+}
+
+
+def _parse_number(value: str) -> float:
+    """Celdas vacías o no numéricas cuentan como 0 (igual que portfolio_totals.json)"""
+    try:
+        return float(value) if value else 0.0
+    except ValueError:
+        return 0.0
+
+
+class ColumnarMetricsEngine:
+    def __init__(self, csv_path: Path, metrics_config: Dict, schema_card: Dict):
+        """
+        Args:
+            csv_path: Extracto Data.csv
+            metrics_config: Contenido de metrics_config.json (definiciones de métricas)
+            schema_card: Contenido de schema_card.json (tipos de columna)
+        """
+        self.csv_path = csv_path
+        self.definitions = metrics_config['definitions']
+        self.dimensions = metrics_config.get('dimensions', DEFAULT_DIMENSIONS)
+        self.column_types = {c['name']: c['type'] for c in schema_card['columns']}
+
+        self._saldos: Dict[str, np.ndarray] = {}
+        self._dimension_codes: Dict[str, np.ndarray] = {}
+        self._dimension_values: Dict[str, np.ndarray] = {}
+        self._metric_vectors: Dict[str, np.ndarray] = {}
+        self._memo: Dict[Tuple, Dict[str, Any]] = {}
+        self._memo_lock = threading.Lock()
+
+        self._load()
+
+    # ===== CARGA =====
+
+    def _load(self):
+        """Lee solo las columnas necesarias del CSV y las convierte a arrays tipados"""
+        with open(self.csv_path, 'r', encoding='utf-8', newline='') as f:
+            reader = csv.reader(f)
+            header = next(reader)
+
+            saldo_cols = [c for c in header if c.endswith('_SALDO')]
+            for tipo in ('captaciones', 'colocaciones'):
+                missing = [c for c in self.definitions[tipo] if c not in header]
+                if missing:
+                    raise ValueError(f"Columnas de {tipo} no encontradas en {self.csv_path.name}: {missing}")
+            dimensions = [d for d in self.dimensions if d in header]
+
+            positions = {name: header.index(name) for name in saldo_cols + dimensions}
+            raw: Dict[str, List[str]] = {name: [] for name in positions}
+            for row in reader:
+                for name, i in positions.items():
+                    raw[name].append(row[i] if i < len(row) else '')
+
+        self.n_clientes = len(next(iter(raw.values()), []))
+
+        for name in saldo_cols:
+            dtype = NUMERIC_DTYPES.get(self.column_types.get(name, 'real'), np.float64)
+            values = np.fromiter((_parse_number(v) for v in raw[name]), dtype=np.float64, count=self.n_clientes)
+            self._saldos[name] = values.astype(dtype, copy=False)
+
+        # Dimensiones como categorías: códigos enteros + tabla de valores
+        for name in dimensions:
+            values, codes = np.unique(np.asarray(raw[name], dtype=object).astype(str), return_inverse=True)
+            self._dimension_values[name] = values
+            self._dimension_codes[name] = codes.astype(np.int32)
+        self.dimensions = dimensions
+
+        # Vectores por cliente de cada métrica compuesta (una sola suma por fila)
+        captaciones = np.sum([self._saldos[c] for c in self.definitions['captaciones']], axis=0, dtype=np.float64)
+        colocaciones = np.sum([self._saldos[c] for c in self.definitions['colocaciones']], axis=0, dtype=np.float64)
+        self._metric_vectors = {
+            "captaciones": captaciones,
+            "colocaciones": colocaciones,
+            "neto": captaciones - colocaciones,
+        }
+
+        print(f"✓ Motor columnar cargado: {self.n_clientes} clientes, {len(saldo_cols)} columnas _SALDO, dimensiones {dimensions}")
+
+    # ===== CONSULTAS =====
+
+    @property
+    def metrics(self) -> List[str]:
+        """Métricas disponibles: compuestas + cada columna _SALDO"""
+        return list(self._metric_vectors) + list(self._saldos)
+
+    def dimension_values(self) -> Dict[str, List[str]]:
+        return {name: values.tolist() for name, values in self._dimension_values.items()}
+
+    def _vector(self, metric: str) -> np.ndarray:
+        if metric in self._metric_vectors:
+            return self._metric_vectors[metric]
+        if metric in self._saldos:
+            return self._saldos[metric]
+        raise ValueError(f"Métrica inválida: {metric}. Opciones: captaciones, colocaciones, neto o una columna _SALDO")
+
+    def _mask(self, filters: Dict[str, str]) -> Optional[np.ndarray]:
+        """Máscara booleana de igualdad por dimensión"""
+        if not filters:
+            return None
+        mask = np.ones(self.n_clientes, dtype=bool)
+        for name, value in filters.items():
+            if name not in self._dimension_codes:
+                raise ValueError(f"Dimensión inválida: {name}. Opciones: {self.dimensions}")
+            matches = np.flatnonzero(self._dimension_values[name] == value)
+            if len(matches) == 0:
+                return np.zeros(self.n_clientes, dtype=bool)
+            mask &= self._dimension_codes[name] == matches[0]
+        return mask
+
+    def aggregate(
+        self,
+        metric: str,
+        group_by: Optional[str] = None,
+        filters: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
+        """
+        Suma una métrica sobre los clientes que cumplen los filtros
+
+        Args:
+            metric: captaciones, colocaciones, neto o una columna _SALDO
+            group_by: Dimensión por la que desglosar (opcional)
+            filters: {dimensión: valor} por igualdad (p. ej. {"COD_PROMOTOR": "SEFE"})
+
+        Returns:
+            Dict con el total en CRC, n_clientes y, si hay group_by, el desglose por grupo
+        """
+        if metric.lower() in self._metric_vectors:
+            metric = metric.lower()
+        else:
+            metric = metric.upper()
+        filters = filters or {}
+        key = (metric, group_by, tuple(sorted(filters.items())))
+
+        cached = self._memo.get(key)
+        if cached is not None:
+            return cached
+
+        if group_by is not None and group_by not in self._dimension_codes:
+            raise ValueError(f"Dimensión inválida: {group_by}. Opciones: {self.dimensions}")
+
+        vector = self._vector(metric)
+        mask = self._mask(filters)
+        if mask is not None:
+            vector = vector[mask]
+
+        result: Dict[str, Any] = {
+            "metric": metric,
+            "crc": round(float(vector.sum()), 2),
+            "n_clientes": int(len(vector)),
+            "filters": filters,
+        }
+
+        if group_by is not None:
+            codes = self._dimension_codes[group_by]
+            if mask is not None:
+                codes = codes[mask]
+            n_groups = len(self._dimension_values[group_by])
+            sums = np.bincount(codes, weights=vector, minlength=n_groups)
+            counts = np.bincount(codes, minlength=n_groups)
+            order = np.argsort(-sums)
+            result["group_by"] = group_by
+            result["groups"] = [
+                {
+                    "value": str(self._dimension_values[group_by][i]),
+                    "crc": round(float(sums[i]), 2),
+                    "n_clientes": int(counts[i])
+                }
+                for i in order if counts[i] > 0
+            ]
+
+        with self._memo_lock:
+            # Los filtros vienen del request: acotar el memo ante valores arbitrarios
+            if len(self._memo) >= MAX_MEMO_ENTRIES:
+                self._memo.clear()
+            self._memo[key] = result
+        return result
+
+    def rollups(self) -> Dict[Tuple[str, Optional[str], Optional[str]], Tuple[float, int]]:
+        """
+        Todos los agregados de este extracto en una pasada (para el histórico de snapshot_store)
+
+        Returns:
+            {(métrica, dimensión, valor): (suma en CRC, n_clientes)}: totales de las métricas
+            compuestas y de cada columna _SALDO (dimensión y valor None), y las compuestas
+            desglosadas por cada valor de cada dimensión
+        """
+        rollups: Dict[Tuple[str, Optional[str], Optional[str]], Tuple[float, int]] = {}
+        for metric, vector in list(self._metric_vectors.items()) + list(self._saldos.items()):
+            rollups[(metric, None, None)] = (float(vector.sum(dtype=np.float64)), self.n_clientes)
+
+        for dimension in self.dimensions:
+            codes = self._dimension_codes[dimension]
+            values = self._dimension_values[dimension]
+            counts = np.bincount(codes, minlength=len(values))
+            for metric, vector in self._metric_vectors.items():
+                sums = np.bincount(codes, weights=vector, minlength=len(values))
+                for i, value in enumerate(values):
+                    rollups[(metric, dimension, str(value))] = (float(sums[i]), int(counts[i]))
+        return rollups
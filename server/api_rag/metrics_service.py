@@ -2,68 +2,323 @@
 Servicio de métricas de cartera bancaria.
 Calcula saldos (captaciones, colocaciones, neto) usando definiciones exactas de metrics_config.json
 """
+import hashlib
 import json
+import os
+import threading
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import Dict, List, Any, NamedTuple, Optional
+
+from data_snapshots import content_version
+from metrics_engine import ColumnarMetricsEngine
+from snapshot_store import SnapshotStore, extract_period, file_digest
+
+# Tipos de /metrics/saldo sin desglose (respuestas precalculadas)
+SALDO_TIPOS = ("neto", "captaciones", "colocaciones")
+
+
+class PrecomputedResponse(NamedTuple):
+    """Cuerpo JSON ya serializado + ETag fuerte de la versión de datos"""
+    body: bytes
+    etag: str
+
+
+def serialize_json(content: Any) -> bytes:
+    """Mismos bytes que JSONResponse de FastAPI"""
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":")
+    ).encode("utf-8")
+
+
+class MetricsSnapshot:
+    """
+    Versión inmutable de los datos de métricas
+    
+    Las peticiones toman una referencia al snapshot activo al empezar; una
+    recarga instala un snapshot nuevo sin afectar a las que están en curso.
+    """
+    
+    def __init__(self, data_dir: Path, csv_path: Optional[Path], version: str = None):
+        self.data_dir = data_dir
+        self.csv_path = csv_path
+        self.version = version
+        self.metrics_config = self._load_json("metrics_config.json")
+        self.portfolio_totals = self._load_json("portfolio_totals.json")
+        self.schema_card = self._load_json("schema_card.json")
+        
+        # Motor columnar sobre Data.csv (se carga en la primera consulta agregada)
+        self._engine: Optional[ColumnarMetricsEngine] = None
+        self._engine_lock = threading.Lock()
+        
+        # Respuestas fijas de esta versión (las llena MetricsService.precompute)
+        self.responses: Dict[str, PrecomputedResponse] = {}
+    
+    def _load_json(self, name: str) -> Dict:
+        with open(self.data_dir / name, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    @property
+    def engine(self) -> ColumnarMetricsEngine:
+        """Motor columnar (carga perezosa, una sola vez por snapshot)"""
+        if self._engine is None:
+            with self._engine_lock:
+                if self._engine is None:
+                    if self.csv_path is None:
+                        raise FileNotFoundError("No se encontró Data.csv (configura METRICS_DATA_CSV)")
+                    self._engine = ColumnarMetricsEngine(
+                        self.csv_path,
+                        self.metrics_config,
+                        self.schema_card
+                    )
+        return self._engine
+
+
+def find_data_csv(data_dir: Path, csv_path: Optional[str] = None) -> Optional[Path]:
+    """
+    Ubica el extracto Data.csv: csv_path explícito (METRICS_DATA_CSV), data/Data.csv
+    o el Data_*.csv más reciente en attached_assets/
+    """
+    if csv_path:
+        return Path(csv_path)
+    local = data_dir / "Data.csv"
+    if local.exists():
+        return local
+    assets = Path(__file__).resolve().parents[2] / "attached_assets"
+    candidates = sorted(assets.glob("Data_*.csv"))
+    return candidates[-1] if candidates else None
+
 
 class MetricsService:
-    def __init__(self, data_dir: str = "data"):
+    def __init__(self, data_dir: str = "data", csv_path: str = None, history_dir: str = None):
         self.data_dir = Path(__file__).parent / data_dir
-        self.metrics_config = self._load_metrics_config()
-        self.portfolio_totals = self._load_portfolio_totals()
+        self.csv_path = csv_path or os.getenv("METRICS_DATA_CSV")
+        # Histórico mensual de agregados (un snapshot por extracto de Data.csv)
+        self.history = SnapshotStore(
+            Path(__file__).parent / (history_dir or os.getenv("METRICS_HISTORY_DIR", "history"))
+        )
+        self._snapshot = MetricsSnapshot(
+            self.data_dir,
+            self._resolve_csv_path(),
+            version=content_version(self.data_paths())
+        )
+        self.precompute(self._snapshot)
+    
+    @property
+    def snapshot(self) -> MetricsSnapshot:
+        """Snapshot activo (referencia atómica)"""
+        return self._snapshot
+    
+    @property
+    def metrics_config(self) -> Dict:
+        return self._snapshot.metrics_config
+    
+    @property
+    def portfolio_totals(self) -> Dict:
+        return self._snapshot.portfolio_totals
+    
+    @property
+    def engine(self) -> ColumnarMetricsEngine:
+        return self._snapshot.engine
+    
+    def _resolve_csv_path(self) -> Optional[Path]:
+        return find_data_csv(self.data_dir, self.csv_path)
+    
+    def data_paths(self) -> List[Path]:
+        """Archivos que definen una versión de los datos de métricas"""
+        paths = [
+            self.data_dir / "metrics_config.json",
+            self.data_dir / "portfolio_totals.json",
+            self.data_dir / "schema_card.json"
+        ]
+        csv_path = self._resolve_csv_path()
+        if csv_path is not None:
+            paths.append(csv_path)
+        return paths
+    
+    def reload(self, version: str = None):
+        """
+        Construye un snapshot nuevo y lo activa
         
-    def _load_metrics_config(self) -> Dict:
-        """Carga la configuración de métricas"""
-        config_path = self.data_dir / "metrics_config.json"
-        with open(config_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        El motor columnar se carga antes del intercambio (si el snapshot actual
+        ya lo tenía cargado), así la primera consulta tras la recarga no paga
+        la lectura del CSV.
+        """
+        snapshot = MetricsSnapshot(self.data_dir, self._resolve_csv_path(), version=version)
+        if self._snapshot._engine is not None:
+            snapshot.engine
+            self.ingest_history(snapshot=snapshot)
+        self.precompute(snapshot)
+        self._snapshot = snapshot
     
-    def _load_portfolio_totals(self) -> Dict:
-        """Carga los totales del portafolio"""
-        totals_path = self.data_dir / "portfolio_totals.json"
-        with open(totals_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+    def precompute(self, snapshot: MetricsSnapshot):
+        """
+        Serializa una vez las respuestas que solo dependen de los archivos de datos
+        
+        /metrics/saldo (sin desglose), /metrics/saldo_por_producto y /metrics/summary
+        se sirven como bytes listos; el ETag cambia solo cuando cambia la versión.
+        """
+        variants = {f"saldo/{tipo}": self.get_saldo(tipo, snapshot=snapshot) for tipo in SALDO_TIPOS}
+        variants["saldo_por_producto"] = self.get_saldo_por_producto(snapshot=snapshot)
+        variants["summary"] = self.get_totals_summary(snapshot=snapshot)
+        
+        responses = {}
+        for key, content in variants.items():
+            body = serialize_json(content)
+            tag = snapshot.version or hashlib.sha256(body).hexdigest()[:12]
+            responses[key] = PrecomputedResponse(body, f'"{tag}-{key.replace("/", "-")}"')
+        snapshot.responses = responses
+    
+    def ingest_history(
+        self,
+        csv_path: Optional[str] = None,
+        period: Optional[str] = None,
+        snapshot: MetricsSnapshot = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Agrega un extracto al histórico si su contenido aún no está ingerido
+        
+        Sin csv_path usa el Data.csv del snapshot, reutilizando su motor columnar
+        ya cargado; un extracto anterior (backfill) se lee una única vez.
+        
+        Args:
+            csv_path: Extracto a ingerir (default: el del snapshot activo)
+            period: YYYY-MM (default: derivado del nombre o la fecha del archivo)
+            snapshot: Versión de los datos (default: la activa)
+            
+        Returns:
+            Entrada del snapshot agregado, o None si no hay extracto o ya estaba ingerido
+        """
+        snapshot = snapshot or self._snapshot
+        csv_path = Path(csv_path) if csv_path else snapshot.csv_path
+        if csv_path is None:
+            return None
+        digest = file_digest(csv_path)
+        if self.history.has_source(digest):
+            return None
+        
+        if snapshot.csv_path is not None and csv_path.resolve() == snapshot.csv_path.resolve():
+            engine = snapshot.engine
+        else:
+            engine = ColumnarMetricsEngine(csv_path, snapshot.metrics_config, snapshot.schema_card)
+        return self.history.ingest(
+            extract_period(csv_path, period),
+            engine.rollups(),
+            {"file": csv_path.name, "sha256": digest, "n_clientes": engine.n_clientes}
+        )
+    
+    def get_history(self) -> Dict[str, Any]:
+        """Periodos del histórico con sus totales"""
+        return self.history.get_periods()
     
-    def get_saldo(self, tipo: str) -> Dict[str, Any]:
+    def get_history_series(self, metric: str, filters: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """Serie de tiempo de una métrica desde los agregados del histórico (sin leer CSV)"""
+        return self.history.get_series(metric, filters=filters)
+    
+    def get_history_delta(
+        self,
+        metric: str,
+        period: Optional[str] = None,
+        group_by: Optional[str] = None,
+        filters: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
+        """Variación de un periodo contra el snapshot anterior (total o por dimensión)"""
+        return self.history.get_delta(metric, period=period, group_by=group_by, filters=filters)
+    
+    def get_precomputed(self, key: str) -> Optional[PrecomputedResponse]:
+        """Respuesta precalculada del snapshot activo (None si la variante no existe)"""
+        return self._snapshot.responses.get(key)
+    
+    def get_aggregate(
+        self,
+        metric: str,
+        group_by: Optional[str] = None,
+        filters: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
+        """
+        Agregado en vivo desde Data.csv
+        
+        Args:
+            metric: captaciones, colocaciones, neto o cualquier columna _SALDO
+            group_by: Dimensión (GERENCIA, COD_PROMOTOR, SEGMENTACION_ESTRATEGICA, PROVINCIA_DEFAULT)
+            filters: {dimensión: valor}, p. ej. {"COD_PROMOTOR": "SEFE"} para el slice de un ejecutivo
+            
+        Returns:
+            Dict con metric, crc, n_clientes, filters y (si aplica) groups
+        """
+        return self._snapshot.engine.aggregate(metric, group_by=group_by, filters=filters)
+    
+    def get_dimensions(self) -> Dict[str, Any]:
+        """Dimensiones disponibles con sus valores y métricas agregables"""
+        engine = self._snapshot.engine
+        return {
+            "dimensions": engine.dimension_values(),
+            "metrics": engine.metrics
+        }
+    
+    def get_saldo(
+        self,
+        tipo: str,
+        group_by: Optional[str] = None,
+        filters: Optional[Dict[str, str]] = None,
+        snapshot: MetricsSnapshot = None
+    ) -> Dict[str, Any]:
         """
         Calcula saldos según tipo (neto, captaciones, colocaciones)
         
         Args:
             tipo: Tipo de saldo ('neto', 'captaciones', 'colocaciones')
+            group_by: Dimensión de desglose (usa el motor columnar)
+            filters: {dimensión: valor} (usa el motor columnar)
+            snapshot: Versión de los datos (default: la activa)
             
         Returns:
             Dict con tipo, valor en CRC, y columnas utilizadas
         """
         tipo = tipo.lower()
+        snapshot = snapshot or self._snapshot
         
         if tipo not in ['neto', 'captaciones', 'colocaciones']:
             raise ValueError(f"Tipo inválido: {tipo}. Debe ser 'neto', 'captaciones' o 'colocaciones'")
         
-        definitions = self.metrics_config['definitions']
+        # Slices y desgloses se calculan en vivo; el total global sale de portfolio_totals.json
+        if group_by or filters:
+            result = snapshot.engine.aggregate(tipo, group_by=group_by, filters=filters)
+            result = {"tipo": tipo, **{k: v for k, v in result.items() if k != "metric"}}
+            if tipo != 'neto':
+                result["cols"] = snapshot.metrics_config['definitions'][tipo]
+            else:
+                result["formula"] = "captaciones - colocaciones"
+            return result
+        
+        definitions = snapshot.metrics_config['definitions']
         
         if tipo == 'captaciones':
             cols = definitions['captaciones']
-            valor_crc = self.portfolio_totals['captaciones_total_crc']
+            valor_crc = snapshot.portfolio_totals['captaciones_total_crc']
             return {
                 "tipo": "captaciones",
                 "crc": round(valor_crc, 2),
                 "cols": cols,
-                "n_clientes": self.portfolio_totals['n_clientes']
+                "n_clientes": snapshot.portfolio_totals['n_clientes']
             }
         
         elif tipo == 'colocaciones':
             cols = definitions['colocaciones']
-            valor_crc = self.portfolio_totals['colocaciones_total_crc']
+            valor_crc = snapshot.portfolio_totals['colocaciones_total_crc']
             return {
                 "tipo": "colocaciones",
                 "crc": round(valor_crc, 2),
                 "cols": cols,
-                "n_clientes": self.portfolio_totals['n_clientes']
+                "n_clientes": snapshot.portfolio_totals['n_clientes']
             }
         
         elif tipo == 'neto':
-            capt = self.portfolio_totals['captaciones_total_crc']
-            colo = self.portfolio_totals['colocaciones_total_crc']
+            capt = snapshot.portfolio_totals['captaciones_total_crc']
+            colo = snapshot.portfolio_totals['colocaciones_total_crc']
             neto = capt - colo
             return {
                 "tipo": "neto",
@@ -71,35 +326,37 @@ class MetricsService:
                 "formula": "captaciones - colocaciones",
                 "captaciones_crc": round(capt, 2),
                 "colocaciones_crc": round(colo, 2),
-                "n_clientes": self.portfolio_totals['n_clientes']
+                "n_clientes": snapshot.portfolio_totals['n_clientes']
             }
     
-    def get_saldo_por_producto(self) -> Dict[str, Any]:
+    def get_saldo_por_producto(self, snapshot: MetricsSnapshot = None) -> Dict[str, Any]:
         """
         Retorna desglose detallado por columna/producto
         
         Returns:
             Dict con desglose de captaciones y colocaciones por columna
         """
+        snapshot = snapshot or self._snapshot
         return {
             "captaciones": {
-                "cols_detectadas": self.portfolio_totals['cols_pasivas_detectadas'],
-                "definicion": self.metrics_config['definitions']['captaciones']
+                "cols_detectadas": snapshot.portfolio_totals['cols_pasivas_detectadas'],
+                "definicion": snapshot.metrics_config['definitions']['captaciones']
             },
             "colocaciones": {
-                "cols_detectadas": self.portfolio_totals['cols_activas_detectadas'],
-                "definicion": self.metrics_config['definitions']['colocaciones']
+                "cols_detectadas": snapshot.portfolio_totals['cols_activas_detectadas'],
+                "definicion": snapshot.metrics_config['definitions']['colocaciones']
             },
-            "n_clientes": self.portfolio_totals['n_clientes']
+            "n_clientes": snapshot.portfolio_totals['n_clientes']
         }
     
-    def get_totals_summary(self) -> Dict[str, Any]:
+    def get_totals_summary(self, snapshot: MetricsSnapshot = None) -> Dict[str, Any]:
         """Retorna resumen completo de todos los totales"""
+        snapshot = snapshot or self._snapshot
         return {
-            "captaciones_crc": round(self.portfolio_totals['captaciones_total_crc'], 2),
-            "colocaciones_crc": round(self.portfolio_totals['colocaciones_total_crc'], 2),
-            "neto_crc": round(self.portfolio_totals['saldo_neto_crc'], 2),
-            "n_clientes": self.portfolio_totals['n_clientes'],
-            "cols_captaciones": self.metrics_config['definitions']['captaciones'],
-            "cols_colocaciones": self.metrics_config['definitions']['colocaciones']
+            "captaciones_crc": round(snapshot.portfolio_totals['captaciones_total_crc'], 2),
+            "colocaciones_crc": round(snapshot.portfolio_totals['colocaciones_total_crc'], 2),
+            "neto_crc": round(snapshot.portfolio_totals['saldo_neto_crc'], 2),
+            "n_clientes": snapshot.portfolio_totals['n_clientes'],
+            "cols_captaciones": snapshot.metrics_config['definitions']['captaciones'],
+            "cols_colocaciones": snapshot.metrics_config['definitions']['colocaciones']
         }
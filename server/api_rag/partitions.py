@@ -0,0 +1,132 @@
+"""
+Particiones del índice por una dimensión de Data.csv (COD_PROMOTOR, GERENCIA...).
+Cada valor de la dimensión tiene su propio backend vectorial, índice BM25 y JSONL con
+solo sus clientes, así una búsqueda con `scope` recorre únicamente esa cartera y la
+reindexación de una partición no escribe en las demás.
+"""
+import csv
+import hashlib
+import json
+import os
+import re
+import unicodedata
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from indexing_pipeline import iter_jsonl
+
+# row_cards.jsonl numera los clientes por su fila en Data.csv (cli_00000 = primera fila)
+CLIENTE_ID_FORMAT = "cli_{:05d}"
+
+
+def partition_slug(value: str) -> str:
+    """Nombre seguro para colecciones y directorios (legible + hash corto contra colisiones)"""
+    ascii_value = unicodedata.normalize("NFKD", value).encode("ascii", "ignore").decode("ascii")
+    readable = re.sub(r"[^a-z0-9]+", "-", ascii_value.lower()).strip("-")[:40] or "p"
+    digest = hashlib.sha1(value.encode("utf-8")).hexdigest()[:8]
+    return f"{readable}-{digest}"
+
+
+def load_partition_map(
+    csv_path: Path,
+    dimension: str,
+    expected_ids: Optional[Iterable[str]] = None
+) -> Dict[str, str]:
+    """
+    {cliente_id: valor de la dimensión} leyendo solo esa columna de Data.csv
+
+    El cliente_id se deriva del número de fila (CLIENTE_ID_FORMAT): si Data.csv no
+    corresponde al row_cards.jsonl indexado, cada cliente caería en la partición de
+    otro. Con expected_ids se verifica que ambos tengan las mismas filas.
+
+    Args:
+        csv_path: Data.csv
+        dimension: Columna a leer
+        expected_ids: cliente_id del JSONL a particionar
+
+    Raises:
+        ValueError: si la columna no existe o las filas no coinciden con expected_ids
+    """
+    with open(csv_path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        if dimension not in header:
+            raise ValueError(f"La columna {dimension} no existe en {csv_path.name}")
+        column = header.index(dimension)
+        partition_map = {
+            CLIENTE_ID_FORMAT.format(i): (row[column].strip() if column < len(row) else "")
+            for i, row in enumerate(reader)
+        }
+
+    if expected_ids is not None:
+        expected = list(expected_ids)
+        unknown = [cliente_id for cliente_id in expected if cliente_id not in partition_map]
+        if len(expected) != len(partition_map) or unknown:
+            sample = f" (p. ej. {', '.join(unknown[:3])})" if unknown else ""
+            raise ValueError(
+                f"{csv_path.name} tiene {len(partition_map)} filas y el JSONL {len(expected)} clientes, "
+                f"{len(unknown)} sin fila {CLIENTE_ID_FORMAT.format(0)}..{CLIENTE_ID_FORMAT.format(len(partition_map) - 1)}"
+                f"{sample}: Data.csv no corresponde a los row_cards, no se puede particionar por {dimension}"
+            )
+    return partition_map
+
+
+def card_partition(card: Dict[str, Any], dimension: str, partition_map: Dict[str, str]) -> Optional[str]:
+    """Partición de un row_card: el campo en la tarjeta (raíz o perfil) tiene prioridad sobre Data.csv"""
+    value = card.get(dimension) or card.get("perfil", {}).get(dimension)
+    if value is None:
+        value = partition_map.get(card["cliente_id"])
+    return str(value) if value else None
+
+
+def split_jsonl(
+    jsonl_path: Path,
+    out_dir: Path,
+    assign: Callable[[Dict[str, Any]], Optional[str]]
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Reparte el JSONL en un archivo por partición (out_dir/<slug>/row_cards.jsonl)
+
+    Un archivo solo se reescribe si su contenido cambió: las particiones sin
+    cambios quedan intactas (mismo mtime, sin trabajo de reindexación).
+
+    Returns:
+        {valor: {"slug", "path", "cards", "changed"}}; las tarjetas sin partición se omiten
+    """
+    lines: Dict[str, list] = {}
+    for _, card in iter_jsonl(jsonl_path):
+        key = assign(card)
+        if key is not None:
+            lines.setdefault(key, []).append(json.dumps(card, ensure_ascii=False) + "\n")
+
+    result = {}
+    for key, partition_lines in lines.items():
+        slug = partition_slug(key)
+        path = out_dir / slug / "row_cards.jsonl"
+        content = "".join(partition_lines).encode("utf-8")
+        changed = not path.exists() or path.read_bytes() != content
+        if changed:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(".tmp")
+            tmp_path.write_bytes(content)
+            os.replace(tmp_path, path)
+        result[key] = {"slug": slug, "path": path, "cards": len(partition_lines), "changed": changed}
+    return result
+
+
+def load_manifest(path: Path) -> Dict[str, Any]:
+    """Manifiesto de particiones: {"dimension": ..., "partitions": {valor: {"slug", "cards"}}}"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"dimension": None, "partitions": {}}
+
+
+def save_manifest(path: Path, manifest: Dict[str, Any]):
+    """Escritura atómica (tmp + rename)"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
@@ -0,0 +1,273 @@
+"""
+Enrutador de preguntas para /ask.
+Clasifica cada pregunta en metric (saldos de cartera → MetricsService), schema (qué significa
+una columna o cómo se calcula una métrica → schema_card.json / metrics_config.json) o
+client_search (RAG + GPT-4). Solo las preguntas abiertas sobre clientes llegan al LLM.
+"""
+import re
+import unicodedata
+from typing import Any, Dict, List, Optional, Set
+
+from filters import extract_filters
+from lexical_index import tokenize
+
+METRIC = "metric"
+SCHEMA = "schema"
+CLIENT_SEARCH = "client_search"
+
+# Métricas compuestas de metrics_config.json y cómo se nombran en las preguntas
+_COMPOSITE_METRICS = {
+    "neto": re.compile(r"\b(saldo\s+neto|neto|posicion\s+neta)\b"),
+    "captaciones": re.compile(r"\b(captaciones|captacion|pasivos|depositos)\b"),
+    # "activos" solo como monto ("saldo de activos"): "clientes activos" es un conteo
+    "colocaciones": re.compile(r"\b(colocaciones|colocacion|cartera\s+activa|(saldos?|totale?s?|monto)\s+(de\s+)?(los\s+)?activos)\b"),
+}
+
+# Intención agregada: la pregunta pide un monto de la cartera, no clientes
+_AGGREGATE_INTENT = re.compile(r"\b(saldos?|totale?s?|monto|cuanto|cuantos|suma|agregado|cartera)\b")
+
+# Piden un valor ("¿cuánto...?", "total de..."): se intenta métrica antes que esquema
+_VALUE_INTENT = re.compile(r"\b(cual\s+es\s+el\s+(saldo|total|monto)|cuanto|totale?s?|suma|monto)\b")
+
+# Intención de búsqueda de clientes: piden clientes concretos, no un monto de la cartera
+# ("¿qué clientes tienen...?", "top 5 clientes por saldo", "clientes con..."; no
+# "¿cuántos clientes tiene la cartera?", que es un conteo)
+_CLIENT_INTENT = re.compile(
+    r"\b(clientes?\s+(con|que|cuy[oa]s?|tienen?(?!\s+(la\s+cartera|el\s+banco)\b)|segun)|perfil(es)?|quienes|"
+    r"(que|cuales|cual)\s+(son\s+)?((los|las|el|la)\s+)?clientes?|"
+    r"top\s*\d*\s+(de\s+)?(\d+\s+)?clientes?|\d+\s+clientes|ranking|"
+    r"clientes?\s+por\s+(saldo|monto|captacion|captaciones|colocacion|colocaciones|neto|activos|pasivos|ingresos?|edad)|"
+    r"recomienda\w*|oportunidad(es)?)\b"
+)
+
+# Ranking ("más", "mayor", "top"...): sin una dimensión de desglose, ordena clientes
+_RANKING_INTENT = re.compile(r"\b(top|mas|mayor(es)?|menor(es)?|mejores|peores|principales|primeros|ultimos)\b")
+
+_N_CLIENTES = re.compile(r"\bcuantos\s+clientes\b")
+
+_GROUP_BY = {
+    "GERENCIA": re.compile(r"\bpor\s+gerencias?\b"),
+    "COD_PROMOTOR": re.compile(r"\bpor\s+(ejecutiv[oa]s?|promotor(es)?)\b"),
+    "SEGMENTACION_ESTRATEGICA": re.compile(r"\bpor\s+(segmentos?|segmentacion)\b"),
+    "PROVINCIA_DEFAULT": re.compile(r"\bpor\s+provincias?\b"),
+}
+
+_SCHEMA_INTENT = re.compile(
+    r"\b(que\s+significa|significado|que\s+es|que\s+mide|que\s+incluye|descripcion|definicion|"
+    r"como\s+se\s+calcula|que\s+columnas|que\s+campos|que\s+variables|columna|campo|variable)\b"
+)
+
+# Palabras de las descripciones que no distinguen una columna _SALDO de otra
+_DESCRIPTION_NOISE = {"saldo", "dolare", "fecha", "corte", "correspondiente", "cuya", "moneda", "original"}
+
+MAX_GROUPS_IN_ANSWER = 10
+
+
+def _normalize(text: str) -> str:
+    """Minúsculas sin tildes ni puntuación (conserva stopwords: los patrones las usan)"""
+    text = "".join(
+        c for c in unicodedata.normalize("NFD", text.lower())
+        if unicodedata.category(c) != "Mn"
+    )
+    return " ".join(re.findall(r"[a-z0-9_]+", text))
+
+
+def _stem(token: str) -> str:
+    """Singular aproximado (créditos → credito) para comparar con las descripciones"""
+    return token[:-1] if len(token) > 3 and token.endswith("s") else token
+
+
+def _format_crc(value: float) -> str:
+    return f"CRC {value:,.2f}"
+
+
+class QueryRouter:
+    def __init__(self, metrics_service):
+        """
+        Args:
+            metrics_service: MetricsService (se lee su snapshot activo en cada pregunta)
+        """
+        self.metrics = metrics_service
+        self._schema_snapshot = None
+        self._columns: Dict[str, Dict[str, Any]] = {}
+        self._saldo_terms: Dict[str, Set[str]] = {}
+
+    def _schema(self):
+        """Índices derivados de schema_card.json (se recalculan si cambió el snapshot)"""
+        snapshot = self.metrics.snapshot
+        if snapshot is not self._schema_snapshot:
+            columns = {c["name"]: c for c in snapshot.schema_card["columns"]}
+            self._saldo_terms = {
+                name: {_stem(t) for t in tokenize(c.get("description", ""))} - _DESCRIPTION_NOISE
+                for name, c in columns.items() if name.endswith("_SALDO")
+            }
+            self._columns = columns
+            self._schema_snapshot = snapshot
+        return snapshot
+
+    # ===== CLASIFICACIÓN =====
+
+    def _mentioned_columns(self, query: str) -> List[str]:
+        """Nombres de columna de schema_card.json citados literalmente (TC_SALDO, edad...)"""
+        words = set(re.findall(r"[A-Za-z][A-Za-z0-9_]{2,}", query))
+        return [name for name in self._columns if name in words or ("_" in name and name.lower() in words)]
+
+    def _saldo_column(self, text: str) -> Optional[str]:
+        """Columna _SALDO cuya descripción queda cubierta por la pregunta (sin ambigüedad)"""
+        terms = {_stem(t) for t in text.split()}
+        covered = [
+            (len(desc), name) for name, desc in self._saldo_terms.items()
+            if desc and desc <= terms
+        ]
+        if not covered:
+            return None
+        covered.sort(reverse=True)
+        if len(covered) > 1 and covered[0][0] == covered[1][0]:
+            return None
+        return covered[0][1]
+
+    def _dimension_filters(self, text: str, snapshot) -> Dict[str, str]:
+        """Valores de dimensión mencionados en la pregunta (p. ej. "prioritario plus", "SEFE")"""
+        found: Dict[str, str] = {}
+        padded = f" {text} "
+        for dimension, values in snapshot.engine.dimension_values().items():
+            # El valor más largo primero: "masivo plus" antes que "masivo"
+            for value in sorted(values, key=len, reverse=True):
+                normalized = _normalize(value)
+                if len(normalized) >= 3 and f" {normalized} " in padded:
+                    found[dimension] = value
+                    break
+        return found
+
+    def route(self, query: str) -> Dict[str, Any]:
+        """
+        Clasifica y, si no hace falta el LLM, responde la pregunta
+
+        Returns:
+            {"route": "metric"|"schema", "answer": str, "data": dict} o
+            {"route": "client_search"} si la pregunta debe ir a RAG + GPT-4
+        """
+        snapshot = self._schema()
+        text = _normalize(query)
+
+        stages = [self._route_schema, self._route_metric]
+        if _VALUE_INTENT.search(text):
+            stages.reverse()
+        for stage in stages:
+            routed = stage(query, text, snapshot)
+            if routed is not None:
+                return routed
+        return {"route": CLIENT_SEARCH}
+
+    # ===== ESQUEMA =====
+
+    def _route_schema(self, query: str, text: str, snapshot) -> Optional[Dict[str, Any]]:
+        if not _SCHEMA_INTENT.search(text):
+            return None
+
+        definitions = snapshot.metrics_config["definitions"]
+        columns = self._mentioned_columns(query)
+        if not columns:
+            column = self._saldo_column(text)
+            columns = [column] if column else []
+
+        if columns:
+            described = [self._columns[name] for name in columns]
+            answer = "\n".join(
+                f"{c['name']} ({c['type']}, {c['category']}): {c['description']}" for c in described
+            )
+            return {
+                "route": SCHEMA,
+                "answer": answer,
+                "data": {"columns": [{k: c.get(k) for k in ("name", "type", "category", "description")} for c in described]}
+            }
+
+        for metric, pattern in _COMPOSITE_METRICS.items():
+            if pattern.search(text):
+                definition = definitions[metric]
+                if isinstance(definition, list):
+                    answer = f"{metric.capitalize()} = suma de " + ", ".join(definition)
+                else:
+                    answer = f"{metric.capitalize()} = {definition}"
+                return {"route": SCHEMA, "answer": answer, "data": {"metric": metric, "definition": definition}}
+
+        # "¿qué columnas hay de riesgo?" → columnas de esa categoría
+        categories = {c["category"] for c in self._columns.values()}
+        for category in sorted(categories):
+            if _normalize(category) and f" {_normalize(category)} " in f" {text} ":
+                names = [c["name"] for c in self._columns.values() if c["category"] == category]
+                return {
+                    "route": SCHEMA,
+                    "answer": f"Columnas de {category}: " + ", ".join(names),
+                    "data": {"category": category, "columns": names}
+                }
+        return None
+
+    # ===== MÉTRICAS =====
+
+    def _route_metric(self, query: str, text: str, snapshot) -> Optional[Dict[str, Any]]:
+        composite = next((m for m, pattern in _COMPOSITE_METRICS.items() if pattern.search(text)), None)
+        # "¿Cuántos clientes...?" es un conteo, nunca un monto en CRC; contar clientes
+        # con un producto ("¿cuántos clientes con colocaciones?") no está en las métricas
+        count = _N_CLIENTES.search(text) is not None
+        if count and composite is not None:
+            return None
+        if (composite is None and not _AGGREGATE_INTENT.search(text)) or _CLIENT_INTENT.search(text):
+            return None
+        group_by = next((d for d, pattern in _GROUP_BY.items() if pattern.search(text)), None)
+        if _RANKING_INTENT.search(text) and group_by is None:
+            return None
+        # Restricciones de perfil (edad, sexo, ingreso...) no existen en las métricas
+        if extract_filters(query):
+            return None
+
+        metric = "n_clientes" if count else composite
+        if metric is None:
+            metric = next((c for c in self._mentioned_columns(query) if c.endswith("_SALDO")), None)
+        if metric is None:
+            metric = self._saldo_column(text)
+        if metric is None:
+            return None
+
+        try:
+            filters = self._dimension_filters(text, snapshot) if snapshot.csv_path else {}
+            if metric in ("neto", "captaciones", "colocaciones") and not group_by and not filters:
+                data = self.metrics.get_saldo(metric)
+            else:
+                data = self.metrics.get_aggregate(
+                    "neto" if metric == "n_clientes" else metric,
+                    group_by=group_by,
+                    filters=filters
+                )
+        except (FileNotFoundError, ValueError):
+            # Sin Data.csv (o dimensión no disponible) no se puede responder sin el LLM
+            return None
+
+        return {"route": METRIC, "answer": self._describe(metric, data), "data": data}
+
+    @staticmethod
+    def _describe(metric: str, data: Dict[str, Any]) -> str:
+        """Respuesta en texto a partir del resultado de MetricsService"""
+        scope = ""
+        if data.get("filters"):
+            scope = " (" + ", ".join(f"{k}={v}" for k, v in data["filters"].items()) + ")"
+
+        if metric == "n_clientes":
+            answer = f"La cartera{scope} tiene {data['n_clientes']:,} clientes."
+        else:
+            labels = {"neto": "Saldo neto", "captaciones": "Captaciones", "colocaciones": "Colocaciones"}
+            label = labels.get(metric, f"Saldo {metric}")
+            answer = f"{label} de la cartera{scope}: {_format_crc(data['crc'])} ({data['n_clientes']:,} clientes)."
+            if metric == "neto" and "captaciones_crc" in data:
+                answer += (
+                    f" Captaciones {_format_crc(data['captaciones_crc'])}"
+                    f" − colocaciones {_format_crc(data['colocaciones_crc'])}."
+                )
+
+        if data.get("groups"):
+            lines = [
+                f"- {g['value']}: {_format_crc(g['crc'])} ({g['n_clientes']:,} clientes)"
+                for g in data["groups"][:MAX_GROUPS_IN_ANSWER]
+            ]
+            answer += f"\nPor {data['group_by']}:\n" + "\n".join(lines)
+        return answer
@@ -1,228 +1,1195 @@
 """
 Servicio RAG (Retrieval-Augmented Generation) para consultas sobre clientes.
-Usa ChromaDB + OpenAI embeddings para búsqueda semántica sobre row_cards.jsonl
+Usa OpenAI embeddings + un backend vectorial (ChromaDB o NumPy mmap) para búsqueda
+semántica sobre row_cards.jsonl
 """
+import asyncio
+import hashlib
 import json
 import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Any
-import chromadb
-from chromadb.config import Settings
-from openai import OpenAI
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, OpenAI, RateLimitError
+
+from admission import AdmissionController, Overloaded, admitted_call, call_with_retries
+from answer_cache import SemanticAnswerCache
+from context_builder import ContextBuilder, count_message_tokens, format_card
+from embedding_cache import EmbeddingCache, normalize_text
+from filters import FilterError, extract_filters, merge_filters
+from indexing_pipeline import RETRYABLE_ERRORS, IndexingPipeline, iter_jsonl
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from metrics_service import find_data_csv
+from partitions import card_partition, load_manifest, load_partition_map, partition_slug, save_manifest, split_jsonl
+from single_flight import SingleFlight
+from telemetry import observe_stage, record_cache, record_usage, span
+from vector_store import create_vector_store
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+CHAT_MODEL = "gpt-4o"
+
+SYSTEM_PROMPT = """Eres un asistente bancario especializado. 
+Responde SOLO basándote en la información de los clientes proporcionados.
+Si no hay suficiente información, di "no disponible en los datos proporcionados".
+Cita siempre los cliente_id cuando sea relevante.
+Sé conciso y preciso."""
+
+# vector: solo embeddings; hybrid: embeddings + BM25 fusionados por RRF; lexical: solo BM25 (sin red)
+RETRIEVAL_MODES = ("vector", "hybrid", "lexical")
+
+# Fallos de embeddings que degradan la recuperación a solo léxica (en vez de fallar)
+EMBEDDING_FALLBACK_ERRORS = RETRYABLE_ERRORS + (Overloaded,)
 
 class RAGService:
     def __init__(
         self, 
         data_dir: str = "data",
         chroma_dir: str = "rag_cartera",
-        openai_api_key: str = None
+        cache_dir: str = "rag_cache",
+        openai_api_key: str = None,
+        max_connections: int = None,
+        chroma_workers: int = None,
+        sync_on_startup: bool = None,
+        vector_backend: str = None,
+        vector_quantization: str = None,
+        numpy_dir: str = "rag_numpy",
+        partition_by: str = None,
+        openai_base_url: str = None,
+        openai_client: OpenAI = None,
+        async_openai_client: AsyncOpenAI = None
     ):
+        """
+        Args:
+            data_dir, chroma_dir, cache_dir, numpy_dir: Rutas relativas a este archivo (o absolutas)
+            vector_quantization: none o int8 (default RAG_VECTOR_QUANTIZATION; solo backend numpy)
+            partition_by: Columna de Data.csv para particionar el índice (default RAG_PARTITION_BY;
+                vacío = solo índice global)
+            openai_api_key: Default AI_INTEGRATIONS_OPENAI_API_KEY
+            openai_base_url: API compatible con OpenAI (default RAG_OPENAI_BASE_URL; p. ej. fake_openai.py)
+            openai_client, async_openai_client: Clientes ya construidos (tests/benchmarks);
+                si se pasan ambos no hace falta API key
+        """
         self.data_dir = Path(__file__).parent / data_dir
         self.chroma_dir = Path(__file__).parent / chroma_dir
+        self.cache_dir = Path(__file__).parent / cache_dir
+        self.numpy_dir = Path(__file__).parent / numpy_dir
         
         # Configurar cliente OpenAI
         self.openai_api_key = openai_api_key or os.getenv("AI_INTEGRATIONS_OPENAI_API_KEY")
-        if not self.openai_api_key:
+        if not self.openai_api_key and (openai_client is None or async_openai_client is None):
             raise ValueError("OPENAI_API_KEY no encontrada. Configura AI_INTEGRATIONS_OPENAI_API_KEY en Secrets")
+        openai_base_url = openai_base_url or os.getenv("RAG_OPENAI_BASE_URL") or None
+        
+        self.openai_client = openai_client or OpenAI(api_key=self.openai_api_key, base_url=openai_base_url)
+        
+        # Cliente asíncrono con pool de conexiones HTTP (keep-alive) para /ask
+        max_connections = max_connections or int(os.getenv("RAG_HTTP_MAX_CONNECTIONS", "20"))
+        # Sin reintentos del SDK: los hace call_with_retries (con jitter y bajo admisión);
+        # el cliente síncrono (scripts e indexación) conserva los reintentos del SDK
+        self.async_openai_client = async_openai_client or AsyncOpenAI(
+            api_key=self.openai_api_key,
+            base_url=openai_base_url,
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_connections
+                )
+            )
+        )
+        
+        # Admisión hacia OpenAI: llamadas en vuelo, cola y espera acotadas (503 si se exceden)
+        max_queue = int(os.getenv("RAG_ADMISSION_QUEUE", "64"))
+        max_wait_s = float(os.getenv("RAG_ADMISSION_MAX_WAIT_S", "10"))
+        self.embedding_admission = AdmissionController(
+            "embedding", int(os.getenv("RAG_EMBED_CONCURRENCY", "16")), max_queue, max_wait_s
+        )
+        self.chat_admission = AdmissionController(
+            "chat", int(os.getenv("RAG_CHAT_CONCURRENCY", "16")), max_queue, max_wait_s
+        )
+        self.openai_max_retries = int(os.getenv("RAG_OPENAI_MAX_RETRIES", "3"))
         
-        self.openai_client = OpenAI(api_key=self.openai_api_key)
+        # Pool acotado de hilos para las llamadas bloqueantes al backend vectorial
+        chroma_workers = chroma_workers or int(os.getenv("RAG_CHROMA_WORKERS", "4"))
+        self._chroma_executor = ThreadPoolExecutor(
+            max_workers=chroma_workers,
+            thread_name_prefix="chroma"
+        )
+        
+        # Caché de embeddings (LRU en memoria + SQLite en disco)
+        self.embedding_cache = EmbeddingCache(
+            self.cache_dir,
+            max_entries=int(os.getenv("RAG_EMBED_CACHE_SIZE", "10000")),
+            ttl_seconds=float(os.getenv("RAG_EMBED_CACHE_TTL", str(7 * 24 * 3600)))
+        )
         
-        # Configurar ChromaDB persistente
-        self.chroma_client = chromadb.PersistentClient(
-            path=str(self.chroma_dir),
-            settings=Settings(anonymized_telemetry=False)
+        # Caché semántica de respuestas de GPT-4 (se invalida cuando cambia el índice)
+        self.index_version = 0
+        self.answer_cache = SemanticAnswerCache(
+            max_entries=int(os.getenv("RAG_ANSWER_CACHE_SIZE", "1000")),
+            ttl_seconds=float(os.getenv("RAG_ANSWER_CACHE_TTL", "3600")),
+            threshold=float(os.getenv("RAG_ANSWER_CACHE_THRESHOLD", "0.95")),
+            index_version=self.index_version
         )
         
+        # Índice léxico BM25 (búsqueda híbrida y modo sin red)
+        self.retrieval_mode = os.getenv("RAG_RETRIEVAL_MODE", "hybrid")
+        if self.retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"RAG_RETRIEVAL_MODE inválido: {self.retrieval_mode}. Opciones: {RETRIEVAL_MODES}")
+        self.lexical_index = BM25Index(self.cache_dir / "lexical_index.npz")
+        
+        # Contexto para GPT-4: MMR + deduplicación + presupuesto de tokens
+        self.context_builder = ContextBuilder()
+        
+        # Coalescing de peticiones idénticas concurrentes (embeddings y respuestas)
+        self._single_flight = SingleFlight()
+        
         # Nombre de la colección
         self.collection_name = "clientes_cartera"
         
-        # Cargar o crear colección
-        self.collection = self._get_or_create_collection()
+        # Backend vectorial: ChromaDB persistente (default) o NumPy memory-mapped
+        self.vector_backend = vector_backend or os.getenv("RAG_VECTOR_BACKEND", "chroma")
+        # Barrido con copia int8 en memoria + re-puntuado exacto (solo numpy)
+        self.vector_quantization = vector_quantization or os.getenv("RAG_VECTOR_QUANTIZATION", "none")
+        self.rescore_factor = int(os.getenv("RAG_RESCORE_FACTOR", "4"))
+        self.vector_store = create_vector_store(
+            self.vector_backend,
+            chroma_dir=self.chroma_dir,
+            numpy_dir=self.numpy_dir,
+            collection_name=self.collection_name,
+            quantization=self.vector_quantization,
+            rescore_factor=self.rescore_factor
+        )
+        
+        # Particiones por dimensión de Data.csv (además del índice global)
+        self.partition_by = partition_by or os.getenv("RAG_PARTITION_BY") or None
+        self.partitions_dir = self.cache_dir / "partitions"
+        self._manifest = load_manifest(self.partitions_dir / "manifest.json")
+        self._partition_stores: Dict[str, Tuple[Any, BM25Index]] = {}
+        self._partition_lock = threading.Lock()
         
-        # Indexar si es necesario
+        # Sincronizar índice con row_cards.jsonl (solo cambios)
+        if sync_on_startup is None:
+            sync_on_startup = os.getenv("RAG_SYNC_ON_STARTUP", "1") != "0"
+        self.sync_on_startup = sync_on_startup
+        self._sync_lock = threading.Lock()
         self._ensure_indexed()
     
-    def _get_or_create_collection(self):
-        """Obtiene la colección existente o crea una nueva"""
-        try:
-            # Intentar obtener colección existente
-            collection = self.chroma_client.get_collection(name=self.collection_name)
-            print(f"✓ Colección '{self.collection_name}' encontrada")
-            return collection
-        except Exception:
-            # Crear nueva colección
-            print(f"→ Creando colección '{self.collection_name}'...")
-            return self.chroma_client.create_collection(
-                name=self.collection_name,
-                metadata={"description": "Resúmenes de clientes bancarios para RAG"}
-            )
-    
     def _load_row_cards(self) -> List[Dict]:
         """Carga todos los row_cards desde el archivo JSONL"""
-        row_cards = []
-        jsonl_path = self.data_dir / "row_cards.jsonl"
-        
-        with open(jsonl_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                if line.strip():
-                    row_cards.append(json.loads(line))
-        
-        return row_cards
+        return [card for _, card in iter_jsonl(self.data_dir / "row_cards.jsonl")]
+    
+    @staticmethod
+    def _card_hash(card: Dict) -> str:
+        """Hash del contenido de un row_card (detecta ediciones en el JSONL)"""
+        canonical = json.dumps(card, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+    
+    def _card_metadata(self, card: Dict, content_hash: str) -> Dict[str, Any]:
+        """Metadata útil para filtrado + hash de contenido para reindexación incremental"""
+        return {
+            "cliente_id": card['cliente_id'],
+            "sexo": card['perfil'].get('sexo', 'UNKNOWN'),
+            "edad": card['perfil'].get('edad', 0),
+            "ingreso": card['perfil'].get('ingreso', 0),
+            "sector_publico": card['perfil'].get('sector_publico_flag', 0),
+            "content_hash": content_hash
+        }
     
     def _ensure_indexed(self):
         """Asegura que los row_cards estén indexados en ChromaDB"""
-        # Verificar si ya hay documentos
-        count = self.collection.count()
+        count = self.vector_store.count()
         
-        if count > 0:
+        if count > 0 and not self.sync_on_startup:
             print(f"✓ Colección ya indexada con {count} documentos")
+            if self.lexical_index.count() == 0:
+                self.build_lexical_index()
+            if self.partition_by and self._manifest.get("dimension") != self.partition_by:
+                with self._sync_lock:
+                    self._sync_partitions(self.data_dir / "row_cards.jsonl")
             return
         
-        print("→ Indexando row_cards.jsonl...")
-        row_cards = self._load_row_cards()
+        self.sync_index()
+    
+    def sync_index(self, jsonl_path: Path = None, **pipeline_options) -> Dict[str, Any]:
+        """
+        Reindexación incremental por hash de contenido
         
-        # Preparar datos para indexación por lotes
-        ids = []
-        documents = []
-        metadatas = []
+        Compara el hash de cada row_card contra el guardado en la metadata de
+        ChromaDB: solo los clientes nuevos o modificados se re-embeben y se
+        hace upsert; los que ya no están en el JSONL se eliminan. El trabajo
+        lo hace IndexingPipeline (streaming, lotes en paralelo, checkpoint).
         
-        for card in row_cards:
-            ids.append(card['cliente_id'])
-            documents.append(card['resumen'])
-            
-            # Metadata útil para filtrado
-            metadata = {
-                "cliente_id": card['cliente_id'],
-                "sexo": card['perfil'].get('sexo', 'UNKNOWN'),
-                "edad": card['perfil'].get('edad', 0),
-                "ingreso": card['perfil'].get('ingreso', 0),
-                "sector_publico": card['perfil'].get('sector_publico_flag', 0)
-            }
-            metadatas.append(metadata)
+        Args:
+            jsonl_path: JSONL a indexar (por defecto data/row_cards.jsonl)
+            **pipeline_options: batch_size, concurrency, requests_per_minute, max_retries
         
-        # Indexar en lotes
-        batch_size = 100
-        total_batches = (len(ids) + batch_size - 1) // batch_size
+        Returns:
+            Reporte con added, updated, deleted, unchanged, elapsed_s y throughput
+        """
+        jsonl_path = Path(jsonl_path) if jsonl_path else self.data_dir / "row_cards.jsonl"
         
-        for i in range(0, len(ids), batch_size):
-            batch_ids = ids[i:i+batch_size]
-            batch_docs = documents[i:i+batch_size]
-            batch_metas = metadatas[i:i+batch_size]
-            
-            # Generar embeddings con OpenAI
-            embeddings = self._get_embeddings(batch_docs)
+        with self._sync_lock:
+            print(f"→ Sincronizando {jsonl_path.name} con el índice ({self.vector_backend})...")
+            try:
+                report = IndexingPipeline(self, **pipeline_options).run(jsonl_path)
+            except Exception:
+                # Pudieron quedar escritos algunos lotes antes del error
+                self._bump_index_version()
+                raise
+            if report['added'] or report['updated'] or report['deleted']:
+                self._bump_index_version()
+                self.build_lexical_index(jsonl_path)
+            elif self.lexical_index.count() == 0:
+                self.build_lexical_index(jsonl_path)
             
-            # Agregar a ChromaDB
-            self.collection.add(
-                ids=batch_ids,
-                documents=batch_docs,
-                embeddings=embeddings,
-                metadatas=batch_metas
+            if self.partition_by:
+                report["partitions"] = self._sync_partitions(jsonl_path, **pipeline_options)
+        
+        print(
+            f"✓ Sincronización completada: {report['added']} nuevos, {report['updated']} actualizados, "
+            f"{report['deleted']} eliminados, {report['unchanged']} sin cambios "
+            f"({report['throughput']['docs_per_s']} docs/s)"
+        )
+        return report
+    
+    def build_lexical_index(self, jsonl_path: Path = None, lexical_index: BM25Index = None):
+        """Reconstruye el índice BM25 desde el JSONL (solo CPU local, sin embeddings)"""
+        jsonl_path = Path(jsonl_path) if jsonl_path else self.data_dir / "row_cards.jsonl"
+        lexical_index = lexical_index or self.lexical_index
+        start = time.perf_counter()
+        lexical_index.build(
+            (card, self._card_metadata(card, self._card_hash(card)))
+            for _, card in iter_jsonl(jsonl_path)
+        )
+        print(f"✓ Índice léxico reconstruido en {(time.perf_counter() - start) * 1000:.0f} ms")
+    
+    # ===== PARTICIONES =====
+    
+    def index_source_paths(self) -> List[Path]:
+        """Archivos de los que depende el índice (row_cards.jsonl y, si se particiona, Data.csv)"""
+        paths = [self.data_dir / "row_cards.jsonl"]
+        csv_path = find_data_csv(self.data_dir, os.getenv("METRICS_DATA_CSV")) if self.partition_by else None
+        if csv_path is not None:
+            paths.append(csv_path)
+        return paths
+    
+    def _sync_partitions(self, jsonl_path: Path, **pipeline_options) -> Dict[str, Any]:
+        """
+        Reparte el JSONL por partición y sincroniza solo las que cambiaron
+        
+        Los embeddings salen de la caché (mismo texto que el índice global), así
+        que una partición nueva no vuelve a pagar llamadas a OpenAI. Las particiones
+        que desaparecen se borran (colección de Chroma o directorio NumPy, BM25 y JSONL).
+        
+        Returns:
+            {"dimension", "partitions": {valor: reporte o "unchanged"}, "removed": [...]}
+        
+        Raises:
+            ValueError: si Data.csv no tiene las mismas filas que el JSONL (ver load_partition_map)
+        """
+        csv_path = find_data_csv(self.data_dir, os.getenv("METRICS_DATA_CSV"))
+        partition_map = {}
+        if csv_path:
+            partition_map = load_partition_map(
+                csv_path,
+                self.partition_by,
+                expected_ids=(card["cliente_id"] for _, card in iter_jsonl(jsonl_path))
             )
-            
-            batch_num = (i // batch_size) + 1
-            print(f"  Lote {batch_num}/{total_batches} indexado ({len(batch_ids)} docs)")
+        split = split_jsonl(
+            jsonl_path,
+            self.partitions_dir,
+            lambda card: card_partition(card, self.partition_by, partition_map)
+        )
+        if not split:
+            print(f"⚠ Ningún cliente tiene valor de {self.partition_by}; no se crearon particiones")
         
-        print(f"✓ Indexación completada: {len(ids)} clientes")
+        # El manifiesto activo no cambia hasta terminar de indexar: una partición
+        # nueva no es consultable (ni se cachean sus stores) mientras se construye
+        previous = self._manifest.get("partitions", {})
+        active = previous if self._manifest.get("dimension") == self.partition_by else {}
+        opened: Dict[str, Tuple[Any, BM25Index]] = {}
+        reports = {}
+        for key, info in split.items():
+            if key in active:
+                stores = self._stores(key)
+            else:
+                stores = opened[key] = self._open_partition(key)
+            vector_store, lexical_index = stores
+            if not info["changed"] and vector_store.count() > 0 and lexical_index.count() > 0:
+                reports[key] = "unchanged"
+                continue
+            report = IndexingPipeline(
+                self,
+                checkpoint_path=self.partitions_dir / info["slug"] / "index_checkpoint.json",
+                vector_store=vector_store,
+                **pipeline_options
+            ).run(info["path"])
+            if report['added'] or report['updated'] or report['deleted'] or lexical_index.count() == 0:
+                self.build_lexical_index(info["path"], lexical_index)
+            reports[key] = {k: report[k] for k in ("added", "updated", "deleted", "unchanged", "elapsed_s")}
+        
+        manifest = {
+            "dimension": self.partition_by,
+            "partitions": {key: {"slug": info["slug"], "cards": info["cards"]} for key, info in split.items()}
+        }
+        removed = [key for key in previous if key not in split]
+        with self._partition_lock:
+            self._partition_stores.update(opened)
+            dropped = [self._partition_stores.pop(key, None) for key in removed]
+            self._manifest = manifest
+        save_manifest(self.partitions_dir / "manifest.json", manifest)
+        
+        # Borrar el almacenamiento de las particiones que desaparecieron
+        for key, stores in zip(removed, dropped):
+            vector_store = stores[0] if stores else self._open_partition(key)[0]
+            vector_store.drop()
+            shutil.rmtree(self.partitions_dir / partition_slug(key), ignore_errors=True)
+        
+        synced = sum(1 for r in reports.values() if r != "unchanged")
+        print(f"✓ Particiones por {self.partition_by}: {len(split)} ({synced} sincronizadas, {len(removed)} eliminadas)")
+        return {"dimension": self.partition_by, "partitions": reports, "removed": removed}
+    
+    def _open_partition(self, key: str) -> Tuple[Any, BM25Index]:
+        slug = partition_slug(key)
+        vector_store = create_vector_store(
+            self.vector_backend,
+            chroma_dir=self.chroma_dir,
+            numpy_dir=self.partitions_dir / slug / "numpy",
+            collection_name=f"{self.collection_name}__{slug}",
+            quantization=self.vector_quantization,
+            rescore_factor=self.rescore_factor
+        )
+        return vector_store, BM25Index(self.partitions_dir / slug / "lexical_index.npz")
+    
+    def _stores(self, scope: Optional[str]) -> Tuple[Any, BM25Index]:
+        """
+        (backend vectorial, índice BM25) de la partición `scope`, o los globales si es None
+        
+        Raises:
+            FilterError: scope sin RAG_PARTITION_BY o partición inexistente
+        """
+        if scope is None:
+            return self.vector_store, self.lexical_index
+        stores = self._partition_stores.get(scope)
+        if stores is not None:
+            return stores
+        if not self.partition_by:
+            raise FilterError("scope requiere un índice particionado (configura RAG_PARTITION_BY)")
+        if scope not in self._manifest["partitions"]:
+            raise FilterError(f"No existe la partición {self.partition_by}={scope}")
+        with self._partition_lock:
+            stores = self._partition_stores.get(scope)
+            if stores is None:
+                stores = self._partition_stores[scope] = self._open_partition(scope)
+        return stores
+    
+    async def _astores(self, scope: Optional[str]) -> Tuple[Any, BM25Index]:
+        """Como _stores; la primera apertura de una partición corre en el pool de hilos"""
+        if scope is None or scope in self._partition_stores:
+            return self._stores(scope)
+        return await self._run_in_chroma_pool(self._stores, scope)
+    
+    async def acheck_scope(self, scope: Optional[str]):
+        """Valida `scope` antes de abrir un stream (FilterError si no existe la partición)"""
+        await self._astores(scope)
+    
+    def partition_keys(self) -> List[str]:
+        """Valores de RAG_PARTITION_BY con partición construida"""
+        return sorted(self._manifest["partitions"]) if self.partition_by else []
+    
+    def _bump_index_version(self):
+        """El contenido del índice cambió: las respuestas cacheadas dejan de ser válidas"""
+        self.index_version += 1
+        self.answer_cache.invalidate(self.index_version)
     
     def _get_embeddings(self, texts: List[str]) -> List[List[float]]:
-        """Genera embeddings usando OpenAI text-embedding-3-small"""
-        response = self.openai_client.embeddings.create(
-            model="text-embedding-3-small",
-            input=texts
+        """
+        Genera embeddings usando OpenAI text-embedding-3-small
+        
+        Consulta primero la caché; solo los textos no cacheados viajan a OpenAI.
+        Ruta síncrona (search, ask_with_gpt, IndexingPipeline): no pasa por el
+        control de admisión, que vive en el event loop de la API; los reintentos
+        son los del SDK (y los de IndexingPipeline, que además limita RPM).
+        """
+        return self._embed_with_usage(texts)[0]
+    
+    def _embed_with_usage(self, texts: List[str]) -> Tuple[List[List[float]], int]:
+        """Como _get_embeddings, pero retorna también los tokens facturados por OpenAI"""
+        embeddings = self.embedding_cache.get_many(EMBEDDING_MODEL, texts)
+        missing = [i for i, e in enumerate(embeddings) if e is None]
+        record_cache("embedding", len(texts) - len(missing), len(missing))
+        tokens = 0
+        
+        if missing:
+            response = self.openai_client.embeddings.create(
+                model=EMBEDDING_MODEL,
+                input=[texts[i] for i in missing]
+            )
+            self._fill_missing(texts, embeddings, missing, response)
+            record_usage(EMBEDDING_MODEL, response.usage)
+            tokens = response.usage.total_tokens if response.usage else 0
+        
+        return embeddings, tokens
+    
+    async def _aget_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Versión asíncrona de _get_embeddings (no bloquea el event loop)"""
+        embeddings = self.embedding_cache.get_many(EMBEDDING_MODEL, texts)
+        missing = [i for i, e in enumerate(embeddings) if e is None]
+        record_cache("embedding", len(texts) - len(missing), len(missing))
+        
+        if missing:
+            response = await self._acall_openai(
+                lambda: self.async_openai_client.embeddings.create(
+                    model=EMBEDDING_MODEL,
+                    input=[texts[i] for i in missing]
+                ),
+                "embedding",
+                self.embedding_admission
+            )
+            self._fill_missing(texts, embeddings, missing, response)
+            record_usage(EMBEDDING_MODEL, response.usage)
+        
+        return embeddings
+    
+    async def _acall_openai(self, call, operation: str, admission: AdmissionController):
+        """
+        Llamada asíncrona a OpenAI bajo admisión, con reintentos (429, conexión, 5xx) con jitter
+        
+        Cada intento toma un turno de `admission` y lo suelta durante el backoff.
+        """
+        return await call_with_retries(
+            call, operation, self.openai_max_retries, RETRYABLE_ERRORS, RateLimitError, admission=admission
         )
-        return [item.embedding for item in response.data]
     
-    def search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+    def _aopenai_stream(self, call, operation: str, admission: AdmissionController):
+        """Como _acall_openai, pero el turno sigue tomado dentro del bloque (para consumir un stream)"""
+        return admitted_call(
+            call, operation, admission, self.openai_max_retries, RETRYABLE_ERRORS, RateLimitError
+        )
+    
+    def _fill_missing(self, texts: List[str], embeddings: List, missing: List[int], response):
+        """Completa los huecos de la caché con la respuesta de OpenAI y la persiste"""
+        new_vectors = [item.embedding for item in response.data]
+        for i, vector in zip(missing, new_vectors):
+            embeddings[i] = vector
+        self.embedding_cache.put_many(
+            EMBEDDING_MODEL,
+            [texts[i] for i in missing],
+            new_vectors
+        )
+    
+    async def _run_in_chroma_pool(self, fn, *args, **kwargs):
+        """Ejecuta una llamada síncrona del backend vectorial en el pool de hilos acotado"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._chroma_executor,
+            lambda: fn(*args, **kwargs)
+        )
+    
+    def _build_messages(self, query: str, matches: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """Construye los mensajes del chat con el contexto recuperado"""
+        context = "\n\n".join([format_card(m) for m in matches])
+        
+        user_prompt = f"""Contexto de clientes:
+{context}
+
+Pregunta: {query}
+
+Responde basándote únicamente en el contexto proporcionado."""
+        
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt}
+        ]
+    
+    def _pack_context(
+        self,
+        query: str,
+        query_embedding: Optional[List[float]],
+        matches: List[Dict[str, Any]],
+        embeddings: Dict[str, Any]
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, str]], Dict[str, int]]:
+        """
+        Elige las tarjetas que entran al prompt (ver ContextBuilder)
+        
+        El presupuesto de tokens limita solo lo que viaja a GPT-4: la respuesta
+        sigue devolviendo todos los matches recuperados (ver context.cliente_ids).
+        
+        Returns:
+            (tarjetas del prompt, mensajes del chat, estadísticas con prompt_tokens
+            y cliente_ids enviados a GPT-4)
+        """
+        with span("context"):
+            fixed_tokens = count_message_tokens(self._build_messages(query, []))
+            packed, stats = self.context_builder.build(matches, embeddings, query_embedding, fixed_tokens)
+            messages = self._build_messages(query, packed)
+            stats["prompt_tokens"] = count_message_tokens(messages)
+            stats["cliente_ids"] = [
+                cliente_id for m in packed for cliente_id in [m['cliente_id']] + m.get("duplicados", [])
+            ]
+        return packed, messages, stats
+    
+    async def _apack_context(
+        self,
+        query: str,
+        query_embedding: Optional[List[float]],
+        matches: List[Dict[str, Any]]
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, str]], Dict[str, int]]:
+        """Versión asíncrona de _pack_context (lee los embeddings del índice en el pool)"""
+        with span("context_embeddings"):
+            embeddings = await self._run_in_chroma_pool(
+                self.vector_store.get_embeddings,
+                [m['cliente_id'] for m in matches]
+            )
+        return self._pack_context(query, query_embedding, matches, embeddings)
+    
+    @staticmethod
+    def resolve_filters(
+        query: str,
+        filters: Optional[Dict[str, Any]] = None,
+        auto_filter: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Combina los filtros explícitos con los extraídos de la pregunta
+        
+        Args:
+            query: Pregunta en lenguaje natural
+            filters: Filtros explícitos (ver filters.build_filters)
+            auto_filter: Si True, aplica el extractor por reglas sobre query
+        """
+        filters = filters or {}
+        if not auto_filter:
+            return dict(filters)
+        return merge_filters(filters, extract_filters(query))
+    
+    @staticmethod
+    def resolve_mode(mode: Optional[str], default: str) -> str:
+        """Valida el modo de recuperación (vector, hybrid, lexical)"""
+        mode = mode or default
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Modo de recuperación inválido: {mode}. Opciones: {RETRIEVAL_MODES}")
+        return mode
+    
+    @staticmethod
+    def _fusion_candidates(top_k: int) -> int:
+        """Candidatos por ranking antes de fusionar (más profundidad = mejor RRF)"""
+        return max(top_k * 4, 20)
+    
+    def search(
+        self,
+        query: str,
+        top_k: int = 5,
+        filters: Optional[Dict[str, Any]] = None,
+        auto_filter: bool = False,
+        mode: Optional[str] = None,
+        scope: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
         """
         Busca clientes relevantes usando RAG
         
         Args:
             query: Consulta en lenguaje natural
             top_k: Número de resultados a retornar
+            filters: Filtros de metadata (edad_min, edad_max, sexo, sector_publico,
+                ingreso_min, ingreso_max) aplicados antes de la búsqueda vectorial
+            auto_filter: Extraer filtros adicionales de la pregunta
+            mode: vector, hybrid o lexical (default RAG_RETRIEVAL_MODE)
+            scope: Valor de RAG_PARTITION_BY (p. ej. un COD_PROMOTOR): busca solo en
+                esa partición. None = índice global
             
         Returns:
             Lista de matches con cliente_id, resumen, y metadata
         """
+        filters = self.resolve_filters(query, filters, auto_filter)
+        mode = self.resolve_mode(mode, self.retrieval_mode)
+        return self._retrieve(query, top_k, filters, mode, scope)[1]
+    
+    def _retrieve(
+        self,
+        query: str,
+        top_k: int,
+        filters: Dict[str, Any],
+        mode: str,
+        scope: Optional[str] = None
+    ) -> Tuple[Optional[List[float]], List[Dict[str, Any]]]:
+        """
+        Retorna (embedding de la consulta, matches); filters y mode ya resueltos
+        
+        El embedding es None si no se usó: modo lexical, o la API de embeddings
+        no respondió y se degradó a solo BM25.
+        """
+        vector_store, lexical_index = self._stores(scope)
+        if mode == "lexical":
+            return None, self._lexical_search(lexical_index, query, top_k, filters)
+        
         # Generar embedding de la consulta
-        query_embedding = self._get_embeddings([query])[0]
-        
-        # Buscar en ChromaDB
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=top_k
-        )
-        
-        # Formatear resultados
-        matches = []
-        for i in range(len(results['ids'][0])):
-            match = {
-                "cliente_id": results['ids'][0][i],
-                "resumen": results['documents'][0][i],
-                "metadata": results['metadatas'][0][i],
-                "distance": results['distances'][0][i] if 'distances' in results else None
-            }
-            matches.append(match)
+        try:
+            with span("embedding"):
+                query_embedding = self._get_embeddings([query])[0]
+        except EMBEDDING_FALLBACK_ERRORS as e:
+            print(f"⚠ Embeddings no disponibles, usando solo el índice léxico: {e}")
+            return None, self._lexical_search(lexical_index, query, top_k, filters)
+        
+        # Buscar en el backend vectorial (pre-filtrando por metadata)
+        n_candidates = top_k if mode == "vector" else self._fusion_candidates(top_k)
+        with span("vector_query"):
+            vector_matches = vector_store.query([query_embedding], n_candidates, filters)[0]
+        if mode == "vector":
+            return query_embedding, vector_matches
+        
+        lexical_matches = self._lexical_search(lexical_index, query, n_candidates, filters)
+        return query_embedding, reciprocal_rank_fusion([vector_matches, lexical_matches], top_k)
+    
+    @staticmethod
+    def _lexical_search(lexical_index: BM25Index, query: str, top_k: int, filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+        with span("lexical_query"):
+            return lexical_index.search(query, top_k, filters)
+    
+    async def _alexical_search(
+        self,
+        lexical_index: BM25Index,
+        queries: List[str],
+        top_k: int,
+        filters_list: List[Dict[str, Any]]
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        BM25 para una o varias preguntas en el pool de hilos
+
+        El scoring y una posible recarga del .npz (np.load + JSON) no deben
+        bloquear el event loop; el lote entero va en una sola tarea del pool.
+        """
+        with span("lexical_query"):
+            return await self._run_in_chroma_pool(
+                lambda: [
+                    lexical_index.search(query, top_k, filters)
+                    for query, filters in zip(queries, filters_list)
+                ]
+            )
+    
+    async def asearch(
+        self,
+        query: str,
+        top_k: int = 5,
+        filters: Optional[Dict[str, Any]] = None,
+        auto_filter: bool = False,
+        mode: Optional[str] = None,
+        scope: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Versión asíncrona de search
         
-        return matches
+        El embedding se genera con el cliente AsyncOpenAI y la consulta al
+        backend vectorial corre en el pool de hilos, así el event loop queda libre.
+        """
+        filters = self.resolve_filters(query, filters, auto_filter)
+        mode = self.resolve_mode(mode, self.retrieval_mode)
+        return (await self._aretrieve(query, top_k, filters, mode, scope))[1]
     
-    def ask_with_gpt(self, query: str, top_k: int = 5) -> Dict[str, Any]:
+    async def _aretrieve(
+        self,
+        query: str,
+        top_k: int,
+        filters: Dict[str, Any],
+        mode: str,
+        scope: Optional[str] = None
+    ) -> Tuple[Optional[List[float]], List[Dict[str, Any]]]:
+        """Versión asíncrona de _retrieve"""
+        vector_store, lexical_index = await self._astores(scope)
+        if mode == "lexical":
+            return None, (await self._alexical_search(lexical_index, [query], top_k, [filters]))[0]
+        
+        # Preguntas idénticas en vuelo comparten la llamada de embeddings
+        try:
+            with span("embedding"):
+                query_embedding = (await self._single_flight.do(
+                    ("embedding", normalize_text(query)),
+                    lambda: self._aget_embeddings([query])
+                ))[0]
+        except EMBEDDING_FALLBACK_ERRORS as e:
+            print(f"⚠ Embeddings no disponibles, usando solo el índice léxico: {e}")
+            return None, (await self._alexical_search(lexical_index, [query], top_k, [filters]))[0]
+        
+        n_candidates = top_k if mode == "vector" else self._fusion_candidates(top_k)
+        with span("vector_query"):
+            results = await self._run_in_chroma_pool(
+                vector_store.query,
+                [query_embedding],
+                n_candidates,
+                filters
+            )
+        
+        if mode == "vector":
+            return query_embedding, results[0]
+        lexical_matches = (await self._alexical_search(lexical_index, [query], n_candidates, [filters]))[0]
+        return query_embedding, reciprocal_rank_fusion([results[0], lexical_matches], top_k)
+    
+    def ask_with_gpt(
+        self,
+        query: str,
+        top_k: int = 5,
+        filters: Optional[Dict[str, Any]] = None,
+        auto_filter: bool = False,
+        mode: Optional[str] = None,
+        scope: Optional[str] = None
+    ) -> Dict[str, Any]:
         """
         Responde una pregunta usando RAG + GPT-4
         
+        Si una pregunta semánticamente equivalente ya se respondió con el mismo
+        conjunto de clientes recuperados, reutiliza esa respuesta (ver answer_cache).
+        Uso fuera de la API (scripts): sin control de admisión, con los reintentos
+        del SDK; la API usa aask_with_gpt.
+        
         Args:
             query: Pregunta sobre clientes
             top_k: Número de contextos a recuperar
-            
+            filters: Filtros de metadata (ver search)
+            auto_filter: Extraer filtros adicionales de la pregunta
+            mode: Modo de recuperación (ver search)
+            scope: Partición a consultar (ver search)
+        
         Returns:
-            Dict con answer y matches utilizados
+            Dict con answer, matches (los top_k recuperados), context_used (tarjetas que
+            entraron al prompt), filtros aplicados, cached, retrieval_mode, prompt_tokens
+            enviados a GPT-4 (0 si salió de la caché) y context (estadísticas)
         """
-        # Recuperar contexto relevante
-        matches = self.search(query, top_k=top_k)
+        filters = self.resolve_filters(query, filters, auto_filter)
+        mode = self.resolve_mode(mode, self.retrieval_mode)
+        index_version = self.index_version
         
-        # Construir prompt con contexto
-        context = "\n\n".join([
-            f"Cliente {m['cliente_id']}: {m['resumen']}"
-            for m in matches
-        ])
+        # Recuperar contexto relevante y empaquetarlo dentro del presupuesto de tokens
+        query_embedding, matches = self._retrieve(query, top_k, filters, mode, scope)
+        with span("context_embeddings"):
+            embeddings = self.vector_store.get_embeddings([m['cliente_id'] for m in matches])
+        packed, messages, context = self._pack_context(query, query_embedding, matches, embeddings)
+        cliente_ids = [m['cliente_id'] for m in packed]
         
-        system_prompt = """Eres un asistente bancario especializado. 
-Responde SOLO basándote en la información de los clientes proporcionados.
-Si no hay suficiente información, di "no disponible en los datos proporcionados".
-Cita siempre los cliente_id cuando sea relevante.
-Sé conciso y preciso."""
+        # Pregunta equivalente ya respondida con el mismo contexto
+        answer = None
+        if query_embedding is not None:
+            answer = self.answer_cache.get(query_embedding, cliente_ids, index_version)
+            record_cache("answer", int(answer is not None), int(answer is None))
+        cached = answer is not None
         
-        user_prompt = f"""Contexto de clientes:
-{context}
-
-Pregunta: {query}
-
-Responde basándote únicamente en el contexto proporcionado."""
+        if not cached:
+            # Llamar a GPT-4
+            with span("llm"):
+                response = self.openai_client.chat.completions.create(
+                    model=CHAT_MODEL,
+                    messages=messages,
+                    temperature=0.3,
+                    max_tokens=500
+                )
+            record_usage(CHAT_MODEL, response.usage)
+            answer = response.choices[0].message.content
+            if query_embedding is not None:
+                self.answer_cache.put(query_embedding, cliente_ids, index_version, answer)
+        
+        return {
+            "answer": answer,
+            "matches": matches,
+            "context_used": len(packed),
+            "filters": filters,
+            "cached": cached,
+            "retrieval_mode": mode if query_embedding is not None else "lexical",
+            "prompt_tokens": 0 if cached else context["prompt_tokens"],
+            "context": context
+        }
+    
+    async def aask_with_gpt(
+        self,
+        query: str,
+        top_k: int = 5,
+        filters: Optional[Dict[str, Any]] = None,
+        auto_filter: bool = False,
+        mode: Optional[str] = None,
+        scope: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Versión asíncrona de ask_with_gpt (usada por el endpoint /ask)
+        
+        Las peticiones concurrentes con la misma (pregunta normalizada, top_k,
+        filtros, modo) esperan una única computación y comparten su resultado.
         
-        # Llamar a GPT-4
-        response = self.openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.3,
-            max_tokens=500
+        Args:
+            query: Pregunta sobre clientes
+            top_k: Número de contextos a recuperar
+            filters: Filtros de metadata (ver search)
+            auto_filter: Extraer filtros adicionales de la pregunta
+            mode: Modo de recuperación (ver search)
+            scope: Partición a consultar (ver search)
+            
+        Returns:
+            Dict con answer, matches (los top_k recuperados), context_used (tarjetas que
+            entraron al prompt), filtros aplicados, cached, retrieval_mode, prompt_tokens
+            enviados a GPT-4 (0 si salió de la caché) y context (estadísticas)
+        """
+        filters = self.resolve_filters(query, filters, auto_filter)
+        mode = self.resolve_mode(mode, self.retrieval_mode)
+        key = ("ask", normalize_text(query), top_k, tuple(sorted(filters.items())), mode, scope)
+        result = await self._single_flight.do(
+            key,
+            lambda: self._aanswer(query, top_k, filters, mode, scope)
         )
+        return dict(result)
+    
+    async def _aanswer(
+        self,
+        query: str,
+        top_k: int,
+        filters: Dict[str, Any],
+        mode: str,
+        scope: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Recuperación + GPT-4 para aask_with_gpt; filters y mode ya resueltos"""
+        index_version = self.index_version
         
-        answer = response.choices[0].message.content
+        query_embedding, matches = await self._aretrieve(query, top_k, filters, mode, scope)
+        
+        completion = await self._acomplete(query, query_embedding, matches, index_version)
         
         return {
-            "answer": answer,
+            **completion,
+            "filters": filters,
+            "retrieval_mode": mode if query_embedding is not None else "lexical"
+        }
+    
+    async def _acomplete(
+        self,
+        query: str,
+        query_embedding: Optional[List[float]],
+        matches: List[Dict[str, Any]],
+        index_version: int
+    ) -> Dict[str, Any]:
+        """
+        Empaqueta el contexto y obtiene la respuesta de GPT-4 (o de la caché)
+        
+        Sin embedding (recuperación solo léxica) no se consulta la caché semántica.
+        
+        Returns:
+            Dict con answer, cached, matches (todos los recuperados), context_used
+            (tarjetas enviadas a GPT-4), prompt_tokens y context
+        """
+        packed, messages, context = await self._apack_context(query, query_embedding, matches)
+        cliente_ids = [m['cliente_id'] for m in packed]
+        result = {
             "matches": matches,
-            "context_used": len(matches)
+            "context_used": len(packed),
+            "cached": True,
+            "prompt_tokens": 0,
+            "context": context
+        }
+        
+        if query_embedding is not None:
+            answer = self.answer_cache.get(query_embedding, cliente_ids, index_version)
+            record_cache("answer", int(answer is not None), int(answer is None))
+            if answer is not None:
+                return {"answer": answer, **result}
+        
+        with span("llm"):
+            response = await self._acall_openai(
+                lambda: self.async_openai_client.chat.completions.create(
+                    model=CHAT_MODEL,
+                    messages=messages,
+                    temperature=0.3,
+                    max_tokens=500
+                ),
+                "chat",
+                self.chat_admission
+            )
+        record_usage(CHAT_MODEL, response.usage)
+        answer = response.choices[0].message.content
+        if query_embedding is not None:
+            self.answer_cache.put(query_embedding, cliente_ids, index_version, answer)
+        return {**result, "answer": answer, "cached": False, "prompt_tokens": context["prompt_tokens"]}
+    
+    # ===== LOTES =====
+    
+    async def _aretrieve_batch(
+        self,
+        queries: List[str],
+        top_k: int,
+        filters_list: List[Dict[str, Any]],
+        mode: str,
+        scope: Optional[str] = None
+    ) -> Tuple[Optional[List[List[float]]], List[List[Dict[str, Any]]]]:
+        """
+        Recuperación para muchas preguntas: una sola llamada de embeddings y
+        una consulta multi-embedding al backend vectorial por cada conjunto
+        distinto de filtros (normalmente uno solo). En modo hybrid cada
+        pregunta se fusiona además con su ranking BM25.
+        
+        Returns:
+            (embeddings o None si la recuperación fue solo léxica, matches por pregunta)
+        """
+        vector_store, lexical_index = await self._astores(scope)
+        
+        if mode == "lexical":
+            return None, await self._alexical_search(lexical_index, queries, top_k, filters_list)
+        try:
+            with span("embedding"):
+                embeddings = await self._aget_embeddings(queries)
+        except EMBEDDING_FALLBACK_ERRORS as e:
+            print(f"⚠ Embeddings no disponibles, usando solo el índice léxico: {e}")
+            return None, await self._alexical_search(lexical_index, queries, top_k, filters_list)
+        
+        n_candidates = top_k if mode == "vector" else self._fusion_candidates(top_k)
+        groups: Dict[tuple, List[int]] = {}
+        for i, filters in enumerate(filters_list):
+            groups.setdefault(tuple(sorted(filters.items())), []).append(i)
+        
+        all_matches: List[List[Dict[str, Any]]] = [[] for _ in queries]
+        for positions in groups.values():
+            with span("vector_query"):
+                results = await self._run_in_chroma_pool(
+                    vector_store.query,
+                    [embeddings[i] for i in positions],
+                    n_candidates,
+                    filters_list[positions[0]]
+                )
+            for i, matches in zip(positions, results):
+                all_matches[i] = matches
+        
+        if mode == "hybrid":
+            lexical_matches = await self._alexical_search(lexical_index, queries, n_candidates, filters_list)
+            all_matches = [
+                reciprocal_rank_fusion([matches, lexical], top_k)
+                for matches, lexical in zip(all_matches, lexical_matches)
+            ]
+        
+        return embeddings, all_matches
+    
+    async def asearch_batch(
+        self,
+        queries: List[str],
+        top_k: int = 5,
+        filters: Optional[Dict[str, Any]] = None,
+        auto_filter: bool = False,
+        mode: Optional[str] = None,
+        scope: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Búsqueda semántica para un lote de preguntas
+        
+        Args:
+            queries: Preguntas en lenguaje natural
+            top_k: Número de resultados por pregunta
+            filters: Filtros de metadata comunes a todas las preguntas
+            auto_filter: Extraer filtros adicionales de cada pregunta
+            mode: Modo de recuperación (ver search)
+            scope: Partición a consultar (ver search)
+        
+        Returns:
+            Lista alineada con queries: {query, matches, filters}
+        """
+        filters_list = [self.resolve_filters(q, filters, auto_filter) for q in queries]
+        mode = self.resolve_mode(mode, self.retrieval_mode)
+        _, all_matches = await self._aretrieve_batch(queries, top_k, filters_list, mode, scope)
+        return [
+            {"query": query, "matches": matches, "filters": query_filters}
+            for query, matches, query_filters in zip(queries, all_matches, filters_list)
+        ]
+    
+    async def aask_batch(
+        self,
+        queries: List[str],
+        top_k: int = 5,
+        filters: Optional[Dict[str, Any]] = None,
+        auto_filter: bool = False,
+        concurrency: int = None,
+        mode: Optional[str] = None,
+        scope: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Responde un lote de preguntas (trabajos offline, p. ej. briefings nocturnos)
+        
+        La recuperación se hace en bloque (ver _aretrieve_batch) y las llamadas
+        a GPT-4 corren en paralelo con un máximo de `concurrency` a la vez
+        (env RAG_BATCH_CONCURRENCY, default 8).
+        
+        Yields:
+            Un resultado por pregunta a medida que termina (no en orden):
+            {index, query, answer, matches, context_used, filters, cached, retrieval_mode,
+            prompt_tokens, context} o {index, query, error} si esa pregunta falló
+        """
+        concurrency = concurrency or int(os.getenv("RAG_BATCH_CONCURRENCY", "8"))
+        filters_list = [self.resolve_filters(q, filters, auto_filter) for q in queries]
+        mode = self.resolve_mode(mode, self.retrieval_mode)
+        index_version = self.index_version
+        
+        embeddings, all_matches = await self._aretrieve_batch(queries, top_k, filters_list, mode, scope)
+        if embeddings is None:
+            mode = "lexical"
+        
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def answer_one(i: int) -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    query_embedding = embeddings[i] if embeddings is not None else None
+                    completion = await self._acomplete(queries[i], query_embedding, all_matches[i], index_version)
+                except Overloaded as e:
+                    return {"index": i, "query": queries[i], "error": str(e), "retry_after": e.retry_after}
+                except Exception as e:
+                    return {"index": i, "query": queries[i], "error": str(e)}
+            return {
+                "index": i,
+                "query": queries[i],
+                **completion,
+                "filters": filters_list[i],
+                "retrieval_mode": mode
+            }
+        
+        tasks = [asyncio.ensure_future(answer_one(i)) for i in range(len(queries))]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Cliente desconectado: no seguir pagando completions
+            for task in tasks:
+                task.cancel()
+    
+    async def astream_ask_with_gpt(
+        self,
+        query: str,
+        top_k: int = 5,
+        filters: Optional[Dict[str, Any]] = None,
+        auto_filter: bool = False,
+        mode: Optional[str] = None,
+        scope: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Variante en streaming de aask_with_gpt
+        
+        Emite eventos en orden:
+        - {"event": "matches", "data": {...}} en cuanto termina la recuperación
+        - {"event": "token", "data": {"content": ...}} por cada fragmento de GPT-4
+        - {"event": "done", "data": {...}} con uso de tokens y tiempos
+        """
+        start = time.perf_counter()
+        filters = self.resolve_filters(query, filters, auto_filter)
+        mode = self.resolve_mode(mode, self.retrieval_mode)
+        index_version = self.index_version
+        
+        query_embedding, matches = await self._aretrieve(query, top_k, filters, mode, scope)
+        packed, messages, context = await self._apack_context(query, query_embedding, matches)
+        cliente_ids = [m['cliente_id'] for m in packed]
+        retrieval_ms = (time.perf_counter() - start) * 1000
+        
+        yield {
+            "event": "matches",
+            "data": {
+                "matches": matches,
+                "context_used": len(packed),
+                "filters": filters,
+                "retrieval_mode": mode if query_embedding is not None else "lexical",
+                "context": context
+            }
+        }
+        
+        # Respuesta en caché: se envía completa como un único token
+        answer = None
+        if query_embedding is not None:
+            answer = self.answer_cache.get(query_embedding, cliente_ids, index_version)
+            record_cache("answer", int(answer is not None), int(answer is None))
+        if answer is not None:
+            yield {"event": "token", "data": {"content": answer}}
+            total_ms = round((time.perf_counter() - start) * 1000, 2)
+            yield {
+                "event": "done",
+                "data": {
+                    "usage": None,
+                    "cached": True,
+                    "prompt_tokens": 0,
+                    "timing_ms": {"retrieval": round(retrieval_ms, 2), "first_token": total_ms, "total": total_ms}
+                }
+            }
+            return
+        
+        usage = None
+        first_token_ms = None
+        parts = []
+        llm_start = time.perf_counter()
+        async with self._aopenai_stream(
+            lambda: self.async_openai_client.chat.completions.create(
+                model=CHAT_MODEL,
+                messages=messages,
+                temperature=0.3,
+                max_tokens=500,
+                stream=True,
+                stream_options={"include_usage": True}
+            ),
+            "chat",
+            self.chat_admission
+        ) as stream:
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    usage = chunk.usage.model_dump()
+                if not chunk.choices:
+                    continue
+                content = chunk.choices[0].delta.content
+                if content:
+                    if first_token_ms is None:
+                        first_token_ms = (time.perf_counter() - start) * 1000
+                    parts.append(content)
+                    yield {"event": "token", "data": {"content": content}}
+        
+        observe_stage("llm", time.perf_counter() - llm_start)
+        record_usage(CHAT_MODEL, usage)
+        if query_embedding is not None:
+            self.answer_cache.put(query_embedding, cliente_ids, index_version, "".join(parts))
+        
+        yield {
+            "event": "done",
+            "data": {
+                "usage": usage,
+                "cached": False,
+                "prompt_tokens": context["prompt_tokens"],
+                "timing_ms": {
+                    "retrieval": round(retrieval_ms, 2),
+                    "first_token": round(first_token_ms, 2) if first_token_ms is not None else None,
+                    "total": round((time.perf_counter() - start) * 1000, 2)
+                }
+            }
         }
     
+    def check_admission(self):
+        """Rechaza de inmediato (Overloaded) si la cola de GPT-4 está llena"""
+        self.chat_admission.check()
+    
+    def admission_stats(self) -> Dict[str, Any]:
+        return {
+            "embedding": self.embedding_admission.get_stats(),
+            "chat": self.chat_admission.get_stats()
+        }
+    
+    async def aclose(self):
+        """Libera el pool HTTP asíncrono y el pool de hilos de ChromaDB"""
+        await self.async_openai_client.close()
+        self._chroma_executor.shutdown(wait=False)
+        self.embedding_cache.close()
+    
     def get_stats(self) -> Dict[str, Any]:
         """Retorna estadísticas de la colección"""
-        count = self.collection.count()
+        count = self.vector_store.count()
         return {
             "collection_name": self.collection_name,
+            "vector_backend": self.vector_backend,
+            "vector_quantization": self.vector_quantization,
+            "retrieval_mode": self.retrieval_mode,
+            "partition_by": self.partition_by,
+            "partitions": len(self.partition_keys()),
+            "lexical_documents": self.lexical_index.count(),
             "total_documents": count,
-            "status": "ready" if count > 0 else "empty"
+            "status": "ready" if count > 0 else "empty",
+            "embedding_cache": self.embedding_cache.get_stats(),
+            "admission": self.admission_stats(),
+            "answer_cache": self.answer_cache.get_stats(),
+            "context_token_budget": self.context_builder.token_budget,
+            "single_flight": self._single_flight.get_stats()
         }
@@ -0,0 +1,47 @@
+"""
+Coalescing de peticiones idénticas concurrentes (single-flight).
+Mientras una computación para una clave está en curso, las peticiones con la misma clave
+esperan ese mismo resultado en vez de repetir las llamadas a OpenAI y al backend vectorial.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    def __init__(self):
+        self._inflight: Dict[Hashable, "asyncio.Task"] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Ejecuta fn() una sola vez por clave entre las llamadas concurrentes
+
+        La computación corre en su propia tarea: si el cliente que la inició se
+        desconecta (cancelación), las demás peticiones siguen esperándola.
+        Los errores se propagan a todas las peticiones de esa clave.
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        else:
+            self.followers += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: "asyncio.Task"):
+        self._inflight.pop(key, None)
+        # Marca el error como consumido aunque todas las peticiones se hayan cancelado
+        if not task.cancelled():
+            task.exception()
+
+    def get_stats(self) -> Dict[str, Any]:
+        requests = self.leaders + self.followers
+        return {
+            "in_flight": len(self._inflight),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "coalesced_rate": round(self.followers / requests, 4) if requests else 0.0
+        }
@@ -0,0 +1,435 @@
+"""
+Histórico de la cartera: un snapshot de agregados por cada extracto mensual de Data.csv.
+Cada extracto se procesa una sola vez (se identifica por hash de contenido) y sus agregados
+(métricas compuestas, cada columna _SALDO y los desgloses por dimensión) se agregan a
+archivos columnares append-only. Las series de tiempo y las variaciones mes a mes se
+responden desde esos agregados: O(número de snapshots), sin volver a leer ningún CSV.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# Formato en disco (manifest.json lo registra para futuras migraciones)
+HISTORY_FORMAT = 1
+
+# Columnas de los puntos: un punto = (snapshot, serie, suma en CRC, n_clientes)
+POINT_COLUMNS = {
+    "snapshot": np.dtype("<u4"),
+    "series": np.dtype("<u4"),
+    "value": np.dtype("<f8"),
+    "count": np.dtype("<i8"),
+}
+
+# Métricas con desglose por dimensión (las columnas _SALDO solo tienen total)
+COMPOSITE_METRICS = ("captaciones", "colocaciones", "neto")
+
+PERIOD_PATTERN = re.compile(r"^\d{4}-(0[1-9]|1[0-2])$")
+# Data_1761251591554.csv: sufijo con epoch en milisegundos del momento de la exportación
+_EPOCH_MS_SUFFIX = re.compile(r"_(\d{13})$")
+_YEAR_MONTH = re.compile(r"(?<!\d)(20\d{2})[-_]?(0[1-9]|1[0-2])(?!\d)")
+
+SeriesKey = Tuple[str, Optional[str], Optional[str]]
+
+
+def file_digest(path: Path) -> str:
+    """Hash del contenido (no del nombre): el mismo extracto renombrado no se ingiere dos veces"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def extract_period(csv_path: Path, period: Optional[str] = None) -> str:
+    """
+    Periodo YYYY-MM de un extracto: explícito, por el epoch del nombre (Data_<ms>.csv),
+    por un año-mes en el nombre (Data_2025-09.csv) o por la fecha de modificación
+
+    Raises:
+        ValueError: si el periodo explícito no tiene formato YYYY-MM
+    """
+    if period is not None:
+        if not PERIOD_PATTERN.match(period):
+            raise ValueError(f"Periodo inválido: {period}. Formato esperado: YYYY-MM")
+        return period
+    stem = Path(csv_path).stem
+    if match := _EPOCH_MS_SUFFIX.search(stem):
+        timestamp = int(match.group(1)) / 1000
+    elif match := _YEAR_MONTH.search(stem):
+        return f"{match.group(1)}-{match.group(2)}"
+    else:
+        timestamp = Path(csv_path).stat().st_mtime
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime("%Y-%m")
+
+
+def _normalize_metric(metric: str) -> str:
+    return metric.lower() if metric.lower() in COMPOSITE_METRICS else metric.upper()
+
+
+def _change(current: Optional[float], previous: Optional[float]) -> Dict[str, Optional[float]]:
+    """Variación absoluta y porcentual (None si falta un extremo o el anterior es 0)"""
+    if current is None or previous is None:
+        return {"delta_crc": None, "delta_pct": None}
+    delta = current - previous
+    return {
+        "delta_crc": round(delta, 2),
+        "delta_pct": round(delta / abs(previous) * 100, 2) if previous else None
+    }
+
+
+class HistoryView:
+    """
+    Vista inmutable del histórico (se reemplaza completa tras cada ingesta)
+
+    Los puntos se expanden a una matriz densa snapshot × serie: una serie de tiempo
+    es una columna y una variación mes a mes son dos filas.
+    """
+
+    def __init__(
+        self,
+        snapshots: List[Dict[str, Any]],
+        series: List[SeriesKey],
+        points: Dict[str, np.ndarray],
+        mtime_ns: Optional[int] = None
+    ):
+        self.mtime_ns = mtime_ns
+        self.snapshots = snapshots
+        self.series_index: Dict[SeriesKey, int] = {key: i for i, key in enumerate(series)}
+        # (métrica, dimensión) → [(valor, columna)] para los desgloses
+        self.groups: Dict[Tuple[str, str], List[Tuple[str, int]]] = {}
+        for i, (metric, dimension, value) in enumerate(series):
+            if dimension is not None:
+                self.groups.setdefault((metric, dimension), []).append((value, i))
+
+        self.values = np.full((len(snapshots), len(series)), np.nan)
+        self.counts = np.zeros((len(snapshots), len(series)), dtype=np.int64)
+        self.values[points["snapshot"], points["series"]] = points["value"]
+        self.counts[points["snapshot"], points["series"]] = points["count"]
+
+        # Un periodo reingerido (extracto corregido) usa su snapshot más reciente
+        latest = {snapshot["period"]: i for i, snapshot in enumerate(snapshots)}
+        self.periods = sorted(latest)
+        self.rows = np.array([latest[period] for period in self.periods], dtype=np.intp)
+        self.sources = {snapshot["sha256"] for snapshot in snapshots}
+
+    def column(self, key: SeriesKey) -> Tuple[np.ndarray, np.ndarray]:
+        """(sumas, n_clientes) de una serie en orden de periodo (NaN si no existía ese mes)"""
+        col = self.series_index.get(key)
+        if col is None:
+            return np.full(len(self.rows), np.nan), np.zeros(len(self.rows), dtype=np.int64)
+        return self.values[self.rows, col], self.counts[self.rows, col]
+
+
+class SnapshotStore:
+    def __init__(self, path: Path):
+        """
+        Args:
+            path: Directorio del histórico (manifest.json, series.jsonl y un archivo por columna)
+        """
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._view = self._load()
+
+    @property
+    def view(self) -> HistoryView:
+        """
+        Vista activa (referencia atómica); se recarga si otro proceso confirmó una ingesta
+
+        Cuesta un stat del manifiesto por consulta.
+        """
+        view = self._view
+        try:
+            mtime_ns = (self.path / "manifest.json").stat().st_mtime_ns
+        except FileNotFoundError:
+            return view
+        if mtime_ns != view.mtime_ns:
+            with self._lock:
+                if mtime_ns != self._view.mtime_ns:
+                    self._view = self._load()
+                view = self._view
+        return view
+
+    # ===== PERSISTENCIA =====
+
+    def _read_manifest(self) -> Dict[str, Any]:
+        try:
+            with open(self.path / "manifest.json", 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"format": HISTORY_FORMAT, "rows": 0, "series_bytes": 0, "snapshots": []}
+
+    def _load(self) -> HistoryView:
+        """Lee solo lo confirmado en el manifiesto (una ingesta interrumpida queda fuera)"""
+        try:
+            mtime_ns = (self.path / "manifest.json").stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime_ns = None
+        manifest = self._read_manifest()
+        series: List[SeriesKey] = []
+        if manifest["series_bytes"]:
+            with open(self.path / "series.jsonl", 'rb') as f:
+                content = f.read(manifest["series_bytes"])
+            series = [tuple(json.loads(line)) for line in content.splitlines()]
+        points = {
+            name: np.fromfile(self.path / f"points.{name}", dtype=dtype, count=manifest["rows"])
+            if manifest["rows"] else np.zeros(0, dtype=dtype)
+            for name, dtype in POINT_COLUMNS.items()
+        }
+        return HistoryView(manifest["snapshots"], series, points, mtime_ns=mtime_ns)
+
+    @contextmanager
+    def _ingest_lock(self) -> Iterator[None]:
+        """
+        Exclusión entre procesos sobre ingest.lock (flock en POSIX, msvcrt.locking en Windows)
+
+        Cada worker de uvicorn ingiere al arrancar y el threading.Lock solo
+        protege dentro de un proceso: sin esto dos workers podían truncar y
+        agregar sobre los mismos archivos a la vez. El SO libera el lock si
+        el proceso muere. El módulo de la plataforma se importa aquí para que
+        importar snapshot_store funcione en cualquier sistema.
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(self.path / "ingest.lock", 'a+b') as f:
+            if os.name == "nt":
+                import msvcrt
+                f.seek(0)
+                while True:
+                    try:
+                        # LK_LOCK reintenta ~10 s y luego falla: se sigue esperando
+                        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        continue
+                try:
+                    yield
+                finally:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    @staticmethod
+    def _append(path: Path, committed_bytes: int, data: bytes):
+        """Descarta restos de una ingesta interrumpida, agrega y sincroniza a disco"""
+        with open(path, 'ab') as f:
+            f.truncate(committed_bytes)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def ingest(
+        self,
+        period: str,
+        rollups: Dict[SeriesKey, Tuple[float, int]],
+        source: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Agrega un snapshot (append-only: nunca reescribe puntos anteriores)
+
+        Args:
+            period: YYYY-MM del extracto
+            rollups: {(métrica, dimensión, valor): (suma, n_clientes)} (ColumnarMetricsEngine.rollups)
+            source: Datos del extracto; "sha256" identifica el contenido
+
+        Returns:
+            Entrada del snapshot agregado, o None si ese extracto ya estaba ingerido
+        """
+        with self._lock, self._ingest_lock():
+            # Otro worker pudo confirmar este extracto mientras se esperaba el lock
+            self._view = self._load()
+            if source["sha256"] in self._view.sources:
+                return None
+            manifest = self._read_manifest()
+
+            series_index = dict(self._view.series_index)
+            new_series = [key for key in rollups if key not in series_index]
+            for key in new_series:
+                series_index[key] = len(series_index)
+            series_lines = "".join(json.dumps(list(key), ensure_ascii=False) + "\n" for key in new_series).encode("utf-8")
+
+            snapshot_id = len(manifest["snapshots"])
+            n = len(rollups)
+            columns = {
+                "snapshot": np.full(n, snapshot_id, dtype=POINT_COLUMNS["snapshot"]),
+                "series": np.fromiter((series_index[key] for key in rollups), dtype=POINT_COLUMNS["series"], count=n),
+                "value": np.fromiter((value for value, _ in rollups.values()), dtype=POINT_COLUMNS["value"], count=n),
+                "count": np.fromiter((count for _, count in rollups.values()), dtype=POINT_COLUMNS["count"], count=n),
+            }
+
+            self._append(self.path / "series.jsonl", manifest["series_bytes"], series_lines)
+            for name, values in columns.items():
+                itemsize = POINT_COLUMNS[name].itemsize
+                self._append(self.path / f"points.{name}", manifest["rows"] * itemsize, values.tobytes())
+
+            entry = {
+                "period": period,
+                **source,
+                "series": n,
+                "ingested_at": datetime.now(timezone.utc).isoformat(timespec="seconds")
+            }
+            manifest.update(
+                format=HISTORY_FORMAT,
+                rows=manifest["rows"] + n,
+                series_bytes=manifest["series_bytes"] + len(series_lines),
+                snapshots=manifest["snapshots"] + [entry]
+            )
+            # El manifiesto confirma la ingesta (escritura atómica: tmp + rename)
+            tmp_path = self.path / "manifest.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path / "manifest.json")
+
+            self._view = self._load()
+            print(f"✓ Snapshot {period} agregado al histórico ({source.get('file')}, {n} series)")
+            return entry
+
+    def has_source(self, sha256: str) -> bool:
+        return sha256 in self.view.sources
+
+    # ===== CONSULTAS =====
+
+    def get_periods(self) -> Dict[str, Any]:
+        """Snapshots disponibles con los totales de las métricas compuestas"""
+        view = self.view
+        totals = {metric: view.column((metric, None, None)) for metric in COMPOSITE_METRICS}
+        periods = []
+        for i, period in enumerate(view.periods):
+            snapshot = view.snapshots[view.rows[i]]
+            entry = {
+                "period": period,
+                "file": snapshot.get("file"),
+                "n_clientes": snapshot.get("n_clientes"),
+                "ingested_at": snapshot["ingested_at"]
+            }
+            for metric, (values, _) in totals.items():
+                entry[f"{metric}_crc"] = None if np.isnan(values[i]) else round(float(values[i]), 2)
+            periods.append(entry)
+        return {"periods": periods, "count": len(periods)}
+
+    def _series_key(self, metric: str, filters: Optional[Dict[str, str]]) -> SeriesKey:
+        """
+        Raises:
+            ValueError: más de un filtro, o desglose de una columna _SALDO
+        """
+        metric = _normalize_metric(metric)
+        filters = filters or {}
+        if len(filters) > 1:
+            raise ValueError("El histórico guarda desgloses por una sola dimensión: usa un filtro a la vez")
+        if filters and metric not in COMPOSITE_METRICS:
+            raise ValueError(f"El histórico solo desglosa {', '.join(COMPOSITE_METRICS)} por dimensión")
+        if not filters and (metric, None, None) not in self.view.series_index:
+            raise ValueError(f"Métrica sin histórico: {metric}. Opciones: captaciones, colocaciones, neto o una columna _SALDO")
+        dimension, value = next(iter(filters.items()), (None, None))
+        if dimension is not None and (metric, dimension) not in self.view.groups:
+            raise ValueError(f"Sin desglose histórico por {dimension}")
+        return (metric, dimension, value)
+
+    def get_series(self, metric: str, filters: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """
+        Serie de tiempo de una métrica (total o de un valor de dimensión) con variación mes a mes
+
+        Returns:
+            Dict con metric, filters y points [{period, crc, n_clientes, delta_crc, delta_pct}]
+        """
+        key = self._series_key(metric, filters)
+        view = self.view
+        values, counts = view.column(key)
+        points = []
+        previous = None
+        for period, value, count in zip(view.periods, values.tolist(), counts.tolist()):
+            crc = None if np.isnan(value) else round(value, 2)
+            points.append({"period": period, "crc": crc, "n_clientes": count, **_change(crc, previous)})
+            previous = crc
+        return {"metric": key[0], "filters": filters or {}, "points": points}
+
+    def get_delta(
+        self,
+        metric: str,
+        period: Optional[str] = None,
+        group_by: Optional[str] = None,
+        filters: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
+        """
+        Variación de un periodo contra el snapshot anterior
+
+        Args:
+            metric: captaciones, colocaciones, neto o una columna _SALDO
+            period: YYYY-MM (default: el más reciente)
+            group_by: Dimensión para desglosar la variación por valor
+            filters: {dimensión: valor} de un solo segmento
+
+        Raises:
+            ValueError: periodo desconocido, sin snapshot anterior o desglose no disponible
+        """
+        view = self.view
+        if len(view.periods) < 2:
+            raise ValueError("Se necesitan al menos dos snapshots en el histórico para calcular variaciones")
+        period = period or view.periods[-1]
+        if period not in view.periods:
+            raise ValueError(f"Periodo sin snapshot: {period}. Disponibles: {', '.join(view.periods)}")
+        index = view.periods.index(period)
+        if index == 0:
+            raise ValueError(f"No hay snapshot anterior a {period}")
+        current_row, previous_row = view.rows[index], view.rows[index - 1]
+
+        def point(col: Optional[int]) -> Dict[str, Any]:
+            current = previous = None
+            current_count = previous_count = 0
+            if col is not None:
+                if not np.isnan(view.values[current_row, col]):
+                    current = round(float(view.values[current_row, col]), 2)
+                    current_count = int(view.counts[current_row, col])
+                if not np.isnan(view.values[previous_row, col]):
+                    previous = round(float(view.values[previous_row, col]), 2)
+                    previous_count = int(view.counts[previous_row, col])
+            return {
+                "crc": current,
+                "previous_crc": previous,
+                **_change(current, previous),
+                "n_clientes": current_count,
+                "previous_n_clientes": previous_count
+            }
+
+        key = self._series_key(metric, filters)
+        result = {
+            "metric": key[0],
+            "period": period,
+            "previous_period": view.periods[index - 1],
+            "filters": filters or {},
+            **point(view.series_index.get(key))
+        }
+
+        if group_by is not None:
+            if filters:
+                raise ValueError("group_by y filtros no se combinan en el histórico (desgloses de una dimensión)")
+            groups = view.groups.get((key[0], group_by))
+            if groups is None:
+                raise ValueError(f"Sin desglose histórico de {key[0]} por {group_by}")
+            result["group_by"] = group_by
+            result["groups"] = sorted(
+                ({"value": value, **point(col)} for value, col in groups),
+                key=lambda group: -abs(group["delta_crc"] or 0)
+            )
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        view = self.view
+        return {
+            "snapshots": len(view.snapshots),
+            "periods": len(view.periods),
+            "series": len(view.series_index),
+            "latest_period": view.periods[-1] if view.periods else None
+        }
@@ -0,0 +1,264 @@
+"""
+Telemetría en proceso: contadores, histogramas de latencia y spans por etapa.
+Se exporta en formato de texto de Prometheus (GET /internal/metrics) sin dependencias
+externas. Los spans de una petición se acumulan además en una traza (contextvar) que
+/ask devuelve con debug=true.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Límites superiores (segundos) de los histogramas de latencia
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_number(value)}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        label_names: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS
+    ):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        # Por serie: [conteos por bucket (no acumulados), suma, total]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, n) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    labels = _format_labels(self.label_names, key, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.label_names, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {n}")
+                lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {repr(total)}")
+                lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {n}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Any] = []
+
+    def counter(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, help_text, label_names)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()) -> Gauge:
+        metric = Gauge(name, help_text, label_names)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()) -> Histogram:
+        metric = Histogram(name, help_text, label_names)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Todas las métricas en formato de texto de Prometheus (versión 0.0.4)"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "rag_http_request_duration_seconds",
+    "Latencia por endpoint (en streaming, hasta el inicio de la respuesta)",
+    ("method", "path", "status")
+)
+HTTP_ERRORS = REGISTRY.counter(
+    "rag_http_errors_total",
+    "Respuestas con estado >= 400 por endpoint",
+    ("method", "path", "status")
+)
+STAGE_SECONDS = REGISTRY.histogram(
+    "rag_stage_duration_seconds",
+    "Latencia por etapa de búsqueda/respuesta",
+    ("stage",)
+)
+STAGE_ERRORS = REGISTRY.counter(
+    "rag_stage_errors_total",
+    "Excepciones por etapa",
+    ("stage",)
+)
+CACHE_EVENTS = REGISTRY.counter(
+    "rag_cache_events_total",
+    "Aciertos y fallos de las cachés (embedding: por texto, answer: por pregunta)",
+    ("cache", "result")
+)
+OPENAI_TOKENS = REGISTRY.counter(
+    "rag_openai_tokens_total",
+    "Tokens reportados por OpenAI",
+    ("model", "kind")
+)
+ADMISSION_WAIT = REGISTRY.histogram(
+    "rag_admission_wait_seconds",
+    "Espera en la cola de admisión antes de llamar a OpenAI",
+    ("controller",)
+)
+ADMISSION_QUEUE = REGISTRY.gauge(
+    "rag_admission_queue_depth",
+    "Peticiones esperando turno para llamar a OpenAI",
+    ("controller",)
+)
+ADMISSION_REJECTED = REGISTRY.counter(
+    "rag_admission_rejected_total",
+    "Peticiones rechazadas con 503 (queue_full, max_wait)",
+    ("controller", "reason")
+)
+OPENAI_RETRIES = REGISTRY.counter(
+    "rag_openai_retries_total",
+    "Reintentos de llamadas a OpenAI por error transitorio (429, conexión, 5xx)",
+    ("operation", "error")
+)
+
+# Traza de la petición en curso (None fuera de /ask?debug=true)
+_trace: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("rag_trace", default=None)
+
+
+def start_trace() -> Dict[str, Any]:
+    """
+    Activa la traza para la petición actual y la retorna
+
+    Las tareas y hilos lanzados después (asyncio.to_thread, single-flight) heredan
+    el contexto y escriben en el mismo dict.
+    """
+    trace = {"timings_ms": {}, "openai_tokens": {}}
+    _trace.set(trace)
+    return trace
+
+
+def observe_stage(stage: str, seconds: float):
+    """Registra la duración de una etapa en el histograma y en la traza activa"""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    trace = _trace.get()
+    if trace is not None:
+        timings = trace["timings_ms"]
+        timings[stage] = round(timings.get(stage, 0.0) + seconds * 1000, 3)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Mide un bloque como etapa `stage`; las excepciones cuentan en rag_stage_errors_total"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def record_usage(model: str, usage: Any):
+    """Acumula el uso de tokens de una respuesta de OpenAI (objeto usage o dict)"""
+    if usage is None:
+        return
+    if not isinstance(usage, dict):
+        usage = usage.model_dump()
+    trace = _trace.get()
+    for kind in ("prompt_tokens", "completion_tokens"):
+        tokens = usage.get(kind)
+        if not tokens:
+            continue
+        OPENAI_TOKENS.inc(tokens, model=model, kind=kind.replace("_tokens", ""))
+        if trace is not None:
+            per_model = trace["openai_tokens"].setdefault(model, {})
+            per_model[kind] = per_model.get(kind, 0) + tokens
+
+
+def record_cache(cache: str, hits: int, misses: int):
+    if hits:
+        CACHE_EVENTS.inc(hits, cache=cache, result="hit")
+    if misses:
+        CACHE_EVENTS.inc(misses, cache=cache, result="miss")
+
+
+def observe_request(method: str, path: str, status: int, seconds: float):
+    HTTP_REQUEST_SECONDS.observe(seconds, method=method, path=path, status=status)
+    if status >= 400:
+        HTTP_ERRORS.inc(method=method, path=path, status=status)
@@ -0,0 +1,8 @@
+"""
+Configuración común de los tests de la API RAG.
+Los módulos de server/api_rag se importan como planos (igual que main.py y run_api.py).
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,119 @@
+"""Control de admisión y reintentos hacia OpenAI (admission.py)"""
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, Overloaded, admitted_call, call_with_retries
+
+
+class Transient(Exception):
+    pass
+
+
+class RateLimited(Transient):
+    pass
+
+
+def _retry(call, admission=None, max_retries=2):
+    return call_with_retries(
+        call, "chat", max_retries, (Transient,), RateLimited,
+        base_delay_s=0.01, max_delay_s=0.02, admission=admission
+    )
+
+
+def test_cola_llena_rechaza_sin_esperar():
+    async def scenario():
+        admission = AdmissionController("chat", max_concurrency=1, max_queue=1, max_wait_s=5)
+        release = asyncio.Event()
+
+        async def hold():
+            async with admission.slot():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+
+        with pytest.raises(Overloaded) as excinfo:
+            async with admission.slot():
+                pass
+        assert excinfo.value.retry_after >= 1
+        with pytest.raises(Overloaded):
+            admission.check()
+
+        release.set()
+        await asyncio.gather(holder, queued)
+        stats = admission.get_stats()
+        assert (stats["admitted"], stats["rejected"], stats["in_flight"], stats["queued"]) == (2, 2, 0, 0)
+
+    asyncio.run(scenario())
+
+
+def test_espera_maxima_rechaza():
+    async def scenario():
+        admission = AdmissionController("embedding", max_concurrency=1, max_queue=4, max_wait_s=0.05)
+        async with admission.slot():
+            with pytest.raises(Overloaded):
+                async with admission.slot():
+                    pass
+        assert admission.get_stats()["timed_out"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_backoff_libera_el_turno():
+    async def scenario():
+        admission = AdmissionController("chat", max_concurrency=1, max_queue=0, max_wait_s=1)
+        attempts = []
+
+        async def flaky():
+            attempts.append(admission.in_flight)
+            if len(attempts) == 1:
+                raise Transient("503")
+            return "ok"
+
+        retrying = asyncio.create_task(_retry(flaky, admission))
+        # Durante el backoff el turno está libre: otra llamada entra sin cola
+        while not attempts:
+            await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        assert admission.in_flight == 0
+        async with admission.slot():
+            pass
+
+        assert await retrying == "ok"
+        assert attempts == [1, 1]
+
+    asyncio.run(scenario())
+
+
+def test_429_persistente_termina_en_overloaded():
+    async def scenario():
+        calls = 0
+
+        async def limited():
+            nonlocal calls
+            calls += 1
+            raise RateLimited("429")
+
+        with pytest.raises(Overloaded):
+            await _retry(limited, max_retries=2)
+        assert calls == 3
+
+    asyncio.run(scenario())
+
+
+def test_stream_mantiene_el_turno_dentro_del_bloque():
+    async def scenario():
+        admission = AdmissionController("chat", max_concurrency=1, max_queue=0, max_wait_s=1)
+
+        async def create():
+            return "stream"
+
+        async with admitted_call(create, "chat", admission, 0, (Transient,), RateLimited) as stream:
+            assert stream == "stream"
+            assert admission.in_flight == 1
+        assert admission.in_flight == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,108 @@
+"""Consulta por id y paginación con cursores de /clients (client_store.py)"""
+import json
+import math
+
+import pytest
+
+from client_store import ClientStore, encode_cursor
+
+
+def _card(i):
+    return {
+        "cliente_id": f"cli_{i:05d}",
+        "perfil": {
+            "sexo": "FEMENINO" if i % 2 else "MASCULINO",
+            # Empates de edad e ingreso, y un ingreso nulo
+            "edad": 30.0 + i % 4,
+            "ingreso": None if i == 7 else float(1000 + (i % 5) * 250),
+            "antiguedad_laboral": float(i),
+            "sector_publico_flag": float(i % 3 == 0),
+        },
+        "resumen": f"cliente {i}",
+    }
+
+
+def _write(data_dir, indices):
+    with open(data_dir / "row_cards.jsonl", "w", encoding="utf-8") as f:
+        for i in indices:
+            f.write(json.dumps(_card(i)) + "\n")
+
+
+@pytest.fixture
+def store(tmp_path):
+    _write(tmp_path, range(23))
+    return ClientStore(data_dir=str(tmp_path))
+
+
+def _walk(store, sort, limit, filters=None):
+    ids, cursor, pages = [], None, 0
+    while True:
+        page = store.query(filters=filters, sort=sort, limit=limit, cursor=cursor)
+        ids.extend(card["cliente_id"] for card in page["clients"])
+        pages += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return ids, page["total"], pages
+
+
+def _expected(sort, cards):
+    field = sort.lstrip("-")
+    if field == "cliente_id":
+        return sorted((c["cliente_id"] for c in cards), reverse=sort.startswith("-"))
+
+    def key(card):
+        value = card["perfil"][field]
+        missing = value is None or math.isnan(value)
+        value = 0.0 if missing else (-value if sort.startswith("-") else value)
+        return (missing, value, card["cliente_id"])
+
+    return [c["cliente_id"] for c in sorted(cards, key=key)]
+
+
+def test_get_por_id(store):
+    assert store.get("cli_00004")["perfil"]["antiguedad_laboral"] == 4.0
+    assert store.get("cli_99999") is None
+
+
+@pytest.mark.parametrize("sort", ["cliente_id", "-cliente_id", "edad", "-edad", "ingreso", "-ingreso"])
+def test_recorrido_completo_sin_huecos_ni_repetidos(store, sort):
+    ids, total, pages = _walk(store, sort, limit=4)
+    assert ids == _expected(sort, [_card(i) for i in range(23)])
+    assert total == 23
+    assert pages == 6
+
+
+def test_paginacion_con_filtros(store):
+    ids, total, _ = _walk(store, "-edad", limit=3, filters={"sexo": "FEMENINO"})
+    assert ids == _expected("-edad", [_card(i) for i in range(23) if i % 2])
+    assert total == 11
+
+
+def test_cursor_sobrevive_a_la_recarga(tmp_path, store):
+    first = store.query(sort="edad", limit=5)
+    last_id = first["clients"][-1]["cliente_id"]
+
+    # El último cliente de la página desaparece en la nueva versión: el cursor
+    # se ubica entre sus vecinos y la siguiente página sigue sin saltos
+    remaining = [_card(i) for i in range(23) if f"cli_{i:05d}" != last_id]
+    _write(tmp_path, [int(c["cliente_id"][4:]) for c in remaining])
+    store.reload()
+
+    ids, cursor = [], first["next_cursor"]
+    while cursor:
+        page = store.query(sort="edad", limit=4, cursor=cursor)
+        ids.extend(card["cliente_id"] for card in page["clients"])
+        cursor = page["next_cursor"]
+    assert ids == _expected("edad", remaining)[4:]
+
+
+@pytest.mark.parametrize("kwargs, message", [
+    ({"sort": "saldo"}, "sort inválido"),
+    ({"limit": 0}, "limit"),
+    ({"cursor": "no-es-un-cursor"}, "Cursor inválido"),
+    ({"cursor": encode_cursor("edad", 30.0, "cli_00000")}, "sort=edad"),
+    ({"sort": "edad", "cursor": encode_cursor("edad", "treinta", "cli_00000")}, "Cursor inválido"),
+])
+def test_parametros_invalidos(store, kwargs, message):
+    with pytest.raises(ValueError, match=message):
+        store.query(**kwargs)
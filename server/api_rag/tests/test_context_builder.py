@@ -0,0 +1,50 @@
+"""Deduplicación y empaquetado del contexto de GPT-4 (context_builder.py)"""
+import numpy as np
+
+from context_builder import ContextBuilder
+
+
+def _match(cliente_id, resumen):
+    return {"cliente_id": cliente_id, "resumen": resumen, "metadata": {}, "distance": 0.1}
+
+
+# Resúmenes de plantilla: solo cambian los números, los embeddings quedan casi paralelos
+MATCHES = [
+    _match("cli_00001", "Mujer de 41 años, sector privado, ingreso 1200 USD. Tarjeta con saldo 350."),
+    _match("cli_00002", "Mujer de 43 años, sector privado, ingreso 1250 USD. Tarjeta con saldo 410."),
+    _match("cli_00003", "Mujer de 41 años, sector privado, ingreso 1200 USD. Tarjeta con saldo 350."),
+    _match("cli_00001", "Mujer de 41 años, sector privado, ingreso 1200 USD. Tarjeta con saldo 350."),
+]
+EMBEDDINGS = {
+    "cli_00001": np.array([1.0, 0.0, 0.0]),
+    "cli_00002": np.array([0.995, 0.0998, 0.0]),
+    "cli_00003": np.array([1.0, 0.0, 0.0]),
+}
+
+
+def test_por_defecto_solo_agrupa_texto_identico_y_mismo_cliente():
+    builder = ContextBuilder(token_budget=10_000, mmr_lambda=1.0)
+    packed, stats = builder.build(MATCHES, EMBEDDINGS, None, fixed_tokens=0)
+
+    assert [m["cliente_id"] for m in packed] == ["cli_00001", "cli_00002"]
+    assert packed[0]["duplicados"] == ["cli_00003"]
+    assert stats["merged_duplicates"] == 1
+    assert stats["near_duplicates_dropped"] == 0
+    assert stats["near_duplicates"] == []
+
+
+def test_umbral_explicito_descarta_y_reporta():
+    builder = ContextBuilder(token_budget=10_000, mmr_lambda=1.0, dedup_threshold=0.99)
+    packed, stats = builder.build(MATCHES, EMBEDDINGS, None, fixed_tokens=0)
+
+    assert [m["cliente_id"] for m in packed] == ["cli_00001"]
+    assert stats["near_duplicates_dropped"] == 1
+    assert stats["near_duplicates"] == [{"cliente_id": "cli_00002", "similar_to": "cli_00001", "cosine": 0.995}]
+
+
+def test_presupuesto_de_tokens():
+    builder = ContextBuilder(token_budget=30, mmr_lambda=1.0)
+    packed, stats = builder.build(MATCHES[:2], {}, None, fixed_tokens=10)
+
+    assert len(packed) == 1
+    assert stats["dropped_by_budget"] == 1
@@ -0,0 +1,49 @@
+"""Validación de filtros y extractor por reglas de filters.py"""
+import pytest
+
+from filters import FilterError, build_filters, extract_filters, merge_filters
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("mujeres mayores de 50 años", {"sexo": "FEMENINO", "edad_min": 50.0}),
+    ("clientes de 30 a 40 años", {"edad_min": 30.0, "edad_max": 40.0}),
+    ("hombres menores de 40 con ingresos superiores a 3 mil",
+     {"sexo": "MASCULINO", "edad_max": 40.0, "ingreso_min": 3000.0}),
+    ("ingreso mayor a 2.000 y mayores de 40", {"edad_min": 40.0, "ingreso_min": 2000.0}),
+    ("jóvenes del sector público", {"edad_max": 35.0, "sector_publico": True}),
+    ("60 años o más", {"edad_min": 60.0}),
+])
+def test_extrae_filtros(question, expected):
+    assert extract_filters(question) == expected
+
+
+@pytest.mark.parametrize("question", [
+    "clientes de 2 a 5 años de antigüedad",
+    "más de 10 años de antigüedad",
+    "más de 24 meses de antigüedad",
+    "clientes con más de 5 años en la empresa",
+    "hasta 3 productos",
+])
+def test_cantidades_que_no_son_edad(question):
+    assert extract_filters(question) == {}
+
+
+def test_senales_contradictorias_no_filtran():
+    assert "sexo" not in extract_filters("hombres y mujeres del sector privado")
+
+
+def test_build_filters_rechaza_valores_invalidos():
+    with pytest.raises(FilterError):
+        build_filters(sexo="otro")
+    with pytest.raises(FilterError):
+        build_filters(edad_min=60, edad_max=30)
+
+
+def test_merge_prioriza_explicitos():
+    merged = merge_filters({"edad_min": 40.0}, {"edad_min": 50.0, "sexo": "FEMENINO"})
+    assert merged == {"edad_min": 40.0, "sexo": "FEMENINO"}
+
+
+def test_merge_rechaza_rango_imposible():
+    with pytest.raises(FilterError):
+        merge_filters({"edad_min": 60.0}, extract_filters("clientes jóvenes"))
@@ -0,0 +1,81 @@
+"""Reanudación de IndexingPipeline desde el checkpoint (indexing_pipeline.py)"""
+import json
+
+import pytest
+
+from indexing_pipeline import IndexingPipeline
+from rag_service import RAGService
+from vector_store import NumpyVectorStore
+
+
+class FakeRag:
+    """Lo que IndexingPipeline usa de RAGService, con embeddings locales"""
+
+    _card_hash = staticmethod(RAGService._card_hash)
+    _card_metadata = RAGService._card_metadata
+
+    def __init__(self, tmp_path, fail_on_call=None):
+        self.cache_dir = tmp_path
+        self.vector_store = NumpyVectorStore(tmp_path / "numpy")
+        self.fail_on_call = fail_on_call
+        self.calls = 0
+
+    def _embed_with_usage(self, documents):
+        self.calls += 1
+        if self.calls == self.fail_on_call:
+            raise RuntimeError("corte simulado")
+        return [[1.0, float(len(doc)), 0.0, 0.5] for doc in documents], len(documents)
+
+
+def _card(i):
+    return {"cliente_id": f"cli_{i:05d}", "resumen": f"Cliente {i} con tarjeta", "perfil": {"sexo": "FEMENINO", "edad": 30 + i}}
+
+
+@pytest.fixture
+def jsonl(tmp_path):
+    path = tmp_path / "row_cards.jsonl"
+    path.write_text("".join(json.dumps(_card(i)) + "\n" for i in range(10)), encoding="utf-8")
+    return path
+
+
+def _pipeline(rag):
+    return IndexingPipeline(rag, batch_size=2, concurrency=1, requests_per_minute=0, max_retries=0, checkpoint_every=1)
+
+
+def test_reanudacion_conserva_conteos_y_eliminados(tmp_path, jsonl):
+    rag = FakeRag(tmp_path, fail_on_call=3)
+    # Ya indexados: uno sin cambios y uno que ya no está en el JSONL
+    unchanged = _card(0)
+    rag.vector_store.upsert(
+        ["cli_00000", "cli_99999"], [unchanged["resumen"], "eliminado"], [[1.0, 0.0, 0.0, 0.0]] * 2,
+        [rag._card_metadata(unchanged, rag._card_hash(unchanged)), {"cliente_id": "cli_99999", "content_hash": "x"}]
+    )
+    rag.vector_store.flush()
+
+    with pytest.raises(RuntimeError):
+        _pipeline(rag).run(jsonl)
+    checkpoint = json.loads((tmp_path / "index_checkpoint.json").read_text(encoding="utf-8"))
+    assert checkpoint["offset"] > 0
+
+    report = _pipeline(rag).run(jsonl)
+
+    assert report["resumed_from_offset"] == checkpoint["offset"]
+    assert (report["added"], report["updated"], report["unchanged"], report["deleted"]) == (9, 0, 1, 1)
+    assert report["total"] == 10
+    assert sorted(rag.vector_store.get_hashes()) == [f"cli_{i:05d}" for i in range(10)]
+    assert not (tmp_path / "index_checkpoint.json").exists()
+    assert not (tmp_path / "index_checkpoint.ids").exists()
+
+
+def test_checkpoint_de_otro_archivo_se_ignora(tmp_path, jsonl):
+    rag = FakeRag(tmp_path, fail_on_call=2)
+    with pytest.raises(RuntimeError):
+        _pipeline(rag).run(jsonl)
+
+    with open(jsonl, "a", encoding="utf-8") as f:
+        f.write(json.dumps(_card(10)) + "\n")
+    report = _pipeline(rag).run(jsonl)
+
+    assert report["resumed_from_offset"] == 0
+    assert report["total"] == 11
+    assert report["added"] + report["unchanged"] == 11
@@ -0,0 +1,55 @@
+"""Índice BM25 (publicación por snapshot) y fusión RRF de lexical_index.py"""
+import os
+
+from lexical_index import BM25Index, reciprocal_rank_fusion
+
+
+def _card(cliente_id, resumen, sexo="FEMENINO", edad=40):
+    card = {"cliente_id": cliente_id, "resumen": resumen, "perfil": {"sexo": sexo, "edad": edad}}
+    return card, {"sexo": sexo, "edad": edad}
+
+
+def test_busqueda_y_filtros(tmp_path):
+    index = BM25Index(tmp_path / "lexical_index.npz")
+    index.build([
+        _card("cli_00000", "tarjeta de crédito con saldo alto"),
+        _card("cli_00001", "préstamo hipotecario vigente", sexo="MASCULINO"),
+        _card("cli_00002", "tarjeta sin movimientos", sexo="MASCULINO"),
+    ])
+
+    matches = index.search("tarjeta", top_k=5)
+    assert {m["cliente_id"] for m in matches} == {"cli_00000", "cli_00002"}
+    assert all(m["distance"] is None for m in matches)
+
+    matches = index.search("tarjeta", top_k=5, filters={"sexo": "MASCULINO"})
+    assert [m["cliente_id"] for m in matches] == ["cli_00002"]
+
+
+def test_recarga_publica_version_completa(tmp_path):
+    path = tmp_path / "lexical_index.npz"
+    writer = BM25Index(path)
+    writer.build([_card("cli_00000", "tarjeta de crédito")])
+    reader = BM25Index(path)
+    before = reader._snapshot
+
+    writer.build([_card("cli_00001", "ahorro programado"), _card("cli_00002", "ahorro a plazo")])
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    assert [m["cliente_id"] for m in reader.search("tarjeta", top_k=5)] == []
+    assert {m["cliente_id"] for m in reader.search("ahorro", top_k=5)} == {"cli_00001", "cli_00002"}
+    # El snapshot anterior sigue intacto para quien ya lo tenía tomado
+    assert before.ids == ["cli_00000"]
+    assert reader._snapshot is not before
+
+
+def test_rrf_premia_coincidencias_en_ambos_rankings():
+    vector = [{"cliente_id": "a", "distance": 0.1}, {"cliente_id": "b", "distance": 0.2}]
+    lexical = [{"cliente_id": "b", "bm25_score": 3.0}, {"cliente_id": "c", "bm25_score": 2.0}]
+
+    fused = reciprocal_rank_fusion([vector, lexical], top_k=3)
+
+    assert [m["cliente_id"] for m in fused] == ["b", "a", "c"]
+    # Se conserva el dict vectorial (con distance) del primer ranking
+    assert fused[0]["distance"] == 0.2
+    assert fused[0]["rrf_score"] > fused[1]["rrf_score"]
@@ -0,0 +1,62 @@
+"""Inicialización única de los servicios perezosos de main.py"""
+import threading
+import time
+
+import pytest
+
+import main
+from client_store import ClientStore
+from metrics_service import MetricsService
+
+
+@pytest.fixture
+def fresh_main(monkeypatch):
+    """main sin servicios construidos; las clases se cuentan y se demoran para forzar la carrera"""
+    built = {"metrics": 0, "clients": 0}
+
+    class SlowMetrics(MetricsService):
+        def __init__(self, *args, **kwargs):
+            built["metrics"] += 1
+            time.sleep(0.05)
+            super().__init__(*args, **kwargs)
+
+    class SlowClients(ClientStore):
+        def __init__(self, *args, **kwargs):
+            built["clients"] += 1
+            time.sleep(0.05)
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(main, "MetricsService", SlowMetrics)
+    monkeypatch.setattr(main, "ClientStore", SlowClients)
+    monkeypatch.setattr(main, "metrics_service", None)
+    monkeypatch.setattr(main, "client_store", None)
+    monkeypatch.setattr(main, "query_router", None)
+    monkeypatch.setattr(main, "data_watchers", {})
+    return built
+
+
+def test_getters_concurrentes_construyen_una_instancia(fresh_main):
+    n = 8
+    barrier = threading.Barrier(n)
+    results = {"metrics": [], "clients": []}
+
+    def call(name, getter):
+        barrier.wait()
+        results[name].append(getter())
+
+    threads = [
+        threading.Thread(target=call, args=("metrics", main.get_metrics_service) if i % 2 else ("clients", main.get_client_store))
+        for i in range(n)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=60)
+
+    assert fresh_main == {"metrics": 1, "clients": 1}
+    metrics, clients = main.metrics_service, main.client_store
+    assert all(instance is metrics for instance in results["metrics"])
+    assert all(instance is clients for instance in results["clients"])
+    # El watcher registrado recarga la instancia que sirve las peticiones
+    assert main.data_watchers["metrics"].reload_fn.__self__ is metrics
+    assert main.data_watchers["clients"].reload_fn.__self__ is clients
@@ -0,0 +1,37 @@
+"""Asignación de particiones desde Data.csv (partitions.py)"""
+import pytest
+
+from partitions import card_partition, load_partition_map
+
+
+@pytest.fixture
+def data_csv(tmp_path):
+    path = tmp_path / "Data.csv"
+    path.write_text("COD_PROMOTOR,EDAD\nSEFE,40\nJUMA,35\n", encoding="utf-8")
+    return path
+
+
+def test_mapa_por_numero_de_fila(data_csv):
+    partition_map = load_partition_map(data_csv, "COD_PROMOTOR", expected_ids=["cli_00000", "cli_00001"])
+    assert partition_map == {"cli_00000": "SEFE", "cli_00001": "JUMA"}
+
+
+@pytest.mark.parametrize("expected_ids", [
+    ["cli_00000"],
+    ["cli_00000", "cli_00001", "cli_00002"],
+    ["cli_00000", "syn_000001"],
+])
+def test_filas_que_no_coinciden_fallan(data_csv, expected_ids):
+    with pytest.raises(ValueError, match="no corresponde"):
+        load_partition_map(data_csv, "COD_PROMOTOR", expected_ids=expected_ids)
+
+
+def test_columna_inexistente(data_csv):
+    with pytest.raises(ValueError, match="GERENCIA"):
+        load_partition_map(data_csv, "GERENCIA")
+
+
+def test_campo_de_la_tarjeta_tiene_prioridad():
+    card = {"cliente_id": "cli_00000", "perfil": {"COD_PROMOTOR": "JUMA"}}
+    assert card_partition(card, "COD_PROMOTOR", {"cli_00000": "SEFE"}) == "JUMA"
+    assert card_partition({"cliente_id": "cli_00001"}, "COD_PROMOTOR", {"cli_00001": ""}) is None
@@ -0,0 +1,77 @@
+"""Clasificación de preguntas de /ask: metric, schema o client_search"""
+import pytest
+
+from metrics_service import MetricsService
+from query_router import CLIENT_SEARCH, METRIC, SCHEMA, QueryRouter
+
+
+@pytest.fixture(scope="module")
+def router():
+    return QueryRouter(MetricsService())
+
+
+@pytest.mark.parametrize("question", [
+    "¿Qué clientes tienen activos altos?",
+    "¿qué clientes tienen más saldo en captaciones?",
+    "top 5 clientes por saldo neto",
+    "clientes por saldo neto",
+    "¿Cuáles son los clientes con mayor neto?",
+    "los 10 clientes con más captaciones",
+    "mayores captaciones",
+    "clientes con saldo neto negativo",
+    "mujeres mayores de 50 años con captaciones",
+])
+def test_preguntas_sobre_clientes_van_a_rag(router, question):
+    assert router.route(question)["route"] == CLIENT_SEARCH
+
+
+@pytest.mark.parametrize("question, metric", [
+    ("¿Cuál es el saldo neto?", "neto"),
+    ("total de colocaciones", "colocaciones"),
+    ("¿cuánto suman las captaciones de la cartera?", "captaciones"),
+])
+def test_totales_de_cartera_se_responden_sin_llm(router, question, metric):
+    routed = router.route(question)
+    assert routed["route"] == METRIC
+    assert routed["data"]["tipo"] == metric
+
+
+def test_desglose_por_dimension_es_metrica(router):
+    routed = router.route("captaciones por gerencia")
+    assert routed["route"] == METRIC
+    assert routed["data"]["group_by"] == "GERENCIA"
+
+
+@pytest.mark.parametrize("question", [
+    "¿Cuántos clientes hay?",
+    "¿cuántos clientes activos hay?",
+    "cuantos clientes activos tenemos",
+    "¿Cuántos clientes tiene la cartera?",
+    "cuántos clientes hay en total",
+])
+def test_conteo_de_clientes_es_metrica(router, question):
+    routed = router.route(question)
+    assert routed["route"] == METRIC
+    assert routed["data"]["n_clientes"] == 926
+    assert routed["answer"] == "La cartera tiene 926 clientes."
+
+
+@pytest.mark.parametrize("question", [
+    "¿cuántos clientes activos hay con captaciones?",
+    "¿cuántos clientes con colocaciones hay?",
+    "¿cuántos clientes hay en la cartera activa?",
+])
+def test_conteo_con_producto_no_responde_un_monto(router, question):
+    assert router.route(question)["route"] == CLIENT_SEARCH
+
+
+def test_saldo_de_activos_sigue_siendo_colocaciones(router):
+    routed = router.route("saldo de activos")
+    assert routed["route"] == METRIC
+    assert routed["data"]["tipo"] == "colocaciones"
+
+
+def test_significado_de_columna_es_esquema(router):
+    routed = router.route("¿qué significa TC_SALDO?")
+    assert routed["route"] == SCHEMA
+    assert routed["data"]["columns"][0]["name"] == "TC_SALDO"
@@ -0,0 +1,53 @@
+"""Respuesta de ask_with_gpt con presupuesto de tokens (rag_service.py)"""
+from types import SimpleNamespace
+
+from context_builder import ContextBuilder, count_message_tokens
+from rag_service import RAGService
+
+
+def _match(i):
+    return {
+        "cliente_id": f"cli_{i:05d}",
+        "resumen": f"Cliente {i}: mujer de {30 + i} años, sector privado, ingreso {1000 + i * 50} USD.",
+        "metadata": {},
+        "distance": 0.1 * i,
+    }
+
+
+class FakeRag(RAGService):
+    """RAGService sin OpenAI ni índice: recupera MATCHES y responde 'ok'"""
+
+    def __init__(self, matches, token_budget):
+        self.matches = matches
+        self.prompts = []
+        self.retrieval_mode = "lexical"
+        self.index_version = 0
+        self.context_builder = ContextBuilder(token_budget=token_budget, mmr_lambda=1.0)
+        self.vector_store = SimpleNamespace(get_embeddings=lambda ids: {})
+        self.openai_client = SimpleNamespace(
+            chat=SimpleNamespace(completions=SimpleNamespace(create=self._complete))
+        )
+
+    def _retrieve(self, query, top_k, filters, mode, scope=None):
+        return None, self.matches[:top_k]
+
+    def _complete(self, messages, **kwargs):
+        self.prompts.append(messages[-1]["content"])
+        return SimpleNamespace(usage=None, choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))])
+
+
+def test_presupuesto_limita_el_prompt_no_los_matches():
+    matches = [_match(i) for i in range(5)]
+    fixed = FakeRag(matches, 10_000)._build_messages("perfil", [])
+    # Alcanza para la parte fija y un par de tarjetas, no para las cinco
+    rag = FakeRag(matches, count_message_tokens(fixed) + 60)
+
+    result = rag.ask_with_gpt("perfil", top_k=5)
+
+    assert [m["cliente_id"] for m in result["matches"]] == [m["cliente_id"] for m in matches]
+    assert 0 < result["context_used"] < 5
+    assert result["context"]["dropped_by_budget"] == 5 - result["context_used"]
+    sent = result["context"]["cliente_ids"]
+    assert sent == [m["cliente_id"] for m in matches[:len(sent)]]
+    assert all(cliente_id in rag.prompts[0] for cliente_id in sent)
+    assert matches[-1]["cliente_id"] not in rag.prompts[0]
@@ -0,0 +1,60 @@
+"""Ingesta idempotente del histórico mensual (snapshot_store.py)"""
+import multiprocessing
+import sys
+
+import pytest
+
+from snapshot_store import SnapshotStore
+
+ROLLUPS = {
+    ("captaciones", None, None): (1000.0, 10),
+    ("captaciones", "GERENCIA", "GERENCIA DE SUCURSALES"): (1000.0, 10),
+}
+
+
+def _source(sha256, file="Data.csv"):
+    return {"sha256": sha256, "file": file, "n_clientes": 10}
+
+
+def _ingest(path, barrier, results):
+    barrier.wait()
+    entry = SnapshotStore(path).ingest("2025-10", ROLLUPS, _source("abc"))
+    results.put(entry is not None)
+
+
+def test_mismo_extracto_se_ingiere_una_vez(tmp_path):
+    store = SnapshotStore(tmp_path)
+    assert store.ingest("2025-10", ROLLUPS, _source("abc")) is not None
+    # Mismo contenido (aunque cambie el nombre) → no se duplica
+    assert store.ingest("2025-10", ROLLUPS, _source("abc", file="copia.csv")) is None
+
+    stats = SnapshotStore(tmp_path).get_stats()
+    assert stats["snapshots"] == 1
+    assert stats["series"] == len(ROLLUPS)
+
+
+def test_ingesta_de_otro_proceso_se_detecta(tmp_path):
+    stale = SnapshotStore(tmp_path)
+    SnapshotStore(tmp_path).ingest("2025-10", ROLLUPS, _source("abc"))
+
+    # La vista en memoria estaba vacía: la ingesta relee el manifiesto bajo el lock
+    assert stale.ingest("2025-10", ROLLUPS, _source("abc")) is None
+    assert stale.get_stats()["snapshots"] == 1
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="usa procesos con fork")
+def test_workers_concurrentes_ingieren_una_sola_vez(tmp_path):
+    ctx = multiprocessing.get_context("fork")
+    barrier = ctx.Barrier(4)
+    results = ctx.Queue()
+    workers = [ctx.Process(target=_ingest, args=(tmp_path, barrier, results)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=30)
+
+    assert sorted(results.get(timeout=5) for _ in workers) == [False, False, False, True]
+    store = SnapshotStore(tmp_path)
+    assert store.get_stats()["snapshots"] == 1
+    series = store.get_series("captaciones")
+    assert series["points"][0]["crc"] == 1000.0
@@ -0,0 +1,580 @@
+"""
+Backends de almacenamiento vectorial para RAGService.
+- ChromaVectorStore: colección persistente de ChromaDB (default)
+- NumpyVectorStore: matriz float32 normalizada en .npy abierta con mmap + metadata paralela;
+  top-k con producto punto vectorizado y argpartition, filtros como máscaras booleanas.
+  Varios workers comparten las páginas del archivo vía el page cache del sistema operativo.
+  Opcionalmente (RAG_VECTOR_QUANTIZATION=int8) el barrido usa una copia int8 residente
+  en memoria y solo los mejores candidatos se re-puntúan con los float32 del disco.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from filters import to_where
+
+# Columnas de metadata usadas para filtrar (mismas que guarda ChromaDB)
+METADATA_DTYPE = np.dtype([
+    ("edad", "f4"),
+    ("ingreso", "f8"),
+    ("sector_publico", "f4"),
+    ("sexo", "U10"),
+])
+
+
+# Representación del barrido de candidatos en NumpyVectorStore
+QUANTIZATIONS = ("none", "int8")
+
+# Filas por bloque al cuantizar (acota la memoria temporal en float32)
+QUANTIZE_BLOCK_ROWS = 65536
+
+# Filas convertidas a float32 por bloque durante el barrido: el bloque (~768 KB con
+# D=1536) queda en caché de CPU entre la conversión y el producto punto
+SCAN_BLOCK_ROWS = 128
+
+
+def quantize(matrix: np.ndarray):
+    """
+    Cuantización escalar int8 de una matriz (N, D) de filas normalizadas
+
+    Escala simétrica por fila (max |x| → 127): 4x menos memoria que float32. Se procesa
+    por bloques para que una matriz con mmap no se cargue entera en memoria.
+
+    Returns:
+        (codes int8 (N, D), scales float32 (N,)) con fila ≈ codes * scale
+    """
+    codes = np.empty(matrix.shape, dtype=np.int8)
+    scales = np.ones(len(matrix), dtype=np.float32)
+    for start in range(0, len(matrix), QUANTIZE_BLOCK_ROWS):
+        block = np.asarray(matrix[start:start + QUANTIZE_BLOCK_ROWS], dtype=np.float32)
+        if block.size == 0:
+            continue
+        block_scales = np.abs(block).max(axis=1) / 127.0
+        block_scales[block_scales == 0] = 1.0
+        codes[start:start + len(block)] = np.rint(block / block_scales[:, None])
+        scales[start:start + len(block)] = block_scales
+    return codes, scales
+
+
+def approximate_scores(
+    queries: np.ndarray,
+    codes: np.ndarray,
+    scales: np.ndarray,
+    rows: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Producto punto aproximado (Q, N) contra los códigos int8
+
+    Cada bloque se convierte a float32 en un buffer reutilizado y pasa por BLAS; la
+    matriz completa nunca existe en float32.
+    """
+    n = len(rows) if rows is not None else len(codes)
+    scores = np.empty((n, len(queries)), dtype=np.float32)
+    buffer = np.empty((min(SCAN_BLOCK_ROWS, n), codes.shape[1]), dtype=np.float32)
+    queries_t = np.ascontiguousarray(queries.T)
+    for start in range(0, n, SCAN_BLOCK_ROWS):
+        stop = min(start + SCAN_BLOCK_ROWS, n)
+        block = buffer[:stop - start]
+        np.copyto(block, codes[rows[start:stop]] if rows is not None else codes[start:stop], casting="unsafe")
+        np.dot(block, queries_t, out=scores[start:stop])
+    scores *= (scales[rows] if rows is not None else scales)[:, None]
+    return np.ascontiguousarray(scores.T)
+
+
+def metadata_columns(metadatas: List[Dict[str, Any]]) -> np.ndarray:
+    """Columnas de filtrado (METADATA_DTYPE) a partir de la metadata de cada documento"""
+    columns = np.zeros(len(metadatas), dtype=METADATA_DTYPE)
+    for i, metadata in enumerate(metadatas):
+        columns[i] = (
+            metadata.get("edad", 0),
+            metadata.get("ingreso", 0),
+            metadata.get("sector_publico", 0),
+            metadata.get("sexo", "UNKNOWN")
+        )
+    return columns
+
+
+def metadata_mask(columns: np.ndarray, filters: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+    """Traduce filtros normalizados a una máscara booleana sobre las filas"""
+    if not filters:
+        return None
+    mask = np.ones(len(columns), dtype=bool)
+    if "sexo" in filters:
+        mask &= columns["sexo"] == filters["sexo"]
+    if "edad_min" in filters:
+        mask &= columns["edad"] >= filters["edad_min"]
+    if "edad_max" in filters:
+        mask &= columns["edad"] <= filters["edad_max"]
+    if "sector_publico" in filters:
+        mask &= columns["sector_publico"] == (1.0 if filters["sector_publico"] else 0.0)
+    if "ingreso_min" in filters:
+        mask &= columns["ingreso"] >= filters["ingreso_min"]
+    if "ingreso_max" in filters:
+        mask &= columns["ingreso"] <= filters["ingreso_max"]
+    return mask
+
+
+class ChromaVectorStore:
+    """Colección persistente de ChromaDB"""
+
+    name = "chroma"
+
+    def __init__(self, path: Path, collection_name: str = "clientes_cartera"):
+        import chromadb
+        from chromadb.config import Settings
+
+        self.path = path
+        self.collection_name = collection_name
+        self.client = chromadb.PersistentClient(
+            path=str(path),
+            settings=Settings(anonymized_telemetry=False)
+        )
+        self.collection = self._get_or_create_collection()
+
+    def _get_or_create_collection(self):
+        """Obtiene la colección existente o crea una nueva"""
+        try:
+            # Intentar obtener colección existente
+            collection = self.client.get_collection(name=self.collection_name)
+            print(f"✓ Colección '{self.collection_name}' encontrada")
+            return collection
+        except Exception:
+            # Crear nueva colección
+            print(f"→ Creando colección '{self.collection_name}'...")
+            return self.client.create_collection(
+                name=self.collection_name,
+                metadata={"description": "Resúmenes de clientes bancarios para RAG"}
+            )
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def get_hashes(self) -> Dict[str, str]:
+        """Retorna {cliente_id: content_hash} de lo que ya está indexado"""
+        hashes = {}
+        page_size = 5000
+        offset = 0
+        while True:
+            page = self.collection.get(include=["metadatas"], limit=page_size, offset=offset)
+            for doc_id, metadata in zip(page['ids'], page['metadatas']):
+                hashes[doc_id] = (metadata or {}).get('content_hash', '')
+            if len(page['ids']) < page_size:
+                return hashes
+            offset += page_size
+
+    def get_embeddings(self, ids: List[str]) -> Dict[str, np.ndarray]:
+        """Embeddings guardados de los ids indicados (los que no existan se omiten)"""
+        if not ids:
+            return {}
+        page = self.collection.get(ids=ids, include=["embeddings"])
+        return {
+            doc_id: np.asarray(embedding, dtype=np.float32)
+            for doc_id, embedding in zip(page['ids'], page['embeddings'])
+        }
+
+    def upsert(self, ids: List[str], documents: List[str], embeddings: List[List[float]], metadatas: List[Dict]):
+        self.collection.upsert(
+            ids=ids,
+            documents=documents,
+            embeddings=embeddings,
+            metadatas=metadatas
+        )
+
+    def delete(self, ids: List[str]):
+        self.collection.delete(ids=ids)
+
+    def flush(self):
+        """ChromaDB persiste cada escritura; no hay nada pendiente"""
+
+    def drop(self):
+        """Elimina la colección completa (partición que dejó de existir)"""
+        try:
+            self.client.delete_collection(self.collection_name)
+        except Exception as e:
+            print(f"⚠ No se pudo eliminar la colección '{self.collection_name}': {e}")
+
+    def query(
+        self,
+        query_embeddings: List[List[float]],
+        top_k: int,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Busca los top_k vecinos de cada embedding de consulta
+
+        Returns:
+            Una lista de matches por consulta (cliente_id, resumen, metadata, distance)
+        """
+        results = self.collection.query(
+            query_embeddings=query_embeddings,
+            n_results=top_k,
+            where=to_where(filters)
+        )
+
+        all_matches = []
+        for q in range(len(results['ids'])):
+            matches = []
+            for i in range(len(results['ids'][q])):
+                match = {
+                    "cliente_id": results['ids'][q][i],
+                    "resumen": results['documents'][q][i],
+                    "metadata": results['metadatas'][q][i],
+                    "distance": results['distances'][q][i] if 'distances' in results else None
+                }
+                matches.append(match)
+            all_matches.append(matches)
+
+        return all_matches
+
+
+class NumpyIndexSnapshot:
+    """
+    Versión inmutable del índice NumPy (matrices mmap, columnas de filtrado y registros)
+
+    Se construye completa y se publica con una sola asignación: ningún lector
+    ve columnas de una versión e ids de otra.
+    """
+
+    __slots__ = (
+        "version", "mtime_ns", "embeddings", "columns", "ids", "documents", "metadatas",
+        "codes", "scales", "id_index"
+    )
+
+    def __init__(
+        self,
+        version: Optional[str],
+        mtime_ns: Optional[int],
+        embeddings: np.ndarray,
+        columns: np.ndarray,
+        ids: List[str],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]],
+        codes: Optional[np.ndarray] = None,
+        scales: Optional[np.ndarray] = None
+    ):
+        self.version = version
+        self.mtime_ns = mtime_ns
+        self.embeddings = embeddings
+        self.columns = columns
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+        self.codes = codes
+        self.scales = scales
+        self.id_index = {doc_id: i for i, doc_id in enumerate(ids)}
+
+    def match(self, row: int, score: float) -> Dict[str, Any]:
+        return {
+            "cliente_id": self.ids[row],
+            "resumen": self.documents[row],
+            "metadata": self.metadatas[row],
+            "distance": float(2.0 - 2.0 * score)
+        }
+
+
+class NumpyVectorStore:
+    """
+    Índice vectorial en proceso sobre archivos .npy memory-mapped
+
+    Estructura en disco (cada escritura crea una versión nueva y cambia CURRENT
+    de forma atómica, así los lectores nunca ven archivos a medio escribir):
+
+        rag_numpy/
+        ├── CURRENT               # nombre de la versión activa
+        └── v<timestamp>/
+            ├── embeddings.npy    # float32 (N, D), filas normalizadas
+            ├── codes.int8.npy    # solo con quantization="int8": códigos + escalas por fila
+            ├── scales.npy
+            ├── metadata.npy      # array estructurado paralelo (edad, ingreso, ...)
+            └── records.jsonl     # id, documento y metadata completa por fila
+
+    Con quantization="int8" el barrido recorre la copia compacta (cargada en memoria) y los top_k · rescore_factor candidatos se re-puntúan con los float32 exactos,
+    que quedan en disco (mmap) y solo se leen para esas filas.
+    """
+
+    name = "numpy"
+
+    def __init__(self, path: Path, keep_versions: int = 2, quantization: str = "none", rescore_factor: int = 4):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Cuantización inválida: {quantization}. Debe ser una de {', '.join(QUANTIZATIONS)}")
+        self.path = path
+        self.keep_versions = keep_versions
+        self.quantization = quantization
+        self.rescore_factor = max(1, rescore_factor)
+        self._lock = threading.RLock()
+        self._pending_upserts: Dict[str, tuple] = {}
+        self._pending_deletes: set = set()
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._load()
+
+    # ===== CARGA =====
+
+    def _current_file(self) -> Path:
+        return self.path / "CURRENT"
+
+    def _load(self):
+        """
+        Abre (con mmap) la versión indicada por CURRENT y la publica
+
+        Todo se construye en un NumpyIndexSnapshot nuevo y se activa con una sola
+        asignación: una consulta en curso sigue con el snapshot que tomó al empezar.
+        """
+        current = self._current_file()
+        try:
+            version = current.read_text(encoding="utf-8").strip()
+            mtime_ns = current.stat().st_mtime_ns
+        except FileNotFoundError:
+            version, mtime_ns = None, None
+
+        if not version:
+            snapshot = NumpyIndexSnapshot(
+                None, mtime_ns,
+                np.zeros((0, 0), dtype=np.float32), np.zeros(0, dtype=METADATA_DTYPE), [], [], []
+            )
+        else:
+            version_dir = self.path / version
+            embeddings = np.load(version_dir / "embeddings.npy", mmap_mode="r")
+            codes, scales = self._load_codes(version_dir, embeddings) if self.quantization != "none" else (None, None)
+            ids, documents, metadatas = [], [], []
+            with open(version_dir / "records.jsonl", "r", encoding="utf-8") as f:
+                for line in f:
+                    record = json.loads(line)
+                    ids.append(record["id"])
+                    documents.append(record["document"])
+                    metadatas.append(record["metadata"])
+            snapshot = NumpyIndexSnapshot(
+                version, mtime_ns,
+                embeddings, np.load(version_dir / "metadata.npy", mmap_mode="r"), ids, documents, metadatas,
+                codes, scales
+            )
+
+        self._snapshot = snapshot
+        quantized = f", barrido {self.quantization}" if snapshot.codes is not None else ""
+        print(f"✓ Índice NumPy cargado ({len(snapshot.ids)} vectores, versión {version or 'vacía'}{quantized})")
+
+    @staticmethod
+    def _load_codes(version_dir: Path, embeddings: np.ndarray):
+        """Copia int8 en memoria; si la versión no la trae (índice previo), se calcula"""
+        try:
+            return np.load(version_dir / "codes.int8.npy"), np.load(version_dir / "scales.npy")
+        except FileNotFoundError:
+            return quantize(embeddings)
+
+    def _current(self) -> "NumpyIndexSnapshot":
+        """
+        Snapshot activo; recarga si otro proceso publicó una versión nueva (un stat por consulta)
+
+        Los lectores llaman esto una vez y usan solo el snapshot devuelto.
+        """
+        snapshot = self._snapshot
+        try:
+            mtime_ns = self._current_file().stat().st_mtime_ns
+        except FileNotFoundError:
+            return snapshot
+        if mtime_ns != snapshot.mtime_ns:
+            with self._lock:
+                if mtime_ns != self._snapshot.mtime_ns:
+                    self._load()
+                snapshot = self._snapshot
+        return snapshot
+
+    # ===== LECTURA =====
+
+    def count(self) -> int:
+        return len(self._snapshot.ids)
+
+    def scan_bytes(self) -> int:
+        """Bytes que recorre el barrido de candidatos (copia cuantizada o float32 completos)"""
+        snapshot = self._snapshot
+        if snapshot.codes is not None:
+            return snapshot.codes.nbytes + snapshot.scales.nbytes
+        return snapshot.embeddings.nbytes
+
+    def get_hashes(self) -> Dict[str, str]:
+        snapshot = self._current()
+        return {
+            doc_id: metadata.get("content_hash", "")
+            for doc_id, metadata in zip(snapshot.ids, snapshot.metadatas)
+        }
+
+    def get_embeddings(self, ids: List[str]) -> Dict[str, np.ndarray]:
+        """Filas normalizadas de los ids indicados (los que no existan se omiten)"""
+        snapshot = self._current()
+        id_index = snapshot.id_index
+        return {doc_id: np.asarray(snapshot.embeddings[id_index[doc_id]]) for doc_id in ids if doc_id in id_index}
+
+    def query(
+        self,
+        query_embeddings: List[List[float]],
+        top_k: int,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Top-k por similitud coseno (producto punto sobre filas normalizadas)
+
+        La distancia retornada es L2 al cuadrado (2 - 2·cos), igual que ChromaDB.
+        Con cuantización, la distancia sale siempre del re-puntuado exacto.
+        """
+        snapshot = self._current()
+        if len(snapshot.ids) == 0:
+            return [[] for _ in query_embeddings]
+
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+        # Filtrar primero: el producto punto solo recorre los candidatos
+        mask = metadata_mask(snapshot.columns, filters)
+        candidates = None
+        if mask is not None:
+            candidates = np.flatnonzero(mask)
+            if len(candidates) == 0:
+                return [[] for _ in query_embeddings]
+
+        if snapshot.codes is not None:
+            return self._query_quantized(snapshot, queries, top_k, candidates)
+
+        embeddings = snapshot.embeddings
+        if candidates is None:
+            scores = queries @ embeddings.T
+        else:
+            scores = queries @ embeddings[candidates].T
+
+        k = min(top_k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+        all_matches = []
+        for q in range(len(queries)):
+            order = top[q][np.argsort(-scores[q, top[q]])]
+            rows = candidates[order] if candidates is not None else order
+            all_matches.append([snapshot.match(int(row), scores[q, col]) for row, col in zip(rows, order)])
+
+        return all_matches
+
+    def _query_quantized(
+        self,
+        snapshot: "NumpyIndexSnapshot",
+        queries: np.ndarray,
+        top_k: int,
+        candidates: Optional[np.ndarray]
+    ) -> List[List[Dict[str, Any]]]:
+        """Barrido aproximado sobre la copia compacta + re-puntuado exacto de los mejores"""
+        approx = approximate_scores(queries, snapshot.codes, snapshot.scales, candidates)
+        n_rescore = min(top_k * self.rescore_factor, approx.shape[1])
+        shortlist = np.argpartition(-approx, n_rescore - 1, axis=1)[:, :n_rescore]
+
+        all_matches = []
+        for q in range(len(queries)):
+            # Filas ordenadas: lectura secuencial de las páginas del mmap
+            rows = np.sort(candidates[shortlist[q]] if candidates is not None else shortlist[q])
+            exact = np.asarray(snapshot.embeddings[rows]) @ queries[q]
+            order = np.argsort(-exact)[:top_k]
+            all_matches.append([snapshot.match(int(rows[i]), exact[i]) for i in order])
+
+        return all_matches
+
+    # ===== ESCRITURA =====
+
+    def upsert(self, ids: List[str], documents: List[str], embeddings: List[List[float]], metadatas: List[Dict]):
+        """Acumula cambios en memoria; se publican con flush()"""
+        with self._lock:
+            for doc_id, document, embedding, metadata in zip(ids, documents, embeddings, metadatas):
+                self._pending_deletes.discard(doc_id)
+                self._pending_upserts[doc_id] = (document, embedding, metadata)
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            for doc_id in ids:
+                self._pending_upserts.pop(doc_id, None)
+                self._pending_deletes.add(doc_id)
+
+    def flush(self):
+        """Escribe una versión nueva con los cambios pendientes y la activa"""
+        with self._lock:
+            if not self._pending_upserts and not self._pending_deletes:
+                return
+
+            snapshot = self._current()
+            replaced = self._pending_deletes | set(self._pending_upserts)
+            keep = [i for i, doc_id in enumerate(snapshot.ids) if doc_id not in replaced]
+
+            new_ids = [snapshot.ids[i] for i in keep] + list(self._pending_upserts)
+            new_documents = [snapshot.documents[i] for i in keep]
+            new_metadatas = [snapshot.metadatas[i] for i in keep]
+            new_vectors = []
+            for document, embedding, metadata in self._pending_upserts.values():
+                new_documents.append(document)
+                new_metadatas.append(metadata)
+                new_vectors.append(embedding)
+
+            if new_vectors:
+                added = np.asarray(new_vectors, dtype=np.float32)
+                added /= np.linalg.norm(added, axis=1, keepdims=True)
+            else:
+                added = np.zeros((0, snapshot.embeddings.shape[1]), dtype=np.float32)
+
+            if keep:
+                matrix = np.concatenate([np.asarray(snapshot.embeddings[keep]), added])
+            else:
+                matrix = added
+
+            columns = metadata_columns(new_metadatas)
+
+            version = f"v{time.time_ns()}"
+            version_dir = self.path / version
+            version_dir.mkdir()
+            np.save(version_dir / "embeddings.npy", matrix)
+            if self.quantization == "int8":
+                codes, scales = quantize(matrix)
+                np.save(version_dir / "codes.int8.npy", codes)
+                np.save(version_dir / "scales.npy", scales)
+            np.save(version_dir / "metadata.npy", columns)
+            with open(version_dir / "records.jsonl", "w", encoding="utf-8") as f:
+                for doc_id, document, metadata in zip(new_ids, new_documents, new_metadatas):
+                    f.write(json.dumps({"id": doc_id, "document": document, "metadata": metadata}, ensure_ascii=False) + "\n")
+
+            tmp_current = self.path / "CURRENT.tmp"
+            tmp_current.write_text(version, encoding="utf-8")
+            os.replace(tmp_current, self._current_file())
+
+            self._pending_upserts.clear()
+            self._pending_deletes.clear()
+            self._load()
+            self._cleanup_versions()
+
+    def drop(self):
+        """Elimina el directorio del índice con todas sus versiones (partición que dejó de existir)"""
+        with self._lock:
+            self._pending_upserts.clear()
+            self._pending_deletes.clear()
+            shutil.rmtree(self.path, ignore_errors=True)
+
+    def _cleanup_versions(self):
+        """Borra versiones viejas (las abiertas con mmap siguen válidas en POSIX)"""
+        versions = sorted(p for p in self.path.iterdir() if p.is_dir() and p.name.startswith("v"))
+        for old in versions[:-self.keep_versions]:
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def create_vector_store(
+    backend: str,
+    chroma_dir: Path,
+    numpy_dir: Path,
+    collection_name: str,
+    quantization: str = "none",
+    rescore_factor: int = 4
+):
+    """Construye el backend configurado ('chroma' o 'numpy'); la cuantización aplica solo a numpy"""
+    if backend == "chroma":
+        if quantization != "none":
+            print(f"⚠ RAG_VECTOR_QUANTIZATION={quantization} solo aplica al backend numpy; se ignora")
+        return ChromaVectorStore(chroma_dir, collection_name)
+    if backend == "numpy":
+        return NumpyVectorStore(numpy_dir, quantization=quantization, rescore_factor=rescore_factor)
+    raise ValueError(f"Backend vectorial inválido: {backend}. Debe ser 'chroma' o 'numpy'")
@@ -6,6 +6,35 @@ import { generateClientInsights } from "./ai-insights";
 import { generateAriaResponse } from "./aria-chat";
 
 const RAG_API_URL = process.env.RAG_API_URL || 'http://localhost:8000';
+
+// Filtros de metadata que se reenvían tal cual a /ask y /ask/stream de la API RAG
+const RAG_FILTER_PARAMS = ['edad_min', 'edad_max', 'sexo', 'sector_publico', 'ingreso_min', 'ingreso_max', 'auto_filter', 'mode', 'router', 'scope'];
+
+function ragAskParams(query: string, top_k: number, reqQuery: Record<string, unknown>): string {
+  const params = new URLSearchParams({ q: query, top_k: String(top_k) });
+  for (const key of RAG_FILTER_PARAMS) {
+    const value = reqQuery[key];
+    if (typeof value === 'string' && value !== '') {
+      params.set(key, value);
+    }
+  }
+  return params.toString();
+}
+
+// Revalidación de los /metrics precalculados: se reenvía If-None-Match y se devuelven ETag/Cache-Control
+function conditionalHeaders(reqHeaders: Record<string, string | string[] | undefined>): Record<string, string> {
+  const ifNoneMatch = reqHeaders['if-none-match'];
+  return typeof ifNoneMatch === 'string' ? { 'If-None-Match': ifNoneMatch } : {};
+}
+
+function copyCacheHeaders(upstream: Response, res: { setHeader(name: string, value: string): unknown }) {
+  for (const name of ['etag', 'cache-control']) {
+    const value = upstream.headers.get(name);
+    if (value) {
+      res.setHeader(name, value);
+    }
+  }
+}
 const MAX_LIMIT = 100; // Límite máximo de resultados por página
 const DEFAULT_LIMIT = 50;
 const DEFAULT_PAGE = 1;
@@ -166,15 +195,20 @@ export async function registerRoutes(app: Express): Promise<Server> {
   app.get("/api/metrics", async (req, res) => {
     try {
       const response = await fetch(`${RAG_API_URL}/metrics/summary`, {
+        headers: conditionalHeaders(req.headers),
         signal: AbortSignal.timeout(5000) // 5 segundos timeout
       });
       
+      copyCacheHeaders(response, res);
+      if (response.status === 304) {
+        return res.status(304).end();
+      }
       if (!response.ok) {
         throw new Error(`RAG API error: ${response.status}`);
       }
       
-      const data = await response.json();
-      res.json(data);
+      // Cuerpo tal cual (ya serializado por la API RAG)
+      res.type('application/json').send(await response.text());
     } catch (error) {
       console.warn('⚠️  RAG API no disponible, usando datos de respaldo:', error instanceof Error ? error.message : 'Unknown error');
       // Retornar datos de respaldo para que el frontend siga funcionando
@@ -192,14 +226,19 @@ export async function registerRoutes(app: Express): Promise<Server> {
   app.get("/api/metrics/saldo", async (req, res) => {
     try {
       const tipo = req.query.tipo || 'neto';
-      const response = await fetch(`${RAG_API_URL}/metrics/saldo?tipo=${tipo}`);
+      const response = await fetch(`${RAG_API_URL}/metrics/saldo?tipo=${tipo}`, {
+        headers: conditionalHeaders(req.headers)
+      });
       
+      copyCacheHeaders(response, res);
+      if (response.status === 304) {
+        return res.status(304).end();
+      }
       if (!response.ok) {
         throw new Error(`RAG API error: ${response.status}`);
       }
       
-      const data = await response.json();
-      res.json(data);
+      res.type('application/json').send(await response.text());
     } catch (error) {
       console.error('Error fetching saldo:', error);
       res.status(500).json({ error: 'Error fetching saldo metrics' });
@@ -210,7 +249,8 @@ export async function registerRoutes(app: Express): Promise<Server> {
   
   /**
    * GET /api/rag/ask - Consultas RAG sobre clientes usando búsqueda semántica
-   * Query params: q (query string), top_k (número de resultados)
+   * Query params: q (query string), top_k (número de resultados),
+   * filtros opcionales (edad_min, edad_max, sexo, sector_publico, ingreso_min, ingreso_max, auto_filter)
    */
   app.get("/api/rag/ask", async (req, res) => {
     try {
@@ -228,7 +268,7 @@ export async function registerRoutes(app: Express): Promise<Server> {
       const top_k = Math.min(20, Math.max(1, parseInt(req.query.top_k as string) || 5));
       
       const response = await fetch(
-        `${RAG_API_URL}/ask?q=${encodeURIComponent(query)}&top_k=${top_k}`,
+        `${RAG_API_URL}/ask?${ragAskParams(query, top_k, req.query)}`,
         { signal: AbortSignal.timeout(10000) } // 10 segundos timeout
       );
       
@@ -248,6 +288,65 @@ export async function registerRoutes(app: Express): Promise<Server> {
     }
   });
   
+  /**
+   * GET /api/rag/ask/stream - Variante en streaming (Server-Sent Events) de /api/rag/ask
+   * Reenvía los eventos matches/token/done de la API RAG a medida que llegan
+   */
+  app.get("/api/rag/ask/stream", async (req, res) => {
+    const query = req.query.q as string;
+    
+    if (!query || query.trim() === '') {
+      return res.status(400).json({ 
+        error: 'Query parameter "q" is required',
+        example: '/api/rag/ask/stream?q=clientes+con+alto+ingreso'
+      });
+    }
+    
+    const top_k = Math.min(20, Math.max(1, parseInt(req.query.top_k as string) || 5));
+    
+    // Cancelar la petición upstream si el cliente se desconecta
+    const controller = new AbortController();
+    req.on('close', () => controller.abort());
+    
+    try {
+      const response = await fetch(
+        `${RAG_API_URL}/ask/stream?${ragAskParams(query, top_k, req.query)}`,
+        { signal: controller.signal }
+      );
+      
+      if (!response.ok || !response.body) {
+        throw new Error(`RAG API error: ${response.status}`);
+      }
+      
+      res.writeHead(200, {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'Connection': 'keep-alive',
+        'X-Accel-Buffering': 'no'
+      });
+      
+      const reader = response.body.getReader();
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        res.write(value);
+      }
+      res.end();
+    } catch (error) {
+      if (controller.signal.aborted) return;
+      console.error('Error in RAG stream:', error);
+      if (!res.headersSent) {
+        res.status(500).json({ 
+          error: 'Error processing RAG query',
+          message: error instanceof Error ? error.message : 'Unknown error',
+          hint: 'Verifica que la API RAG esté ejecutándose en http://localhost:8000'
+        });
+      } else {
+        res.end();
+      }
+    }
+  });
+  
   // ===== ARIA CHAT ENDPOINT =====
   
   /**